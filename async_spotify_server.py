@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import aiohttp
+from aiohttp import web
+
+# Reuses authentication, configuration and caches from the threaded server
+import spotify_mcp_server as server
+
+logger = logging.getLogger('async_spotify_server')
+
+ASYNC_SERVER_PORT = int(os.getenv('ASYNC_SERVER_PORT', '8889'))
+
+# Upstream connection pool settings
+ASYNC_POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', '100'))
+ASYNC_KEEPALIVE_TIMEOUT = float(os.getenv('ASYNC_KEEPALIVE_TIMEOUT', '60'))
+ASYNC_UPSTREAM_TIMEOUT = float(os.getenv('ASYNC_UPSTREAM_TIMEOUT', '10'))
+
+# Refresh the access token this many seconds before it expires
+TOKEN_EXPIRY_MARGIN = 60
+
+class SpotifyAPIError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+class AsyncSpotifyClient:
+    """Minimal Spotify Web API client on a pooled, keep-alive aiohttp session."""
+
+    def __init__(self):
+        self.session = None
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(
+            limit=ASYNC_POOL_SIZE,
+            keepalive_timeout=ASYNC_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=ASYNC_UPSTREAM_TIMEOUT)
+        )
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    async def access_token(self):
+        if self._token and time.time() < self._token_expires_at - TOKEN_EXPIRY_MARGIN:
+            return self._token
+        async with self._token_lock:
+            if self._token and time.time() < self._token_expires_at - TOKEN_EXPIRY_MARGIN:
+                return self._token
+            if not server.token_manager and not await asyncio.to_thread(server.ensure_spotify):
+                raise SpotifyAPIError(500, "Spotify client not initialized")
+            # The token manager only blocks when it has to refresh an expired token
+            token_info = await asyncio.to_thread(server.token_manager.get_access_token, as_dict=True)
+            self._token = token_info['access_token']
+            self._token_expires_at = token_info['expires_at']
+            return self._token
+
+    async def request(self, operation, method, path, params=None, payload=None):
+        """Send one call for `operation` through the threaded server's scheduler and
+        circuit breaker, waiting out and retrying 429s the same way call_spotify does."""
+        priority = server.OPERATION_PRIORITIES.get(operation, server.PRIORITY_READ)
+        deadline = time.monotonic() + server.SPOTIFY_DEADLINES[priority]
+        breaker = server.circuit_breakers.get(operation)
+        breaker.allow()
+        attempt = 0
+        while True:
+            try:
+                token = await self.access_token()
+                waited = await server.scheduler.acquire_async(priority, deadline - time.monotonic())
+            except Exception:
+                breaker.release()
+                raise
+            server.spotify_scheduler_wait_seconds.observe(waited, server.PRIORITY_NAMES[priority])
+            started = time.perf_counter()
+            try:
+                result = await self._request(token, method, path, params, payload)
+            except SpotifyAPIError as e:
+                server.record_spotify_call(operation, time.perf_counter() - started, failed=True)
+                if e.status == 429:
+                    retry_after = server.retry_after_seconds(e)
+                    server.scheduler.backoff(retry_after)
+                    if attempt < server.SPOTIFY_MAX_RATE_LIMIT_RETRIES and time.monotonic() + retry_after < deadline:
+                        attempt += 1
+                        continue
+                server.upstream_status.record_error(operation, e)
+                breaker.record(e.status >= 500)
+                raise
+            except Exception as e:
+                server.record_spotify_call(operation, time.perf_counter() - started, failed=True)
+                server.upstream_status.record_error(operation, e)
+                breaker.record(isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)))
+                raise
+            server.record_spotify_call(operation, time.perf_counter() - started)
+            server.upstream_status.record_success()
+            breaker.record(False)
+            return result
+
+    async def _request(self, token, method, path, params, payload):
+        headers = {"Authorization": f"Bearer {token}"}
+        async with self.session.request(method, f"{server.SPOTIFY_API_URL}{path}", params=params,
+                                        json=payload, headers=headers) as response:
+            if response.status == 204:
+                return None
+            if response.status >= 400:
+                try:
+                    body = await response.json(content_type=None)
+                    message = body.get('error', {}).get('message') or str(body)
+                except ValueError:
+                    message = await response.text()
+                raise SpotifyAPIError(response.status, message, response.headers)
+            body = await response.text()
+            return json.loads(body) if body else None
+
+class AsyncPlaybackSnapshot(server.PlaybackSnapshot):
+    """Event-loop flavour of PlaybackSnapshot; concurrent callers await one task."""
+
+    async def get(self, force=False):
+        with self._lock:
+            if not force and self._is_fresh(time.monotonic()):
+                self.served_from_snapshot += 1
+                return self._extrapolate(self._state, self._fetched_at)
+            if self._flight is None:
+                self._flight = asyncio.ensure_future(self._fetch(self._generation))
+            else:
+                self.coalesced += 1
+            flight = self._flight
+        state, fetched_at = await asyncio.shield(flight)
+        return self._extrapolate(state, fetched_at)
+
+    async def _fetch(self, generation):
+        try:
+            state = await self.fetch()
+            fetched_at = time.monotonic()
+            with self._lock:
+                self.upstream_fetches += 1
+                if generation == self._generation:
+                    self._state = state
+                    self._fetched_at = fetched_at
+            return state, fetched_at
+        finally:
+            with self._lock:
+                self._flight = None
+
+client = AsyncSpotifyClient()
+playback_snapshot = AsyncPlaybackSnapshot(
+    lambda: client.request('current_playback', 'GET', '/me/player'),
+    server.PLAYBACK_SNAPSHOT_MAX_AGE
+)
+
+def error_response(message, status):
+    return web.json_response({"error": message}, status=status)
+
+def upstream_error_response(error):
+    payload, status = server.upstream_error(error)
+    return web.json_response(payload, status=status)
+
+async def playback_command(operation, method, path, message, failure, payload=None):
+    try:
+        await client.request(operation, method, path, payload=payload)
+        playback_snapshot.invalidate()
+        return web.json_response({"status": "success", "message": message})
+    except Exception as e:
+        logger.error(f"{failure}: {str(e)}")
+        return upstream_error_response(e)
+
+async def play_track(request):
+    logger.info("Play track endpoint called")
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        return error_response("Request body must be a JSON object", 400)
+    track_uri = data.get('track_uri')
+    if not track_uri:
+        logger.info("Resuming playback")
+        return await playback_command('start_playback', 'PUT', '/me/player/play', "Playback resumed",
+                                      "Error resuming playback")
+    logger.info(f"Playing track: {track_uri}")
+    return await playback_command('start_playback', 'PUT', '/me/player/play', "Track started playing",
+                                  "Error playing track", payload={"uris": [track_uri]})
+
+async def pause_track(request):
+    logger.info("Pause track endpoint called")
+    return await playback_command('pause_playback', 'PUT', '/me/player/pause', "Playback paused",
+                                  "Error pausing track")
+
+async def next_track(request):
+    logger.info("Next track endpoint called")
+    return await playback_command('next_track', 'POST', '/me/player/next', "Skipped to next track",
+                                  "Error skipping to next track")
+
+async def previous_track(request):
+    logger.info("Previous track endpoint called")
+    return await playback_command('previous_track', 'POST', '/me/player/previous', "Skipped to previous track",
+                                  "Error skipping to previous track")
+
+async def get_current_track(request):
+    logger.info("Current track endpoint called")
+    try:
+        current_playback = await playback_snapshot.get()
+        if current_playback and current_playback['item']:
+            track = current_playback['item']
+            return web.json_response({
+                "name": track['name'],
+                "artist": track['artists'][0]['name'],
+                "uri": track['uri'],
+                "progress_ms": current_playback['progress_ms'],
+                "duration_ms": track['duration_ms']
+            })
+        logger.warning("No track currently playing")
+        return error_response("No track currently playing", 404)
+    except Exception as e:
+        logger.error(f"Error getting current track: {str(e)}")
+        return upstream_error_response(e)
+
+async def search_tracks(request):
+    logger.info("Search tracks endpoint called")
+    query = request.query.get('q')
+    if not query:
+        logger.warning("No search query provided")
+        return error_response("No search query provided", 400)
+    # Streaming and the local track index are only served by the threaded server
+    if server.wants_ndjson(request.headers, request.query):
+        return error_response("NDJSON search streams are not supported by the asyncio server", 400)
+    if request.query.get('source', 'upstream') != 'upstream':
+        return error_response("The asyncio server only searches Spotify (source=upstream)", 400)
+    try:
+        types = server.parse_search_types(request.query.get('type'))
+        limit = server.parse_search_int(request.query.get('limit'), server.SEARCH_DEFAULT_LIMIT, 'limit',
+                                        1, server.SEARCH_MAX_LIMIT)
+        offset = server.parse_search_int(request.query.get('offset'), 0, 'offset', 0, server.SEARCH_MAX_OFFSET)
+        fields = server.parse_search_fields(request.query.get('fields'))
+    except server.InvalidSearch as e:
+        return error_response(str(e), 400)
+    try:
+        cache_key = server.search_cache_key(query, types, limit, offset)
+        page = None
+        if not server.cache_bypass_requested(request.headers, request.query):
+            page = server.search_cache.get(cache_key)
+
+        if page is None:
+            logger.info(f"Searching for: {query}")
+            results = await client.request('search', 'GET', '/search', params={
+                "q": query, "type": ','.join(types), "limit": limit, "offset": offset})
+            page = server.slim_search_results(results, types)
+            server.search_cache.set(cache_key, page)
+        payload = server.shape_search_page(page, fields)
+        payload["next_offset"] = server.next_search_offset(page, limit, offset)
+        return web.json_response(payload)
+    except Exception as e:
+        logger.error(f"Error searching tracks: {str(e)}")
+        return upstream_error_response(e)
+
+async def health_check(request):
+    logger.info("Health check endpoint called")
+    report = server.liveness_report()
+    report["playback_snapshot"] = playback_snapshot.stats()
+    return web.json_response(report)
+
+async def on_startup(app):
+    server.start()
+    await client.start()
+
+async def on_cleanup(app):
+    await client.close()
+
+def create_async_app():
+    app = web.Application()
+    app.add_routes([
+        web.post('/play', play_track),
+        web.post('/pause', pause_track),
+        web.post('/next', next_track),
+        web.post('/previous', previous_track),
+        web.get('/current_track', get_current_track),
+        web.get('/search', search_tracks),
+        web.get('/health', health_check)
+    ])
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+if __name__ == '__main__':
+    logger.info(f"Starting async Spotify MCP Server on port {ASYNC_SERVER_PORT}")
+    web.run_app(create_async_app(), host='0.0.0.0', port=ASYNC_SERVER_PORT, print=None, access_log=None)
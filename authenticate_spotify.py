@@ -31,7 +31,8 @@ auth_manager = SpotifyOAuth(
     client_id=SPOTIFY_CLIENT_ID,
     client_secret=SPOTIFY_CLIENT_SECRET,
     redirect_uri=REDIRECT_URI,
-    scope='user-read-playback-state user-modify-playback-state user-read-currently-playing',
+    scope=('user-read-playback-state user-modify-playback-state user-read-currently-playing '
+           'playlist-read-private playlist-read-collaborative user-library-read'),
     open_browser=False,
     cache_path='.spotify_cache'
 )
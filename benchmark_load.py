@@ -0,0 +1,236 @@
+"""Load and latency benchmark for every route of spotify_mcp_server.py.
+
+By default this starts mock_spotify_api.py and the server in a scratch
+directory (with a fake cached token), so it runs fully offline:
+
+    python benchmark_load.py --requests 500 --concurrency 32
+
+Save a baseline and compare later runs against it to catch regressions:
+
+    python benchmark_load.py --save-baseline baseline.json
+    python benchmark_load.py --baseline baseline.json --max-regression 0.25
+
+Use --base-url to benchmark an already running server instead.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+from benchmark_server_modes import percentile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Covers every scope the server may ask for, so the cached token is accepted
+MOCK_TOKEN_SCOPE = ('user-read-playback-state user-modify-playback-state user-read-currently-playing '
+                    'playlist-read-private playlist-read-collaborative user-library-read')
+
+# (name, method, path, json body)
+ROUTES = [
+    ("health", "GET", "/health", None),
+    ("ready", "GET", "/ready", None),
+    ("metrics", "GET", "/metrics", None),
+    ("current_track", "GET", "/current_track", None),
+    ("search_cached", "GET", "/search?q=benchmark", None),
+    ("search_upstream", "GET", "/search?q=benchmark&no_cache=1&source=upstream", None),
+    ("search_stream", "GET", "/search?q=benchmark+stream&format=ndjson&max_results=200", None),
+    ("metadata", "POST", "/metadata", {"ids": [f"spotify:track:benchmark{index:013d}" for index in range(100)]}),
+    ("export_saved_tracks", "GET", "/export/saved_tracks", None),
+    ("export_playlists", "GET", "/export/playlists", None),
+    ("play", "POST", "/play", {"track_uri": "spotify:track:benchmark"}),
+    ("play_on_device", "POST", "/play", {"track_uri": "spotify:track:benchmark", "device": "Mock Laptop"}),
+    ("devices", "GET", "/devices", None),
+    ("pause", "POST", "/pause", None),
+    ("next", "POST", "/next", None),
+    ("previous", "POST", "/previous", None),
+    ("batch", "POST", "/batch", {"operations": [
+        {"op": "search", "args": {"query": "benchmark batch"}},
+        {"op": "play", "args": {"track_uri": "$0.tracks.0.uri"}},
+        {"op": "current_track"}
+    ]}),
+    ("auth", "GET", "/auth", None)
+]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    return False
+
+class OfflineEnvironment:
+    """Mock Spotify API plus a server wired to it, in a scratch directory."""
+
+    def __init__(self, mock_args, server_env):
+        self.mock_args = mock_args
+        self.server_env = server_env
+        self.workdir = None
+        self.processes = []
+
+    def __enter__(self):
+        self.workdir = tempfile.mkdtemp(prefix='spotify-bench-')
+        with open(os.path.join(self.workdir, '.spotify_cache'), 'w') as f:
+            json.dump({
+                "access_token": "mock-access-token",
+                "token_type": "Bearer",
+                "expires_in": 3600,
+                "expires_at": int(time.time()) + 3600,
+                "refresh_token": "mock-refresh-token",
+                "scope": MOCK_TOKEN_SCOPE
+            }, f)
+
+        mock_port = free_port()
+        server_port = free_port()
+        log = open(os.path.join(self.workdir, 'benchmark_processes.log'), 'w')
+        self.processes.append(subprocess.Popen(
+            [sys.executable, os.path.join(SCRIPT_DIR, 'mock_spotify_api.py'), '--port', str(mock_port)] + self.mock_args,
+            cwd=self.workdir, stdout=log, stderr=log
+        ))
+        if not wait_for(f"http://127.0.0.1:{mock_port}/v1/me/player/devices"):
+            raise RuntimeError("Mock Spotify API did not start")
+
+        env = dict(os.environ,
+                   SPOTIFY_CLIENT_ID='mock-client-id',
+                   SPOTIFY_CLIENT_SECRET='mock-client-secret',
+                   SPOTIFY_API_URL=f"http://127.0.0.1:{mock_port}/v1",
+                   SPOTIFY_ACCOUNTS_URL=f"http://127.0.0.1:{mock_port}",
+                   SERVER_PORT=str(server_port),
+                   SPOTIFY_RATE_LIMIT='0')
+        env.update(self.server_env)
+        self.processes.append(subprocess.Popen(
+            [sys.executable, os.path.join(SCRIPT_DIR, 'spotify_mcp_server.py')],
+            cwd=self.workdir, env=env, stdout=log, stderr=log
+        ))
+        self.base_url = f"http://127.0.0.1:{server_port}"
+        if not wait_for(self.base_url + '/health'):
+            raise RuntimeError("Server did not start; see " + log.name)
+        return self
+
+    def __exit__(self, *exc):
+        for process in reversed(self.processes):
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+def benchmark_route(base_url, method, path, body, total_requests, concurrency):
+    local = threading.local()
+    url = base_url + path
+
+    def one_request(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, json=body, timeout=30)
+            ok = response.status_code < 500
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(one_request, range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in samples)
+    return {
+        "requests": total_requests,
+        "errors": sum(1 for _, ok in samples if not ok),
+        "throughput_rps": round(total_requests / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2)
+    }
+
+def find_regressions(results, baseline, max_regression):
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous["p95_ms"] and result["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {result['p95_ms']}ms")
+        if result["throughput_rps"] < previous["throughput_rps"] * (1 - max_regression):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']} -> {result['throughput_rps']} rps")
+    return regressions
+
+def run(base_url, args):
+    routes = [route for route in ROUTES if not args.routes or route[0] in args.routes]
+    results = {}
+    for name, method, path, body in routes:
+        # Warm-up request so caches and connections are in steady state
+        requests.request(method, base_url + path, json=body, timeout=30)
+        results[name] = benchmark_route(base_url, method, path, body, args.requests, args.concurrency)
+        if not args.json:
+            result = results[name]
+            print(f"{name:<22}{result['throughput_rps']:>10}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+                  f"{result['p99_ms']:>10}{result['errors']:>8}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every server route against the mock Spotify API")
+    parser.add_argument('--base-url', help="Benchmark a running server instead of starting one")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per route")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--routes', nargs='*', help="Only benchmark these routes")
+    parser.add_argument('--mock-latency-ms', default='20')
+    parser.add_argument('--mock-error-rate', default='0')
+    parser.add_argument('--mock-rate-limit-rate', default='0')
+    parser.add_argument('--mock-slow-rate', default='0', help="Fraction of mock API calls that are slow")
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help="Extra environment for the spawned server")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    parser.add_argument('--save-baseline', help="Write results to this file")
+    parser.add_argument('--baseline', help="Compare against a saved baseline")
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help="Allowed fractional p95/throughput regression against the baseline")
+    args = parser.parse_args()
+
+    if not args.json:
+        print(f"{'route':<22}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+
+    if args.base_url:
+        results = run(args.base_url.rstrip('/'), args)
+    else:
+        mock_args = ['--latency-ms', args.mock_latency_ms, '--error-rate', args.mock_error_rate,
+                     '--rate-limit-rate', args.mock_rate_limit_rate, '--slow-rate', args.mock_slow_rate]
+        server_env = dict(item.split('=', 1) for item in args.server_env)
+        with OfflineEnvironment(mock_args, server_env) as environment:
+            results = run(environment.base_url, args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Compare the threaded Flask server with the asyncio server under concurrent load.
+
+Start both servers against the same Spotify account first:
+
+    python spotify_mcp_server.py        # threaded mode, port 8888
+    python async_spotify_server.py      # asyncio mode, port 8889
+
+then run, for example:
+
+    python benchmark_server_modes.py --route "/search?q=queen&no_cache=1" --requests 2000 --concurrency 200
+"""
+import sys
+import time
+import json
+import asyncio
+import argparse
+import aiohttp
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def run_load(base_url, route, total_requests, concurrency, method='GET'):
+    latencies = []
+    errors = 0
+    counter = iter(range(total_requests))
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def worker():
+            nonlocal errors
+            for _ in counter:
+                started = time.perf_counter()
+                try:
+                    async with session.request(method, base_url + route) as response:
+                        await response.read()
+                        if response.status >= 500:
+                            errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total_requests / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark threaded vs asyncio server modes")
+    parser.add_argument('--threaded-url', default='http://localhost:8888')
+    parser.add_argument('--async-url', default='http://localhost:8889')
+    parser.add_argument('--route', default='/search?q=bohemian+rhapsody&no_cache=1')
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for mode, base_url in (('threaded', args.threaded_url), ('asyncio', args.async_url)):
+        results[mode] = asyncio.run(run_load(base_url, args.route, args.requests, args.concurrency, args.method))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Route: {args.method} {args.route}  requests={args.requests} concurrency={args.concurrency}")
+    print(f"{'mode':<10}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for mode, result in results.items():
+        print(f"{mode:<10}{result['throughput_rps']:>10}{result['p50_ms']:>10}"
+              f"{result['p95_ms']:>10}{result['p99_ms']:>10}{result['errors']:>8}")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""Cold start benchmark for spotify_mcp_server.py.
+
+Measures, over several fresh interpreters:
+
+- import: time to import the module, and whether importing created any files
+- first_health: time from process start until /health answers
+- first_spotify: time until /current_track is answered from the mock Spotify API
+- no_token_health: time until /health answers when there is no cached token,
+  where the server used to wait up to five minutes for authentication
+
+Everything runs offline against mock_spotify_api.py in scratch directories:
+
+    python benchmark_startup.py --runs 10
+    python benchmark_startup.py --save-baseline startup.json
+    python benchmark_startup.py --baseline startup.json --max-regression 0.5
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import requests
+
+from benchmark_server_modes import percentile
+from benchmark_load import SCRIPT_DIR, MOCK_TOKEN_SCOPE, free_port, wait_for
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import spotify_mcp_server; "
+    "print(time.perf_counter() - started)"
+)
+
+def write_token_cache(directory):
+    with open(os.path.join(directory, '.spotify_cache'), 'w') as f:
+        json.dump({
+            "access_token": "mock-access-token",
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "expires_at": int(time.time()) + 3600,
+            "refresh_token": "mock-refresh-token",
+            "scope": MOCK_TOKEN_SCOPE
+        }, f)
+
+def server_env(mock_port, server_port):
+    return dict(os.environ,
+                PYTHONPATH=SCRIPT_DIR,
+                SPOTIFY_CLIENT_ID='mock-client-id',
+                SPOTIFY_CLIENT_SECRET='mock-client-secret',
+                SPOTIFY_API_URL=f"http://127.0.0.1:{mock_port}/v1",
+                SPOTIFY_ACCOUNTS_URL=f"http://127.0.0.1:{mock_port}",
+                SERVER_PORT=str(server_port),
+                SPOTIFY_RATE_LIMIT='0')
+
+def wait_until(url, started, timeout, expect=None):
+    """Seconds from `started` until `url` answers (with status `expect`, if given); None on timeout."""
+    session = requests.Session()
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        try:
+            status = session.get(url, timeout=1).status_code
+            if expect is None or status == expect:
+                return time.perf_counter() - started
+        except requests.RequestException:
+            pass
+        time.sleep(0.01)
+    return None
+
+def measure_import(mock_port, timeout):
+    """(seconds, files created); seconds is None if the import didn't finish within `timeout`."""
+    workdir = tempfile.mkdtemp(prefix='spotify-startup-')
+    try:
+        try:
+            output = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=workdir,
+                                    env=server_env(mock_port, free_port()), capture_output=True, text=True,
+                                    timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return None, sorted(os.listdir(workdir))
+        if output.returncode != 0:
+            raise RuntimeError(f"Import failed: {output.stderr.strip()}")
+        return float(output.stdout.strip().splitlines()[-1]), sorted(os.listdir(workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def measure_server(mock_port, with_token, timeout):
+    workdir = tempfile.mkdtemp(prefix='spotify-startup-')
+    if with_token:
+        write_token_cache(workdir)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, 'spotify_mcp_server.py')],
+                               cwd=workdir, env=server_env(mock_port, port),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        first_health = wait_until(base_url + '/health', started, timeout)
+        first_spotify = wait_until(base_url + '/current_track', started, timeout, expect=200) if with_token else None
+        return first_health, first_spotify
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def summarize(samples):
+    values = sorted(sample for sample in samples if sample is not None)
+    return {
+        "runs": len(samples),
+        "timeouts": len(samples) - len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "max_ms": round(values[-1] * 1000, 1) if values else 0.0
+    }
+
+def find_regressions(results, baseline, max_regression):
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous["p50_ms"] and result["p50_ms"] > previous["p50_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p50 {previous['p50_ms']}ms -> {result['p50_ms']}ms")
+        if result["timeouts"] > previous["timeouts"]:
+            regressions.append(f"{name}: {result['timeouts']} timeouts")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import time and time to first response")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh processes per measurement")
+    parser.add_argument('--timeout', type=float, default=30, help="Seconds to wait for a first response")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    parser.add_argument('--save-baseline', help="Write results to this file")
+    parser.add_argument('--baseline', help="Compare against a saved baseline")
+    parser.add_argument('--max-regression', type=float, default=0.5,
+                        help="Allowed fractional p50 regression against the baseline")
+    args = parser.parse_args()
+
+    mock_dir = tempfile.mkdtemp(prefix='spotify-startup-mock-')
+    mock_port = free_port()
+    mock = subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, 'mock_spotify_api.py'),
+                             '--port', str(mock_port), '--latency-ms', '0', '--jitter-ms', '0'],
+                            cwd=mock_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for(f"http://127.0.0.1:{mock_port}/v1/me/player/devices"):
+            raise RuntimeError("Mock Spotify API did not start")
+        imports, created = [], set()
+        first_health, first_spotify, no_token_health = [], [], []
+        for _ in range(args.runs):
+            seconds, files = measure_import(mock_port, args.timeout)
+            imports.append(seconds)
+            created.update(files)
+            health, spotify = measure_server(mock_port, True, args.timeout)
+            first_health.append(health)
+            first_spotify.append(spotify)
+            no_token_health.append(measure_server(mock_port, False, args.timeout)[0])
+    finally:
+        mock.terminate()
+        mock.wait(timeout=5)
+        shutil.rmtree(mock_dir, ignore_errors=True)
+
+    results = {
+        "import": dict(summarize(imports), files_created=sorted(created)),
+        "first_health": summarize(first_health),
+        "first_spotify": summarize(first_spotify),
+        "no_token_health": summarize(no_token_health)
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'measurement':<18}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'timeouts':>10}")
+        for name, result in results.items():
+            print(f"{name:<18}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['max_ms']:>10}"
+                  f"{result['timeouts']:>10}")
+        if created:
+            print(f"Importing created: {', '.join(sorted(created))}")
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.max_regression)
+        if created:
+            regressions.append(f"import: created {', '.join(sorted(created))}")
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
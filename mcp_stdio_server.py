@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# server.start() sets up logging and the shared Spotify client.
+# Nothing may be printed to stdout other than protocol messages.
+import spotify_mcp_server as server
+
+logger = logging.getLogger('mcp_stdio_server')
+
+PROTOCOL_VERSION = '2024-11-05'
+SERVER_INFO = {"name": "spotify", "version": "1.0.0"}
+
+# Number of requests that may be processed concurrently
+MCP_STDIO_WORKERS = int(os.getenv('MCP_STDIO_WORKERS', '8'))
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+DEVICE_PROPERTY = {"type": "string", "description": "ID or name of the device to use (default: the active one)"}
+
+TOOLS = {
+    "play": {
+        "description": "Play a Spotify track by its URI, or resume playback if no URI is given",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "track_uri": {"type": "string", "description": "Spotify track URI, e.g. spotify:track:..."},
+                "device": DEVICE_PROPERTY
+            }
+        },
+        "handler": server.OPERATIONS["play"]
+    },
+    "pause": {
+        "description": "Pause Spotify playback",
+        "inputSchema": {"type": "object", "properties": {"device": DEVICE_PROPERTY}},
+        "handler": server.OPERATIONS["pause"]
+    },
+    "next": {
+        "description": "Skip to the next track",
+        "inputSchema": {"type": "object", "properties": {"device": DEVICE_PROPERTY}},
+        "handler": server.OPERATIONS["next"]
+    },
+    "previous": {
+        "description": "Go back to the previous track",
+        "inputSchema": {"type": "object", "properties": {"device": DEVICE_PROPERTY}},
+        "handler": server.OPERATIONS["previous"]
+    },
+    "devices": {
+        "description": "List the Spotify devices playback can be sent to",
+        "inputSchema": {"type": "object", "properties": {}},
+        "handler": server.OPERATIONS["devices"]
+    },
+    "current_track": {
+        "description": "Get the currently playing track",
+        "inputSchema": {"type": "object", "properties": {}},
+        "handler": server.OPERATIONS["current_track"]
+    },
+    "search": {
+        "description": "Search Spotify for tracks, albums, artists or playlists",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "Search terms"},
+                "types": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": list(server.SEARCH_TYPES)},
+                    "description": "What to search for (default: track)"
+                },
+                "limit": {"type": "integer", "minimum": 1, "maximum": server.SEARCH_MAX_LIMIT,
+                          "description": "Results per type (default: 5)"},
+                "offset": {"type": "integer", "minimum": 0, "maximum": server.SEARCH_MAX_OFFSET,
+                           "description": "Index of the first result, for paging"},
+                "fields": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Return only these item fields, as dotted paths like album.name"
+                },
+                "no_cache": {"type": "boolean", "description": "Skip the search cache"},
+                "source": {
+                    "type": "string",
+                    "enum": ["auto", "local", "upstream"],
+                    "description": "Answer from the local track index, Spotify, or the index with Spotify as fallback"
+                }
+            },
+            "required": ["query"]
+        },
+        "handler": server.OPERATIONS["search"]
+    },
+    "metadata": {
+        "description": "Look up details for many Spotify tracks, albums or artists at once",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "ids": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "maxItems": server.METADATA_MAX_IDS,
+                    "description": "Spotify URIs or open.spotify.com links; bare IDs need type"
+                },
+                "type": {"type": "string", "enum": list(server.METADATA_BATCH_SIZES),
+                         "description": "Type of any bare IDs"},
+                "fields": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Return only these item fields, as dotted paths like album.name"
+                },
+                "no_cache": {"type": "boolean", "description": "Skip the metadata cache"}
+            },
+            "required": ["ids"]
+        },
+        "handler": server.OPERATIONS["metadata"]
+    }
+}
+
+class UnknownToolError(Exception):
+    pass
+
+class StdioServer:
+    """JSON-RPC 2.0 over newline-delimited stdin/stdout.
+
+    Requests are dispatched to a thread pool as soon as they are read, so a
+    slow tool call does not hold up the ones behind it. Responses are written
+    as they complete and matched to requests by id.
+    """
+
+    def __init__(self, stdin, stdout, workers=MCP_STDIO_WORKERS):
+        self.stdin = stdin
+        self.stdout = stdout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mcp')
+        self._write_lock = threading.Lock()
+
+    def send(self, message):
+        line = json.dumps(message, separators=(',', ':'))
+        with self._write_lock:
+            self.stdout.write(line + '\n')
+            self.stdout.flush()
+
+    def send_error(self, request_id, code, message):
+        self.send({"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}})
+
+    def handle_initialize(self, params):
+        return {
+            "protocolVersion": params.get('protocolVersion', PROTOCOL_VERSION),
+            "capabilities": {"tools": {}},
+            "serverInfo": SERVER_INFO
+        }
+
+    def handle_tools_list(self, params):
+        return {
+            "tools": [
+                {"name": name, "description": tool['description'], "inputSchema": tool['inputSchema']}
+                for name, tool in TOOLS.items()
+            ]
+        }
+
+    def handle_tools_call(self, params):
+        tool = TOOLS.get(params.get('name'))
+        if tool is None:
+            raise UnknownToolError(params.get('name'))
+        payload, status = tool['handler'](params.get('arguments') or {})
+        return {
+            "content": [{"type": "text", "text": json.dumps(payload)}],
+            "isError": status >= 400
+        }
+
+    def dispatch(self, message):
+        request_id = message.get('id')
+        method = message.get('method')
+        params = message.get('params') or {}
+        handlers = {
+            'initialize': self.handle_initialize,
+            'ping': lambda params: {},
+            'tools/list': self.handle_tools_list,
+            'tools/call': self.handle_tools_call
+        }
+        handler = handlers.get(method)
+        if handler is None:
+            # Notifications (no id) never get a response
+            if request_id is not None:
+                self.send_error(request_id, METHOD_NOT_FOUND, f"Method not found: {method}")
+            return
+        try:
+            result = handler(params)
+        except UnknownToolError as e:
+            logger.warning(f"Unknown tool requested: {e}")
+            if request_id is not None:
+                self.send_error(request_id, INVALID_PARAMS, f"Unknown tool: {e}")
+            return
+        except Exception as e:
+            logger.error(f"Error handling {method}: {str(e)}")
+            if request_id is not None:
+                self.send_error(request_id, INTERNAL_ERROR, str(e))
+            return
+        if request_id is not None:
+            self.send({"jsonrpc": "2.0", "id": request_id, "result": result})
+
+    def serve_forever(self):
+        logger.info("MCP stdio transport started")
+        for line in self.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError as e:
+                self.send_error(None, PARSE_ERROR, f"Parse error: {str(e)}")
+                continue
+            if not isinstance(message, dict):
+                self.send_error(None, INVALID_REQUEST, "Batch and non-object requests are not supported")
+                continue
+            self.executor.submit(self.dispatch, message)
+        # stdin closed: let in-flight requests finish before exiting
+        self.executor.shutdown(wait=True)
+        logger.info("MCP stdio transport stopped")
+
+if __name__ == '__main__':
+    server.start()
+    StdioServer(sys.stdin, sys.stdout).serve_forever()
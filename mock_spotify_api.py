@@ -0,0 +1,364 @@
+"""Local stand-in for the parts of the Spotify Web API the server uses.
+
+Serves search, bulk track/album/artist lookups, playlists, saved tracks,
+player, devices and token refresh with configurable latency, error rate,
+slow-response and 429 injection, so the server can be exercised and
+benchmarked offline. Point the server at it with:
+
+    SPOTIFY_API_URL=http://localhost:9090/v1 SPOTIFY_ACCOUNTS_URL=http://localhost:9090
+
+Any bearer token is accepted.
+"""
+import os
+import sys
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from flask import Flask, request, jsonify
+
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+app = Flask(__name__)
+
+class MockConfig:
+    def __init__(self):
+        self.latency_ms = float(os.getenv('MOCK_LATENCY_MS', '20'))
+        self.jitter_ms = float(os.getenv('MOCK_JITTER_MS', '5'))
+        self.error_rate = float(os.getenv('MOCK_ERROR_RATE', '0'))
+        self.rate_limit_rate = float(os.getenv('MOCK_RATE_LIMIT_RATE', '0'))
+        self.retry_after = int(os.getenv('MOCK_RETRY_AFTER', '1'))
+        self.slow_rate = float(os.getenv('MOCK_SLOW_RATE', '0'))
+        self.slow_ms = float(os.getenv('MOCK_SLOW_MS', '2000'))
+        self.playlists = int(os.getenv('MOCK_PLAYLISTS', '60'))
+        self.saved_tracks = int(os.getenv('MOCK_SAVED_TRACKS', '250'))
+        self.no_active_device = os.getenv('MOCK_NO_ACTIVE_DEVICE', '').lower() in ('1', 'true', 'yes')
+
+config = MockConfig()
+
+DEVICES = [
+    {"id": "mock-device-laptop", "name": "Mock Laptop", "type": "Computer", "is_active": True, "volume_percent": 60},
+    {"id": "mock-device-phone", "name": "Mock Phone", "type": "Smartphone", "is_active": False, "volume_percent": 80}
+]
+
+def make_id(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()[:22]
+
+def make_track(query, index):
+    track_id = make_id('track', query, index)
+    artist_id = make_id('artist', query, index % 3)
+    album_id = make_id('album', query, index % 4)
+    return {
+        "id": track_id,
+        "uri": f"spotify:track:{track_id}",
+        "name": f"{query.title()} {index}",
+        "type": "track",
+        "duration_ms": 180000 + (index * 7919) % 60000,
+        "popularity": 100 - index % 100,
+        "artists": [{"id": artist_id, "uri": f"spotify:artist:{artist_id}", "name": f"Mock Artist {index % 3}"}],
+        "album": {"id": album_id, "uri": f"spotify:album:{album_id}", "name": f"Mock Album {index % 4}"}
+    }
+
+# The mock always plays from this one playlist
+QUEUE_CONTEXT_URI = "spotify:playlist:mockqueue"
+
+class PlayerState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = [make_track('mock queue', i) for i in range(50)]
+        self.position = 0
+        self.is_playing = True
+        self.progress_ms = 0
+        self.updated_at = time.time()
+        # None until a command names a device when started with no active device
+        self.device_id = None if config.no_active_device else DEVICES[0]["id"]
+
+    def _advance(self):
+        now = time.time()
+        if self.is_playing:
+            self.progress_ms += int((now - self.updated_at) * 1000)
+            while self.progress_ms >= self.queue[self.position]["duration_ms"]:
+                self.progress_ms -= self.queue[self.position]["duration_ms"]
+                self.position = (self.position + 1) % len(self.queue)
+        self.updated_at = now
+
+    def snapshot(self):
+        with self.lock:
+            self._advance()
+            device = next(device for device in DEVICES if device["id"] == self.device_id)
+            return {
+                "device": dict(device, is_active=True),
+                "is_playing": self.is_playing,
+                "progress_ms": self.progress_ms,
+                "item": self.queue[self.position],
+                "context": {"type": "playlist", "uri": QUEUE_CONTEXT_URI},
+                "timestamp": int(time.time() * 1000)
+            }
+
+    def play(self, uris=None, device_id=None, offset_uri=None):
+        with self.lock:
+            self._advance()
+            if offset_uri:
+                self.position = next(index for index, track in enumerate(self.queue) if track["uri"] == offset_uri)
+                self.progress_ms = 0
+            elif uris:
+                track_id = uris[0].split(':')[-1]
+                track = make_track('mock play', 0)
+                track.update({"id": track_id, "uri": uris[0], "name": f"Track {track_id[:8]}"})
+                self.queue[self.position] = track
+                self.progress_ms = 0
+            if device_id:
+                self.device_id = device_id
+            self.is_playing = True
+
+    def pause(self):
+        with self.lock:
+            self._advance()
+            self.is_playing = False
+
+    def upcoming(self, count=20):
+        with self.lock:
+            self._advance()
+            return [self.queue[(self.position + step) % len(self.queue)] for step in range(1, count + 1)]
+
+    def skip(self, step):
+        with self.lock:
+            self._advance()
+            self.position = (self.position + step) % len(self.queue)
+            self.progress_ms = 0
+
+player = PlayerState()
+
+def spotify_error(status, message, reason=None):
+    error = {"status": status, "message": message}
+    if reason:
+        error["reason"] = reason
+    return jsonify({"error": error}), status
+
+def player_command_error():
+    device_id = request.args.get('device_id')
+    if device_id and not any(device["id"] == device_id for device in DEVICES):
+        return spotify_error(404, "Device not found")
+    if not device_id and player.device_id is None:
+        return spotify_error(404, "Player command failed: No active device found", "NO_ACTIVE_DEVICE")
+    return None
+
+@app.before_request
+def simulate_conditions():
+    delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+    if config.slow_rate and request.path != '/api/token' and random.random() < config.slow_rate:
+        delay += config.slow_ms
+    if delay > 0:
+        time.sleep(delay / 1000.0)
+    if request.path == '/api/token':
+        return None
+    if config.rate_limit_rate and random.random() < config.rate_limit_rate:
+        response, status = spotify_error(429, "API rate limit exceeded")
+        response.headers['Retry-After'] = str(config.retry_after)
+        return response, status
+    if config.error_rate and random.random() < config.error_rate:
+        return spotify_error(503, "Service unavailable (injected)")
+    if not request.headers.get('Authorization', '').startswith('Bearer '):
+        return spotify_error(401, "No token provided")
+    return None
+
+@app.route('/api/token', methods=['POST'])
+def token():
+    if request.form.get('grant_type') not in ('refresh_token', 'authorization_code', 'client_credentials'):
+        return jsonify({"error": "unsupported_grant_type"}), 400
+    return jsonify({
+        "access_token": f"mock-access-{int(time.time())}",
+        "token_type": "Bearer",
+        "expires_in": 3600,
+        "scope": request.form.get('scope', '')
+    })
+
+@app.route('/v1/search', methods=['GET'])
+def search():
+    query = request.args.get('q', '')
+    limit = min(int(request.args.get('limit', 10)), 50)
+    offset = int(request.args.get('offset', 0))
+    if not query:
+        return spotify_error(400, "No search query")
+    results = {}
+    for search_type in request.args.get('type', 'track').split(','):
+        items = [make_track(query, offset + i) for i in range(limit)]
+        results[search_type + 's'] = {
+            "href": request.url, "items": items, "limit": limit, "offset": offset, "total": 1000,
+            "next": None, "previous": None
+        }
+    return jsonify(results)
+
+# Most IDs Spotify accepts per bulk lookup
+BULK_LIMITS = {'tracks': 50, 'albums': 20, 'artists': 50}
+
+def lookup_item(kind, item_id):
+    if kind == 'tracks':
+        track = make_track('mock lookup', int(item_id, 36) % 1000)
+        track.update({"id": item_id, "uri": f"spotify:track:{item_id}", "name": f"Track {item_id[:8]}"})
+        return track
+    item_type = kind[:-1]
+    return {"id": item_id, "uri": f"spotify:{item_type}:{item_id}", "type": item_type,
+            "name": f"Mock {item_type.title()} {item_id[:8]}"}
+
+@app.route('/v1/<any(tracks, albums, artists):kind>/', methods=['GET'], strict_slashes=False)
+def bulk_lookup(kind):
+    ids = [item_id for item_id in request.args.get('ids', '').split(',') if item_id]
+    if not ids or len(ids) > BULK_LIMITS[kind]:
+        return spotify_error(400, "Too many ids requested" if ids else "No ids provided")
+    # IDs starting with "0000" stand in for ones Spotify doesn't know
+    return jsonify({kind: [None if item_id.startswith('0000') else lookup_item(kind, item_id) for item_id in ids]})
+
+def page_args(default_limit, max_limit):
+    limit = int(request.args.get('limit', default_limit))
+    offset = int(request.args.get('offset', 0))
+    if not 1 <= limit <= max_limit:
+        return None, None
+    return limit, offset
+
+def paging(items, limit, offset, total):
+    return {"href": request.url, "items": items, "limit": limit, "offset": offset, "total": total,
+            "next": request.base_url if offset + limit < total else None, "previous": None}
+
+def make_playlist(index):
+    playlist_id = make_id('playlist', index)
+    # Every seventh playlist is empty; the rest vary in size across several pages
+    total = 0 if index % 7 == 0 else (index * 37) % 260 + 1
+    return {"id": playlist_id, "uri": f"spotify:playlist:{playlist_id}", "name": f"Mock Playlist {index}",
+            "owner": {"id": "mock-user", "display_name": "Mock User"}, "snapshot_id": make_id('snapshot', index),
+            "tracks": {"href": f"{request.host_url}v1/playlists/{playlist_id}/tracks", "total": total}}
+
+@app.route('/v1/me/playlists', methods=['GET'])
+def user_playlists():
+    limit, offset = page_args(20, 50)
+    if limit is None:
+        return spotify_error(400, "Invalid limit")
+    items = [make_playlist(index) for index in range(offset, min(offset + limit, config.playlists))]
+    return jsonify(paging(items, limit, offset, config.playlists))
+
+@app.route('/v1/playlists/<playlist_id>/tracks', methods=['GET'])
+def playlist_items(playlist_id):
+    limit, offset = page_args(100, 100)
+    if limit is None:
+        return spotify_error(400, "Invalid limit")
+    playlist = next((make_playlist(index) for index in range(config.playlists)
+                     if make_id('playlist', index) == playlist_id), None)
+    if playlist is None:
+        return spotify_error(404, "Not found")
+    total = playlist["tracks"]["total"]
+    items = [{"added_at": "2024-01-01T00:00:00Z", "track": make_track(playlist["name"], index)}
+             for index in range(offset, min(offset + limit, total))]
+    return jsonify(paging(items, limit, offset, total))
+
+@app.route('/v1/me/tracks', methods=['GET'])
+def saved_tracks():
+    limit, offset = page_args(20, 50)
+    if limit is None:
+        return spotify_error(400, "Invalid limit")
+    items = [{"added_at": "2024-01-01T00:00:00Z", "track": make_track('mock saved', index)}
+             for index in range(offset, min(offset + limit, config.saved_tracks))]
+    return jsonify(paging(items, limit, offset, config.saved_tracks))
+
+@app.route('/v1/me/player', methods=['GET'])
+def current_playback():
+    if player.device_id is None:
+        return '', 204
+    return jsonify(player.snapshot())
+
+@app.route('/v1/me/player/currently-playing', methods=['GET'])
+def currently_playing():
+    if player.device_id is None:
+        return '', 204
+    return jsonify(player.snapshot())
+
+@app.route('/v1/me/player/devices', methods=['GET'])
+def devices():
+    return jsonify({"devices": [dict(device, is_active=device["id"] == player.device_id) for device in DEVICES]})
+
+@app.route('/v1/me/player/play', methods=['PUT'])
+def start_playback():
+    error = player_command_error()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    offset_uri = (data.get('offset') or {}).get('uri')
+    if data.get('context_uri') and data['context_uri'] != QUEUE_CONTEXT_URI:
+        return spotify_error(404, "Context not found")
+    if offset_uri and offset_uri not in [track["uri"] for track in player.queue]:
+        return spotify_error(400, "Offset not in context")
+    player.play(data.get('uris'), request.args.get('device_id'), offset_uri)
+    return '', 204
+
+@app.route('/v1/me/player/queue', methods=['GET'])
+def user_queue():
+    queue = player.upcoming()
+    return jsonify({"currently_playing": player.snapshot()["item"], "queue": queue})
+
+@app.route('/v1/me/player/pause', methods=['PUT'])
+def pause_playback():
+    error = player_command_error()
+    if error:
+        return error
+    player.pause()
+    return '', 204
+
+@app.route('/v1/me/player/next', methods=['POST'])
+def next_track():
+    error = player_command_error()
+    if error:
+        return error
+    player.skip(1)
+    return '', 204
+
+@app.route('/v1/me/player/previous', methods=['POST'])
+def previous_track():
+    error = player_command_error()
+    if error:
+        return error
+    player.skip(-1)
+    return '', 204
+
+@app.route('/v1/me/player', methods=['PUT'])
+def transfer_playback():
+    data = request.get_json(silent=True) or {}
+    device_ids = data.get('device_ids') or []
+    if device_ids:
+        player.play(device_id=device_ids[0])
+    return '', 204
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Spotify Web API")
+    parser.add_argument('--port', type=int, default=int(os.getenv('MOCK_SPOTIFY_PORT', '9090')))
+    parser.add_argument('--latency-ms', type=float, default=config.latency_ms)
+    parser.add_argument('--jitter-ms', type=float, default=config.jitter_ms)
+    parser.add_argument('--error-rate', type=float, default=config.error_rate,
+                        help="Fraction of API calls that fail with 503")
+    parser.add_argument('--rate-limit-rate', type=float, default=config.rate_limit_rate,
+                        help="Fraction of API calls rejected with 429")
+    parser.add_argument('--retry-after', type=int, default=config.retry_after,
+                        help="Retry-After seconds sent with injected 429s")
+    parser.add_argument('--slow-rate', type=float, default=config.slow_rate,
+                        help="Fraction of API calls delayed by an extra --slow-ms")
+    parser.add_argument('--slow-ms', type=float, default=config.slow_ms)
+    parser.add_argument('--no-active-device', action='store_true', default=config.no_active_device,
+                        help="Start with no active device, so player commands need a device_id")
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.jitter_ms = args.jitter_ms
+    config.error_rate = args.error_rate
+    config.rate_limit_rate = args.rate_limit_rate
+    config.retry_after = args.retry_after
+    config.slow_rate = args.slow_rate
+    config.slow_ms = args.slow_ms
+    config.no_active_device = args.no_active_device
+    if args.no_active_device:
+        player.device_id = None
+
+    print(f"Mock Spotify API listening on http://localhost:{args.port}", file=sys.stderr)
+    app.run(host='127.0.0.1', port=args.port, threaded=True)
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,14 @@
 import os
 import sys
 import time
-import subprocess
-import signal
 import json
+import queue
+import random
+import signal
+import socket
+import threading
+import subprocess
+import requests
 
 # Get the directory of this script
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -11,80 +16,238 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 # Change to the script directory
 os.chdir(script_dir)
 
-# Function to check if the server is responding
-def is_server_healthy():
+SERVER_PORT = int(os.getenv('SERVER_PORT', '8888'))
+# Seconds between liveness probes, and failed probes in a row before a restart
+HEALTH_INTERVAL = float(os.getenv('SUPERVISOR_HEALTH_INTERVAL', '10'))
+HEALTH_FAILURES = int(os.getenv('SUPERVISOR_HEALTH_FAILURES', '3'))
+# How long a new process may take to report ready
+READY_TIMEOUT = float(os.getenv('SUPERVISOR_READY_TIMEOUT', '60'))
+# How long a replaced process may keep finishing in-flight requests
+DRAIN_TIMEOUT = float(os.getenv('SUPERVISOR_DRAIN_TIMEOUT', '10'))
+# Crash restarts back off exponentially, reset once a process stays up this long
+BACKOFF_BASE = float(os.getenv('SUPERVISOR_BACKOFF_BASE', '1'))
+BACKOFF_MAX = float(os.getenv('SUPERVISOR_BACKOFF_MAX', '60'))
+STABLE_AFTER = float(os.getenv('SUPERVISOR_STABLE_AFTER', '60'))
+# Handing the listening socket and ready pipe to a child needs pass_fds, which is POSIX-only;
+# elsewhere each process binds the port itself and is ready once /health answers
+SHARE_SOCKET = os.name != 'nt'
+
+# Child exits, readiness reports, failed probes and signals all arrive here
+events = queue.Queue()
+
+def status(state, **fields):
+    print(json.dumps(dict(fields, status=state)), flush=True)
+
+def backoff_delay(failures):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** failures))
+    return random.uniform(delay / 2, delay)
+
+def server_healthy():
     try:
-        import requests
-        response = requests.get('http://localhost:8888/health', timeout=2)
-        return response.status_code == 200
-    except:
+        return requests.get(f'http://127.0.0.1:{SERVER_PORT}/health', timeout=2).status_code == 200
+    except requests.RequestException:
         return False
 
-# Print initial status
-print(json.dumps({"status": "starting"}))
+def start_timer(delay, callback):
+    timer = threading.Timer(delay, callback)
+    timer.daemon = True
+    timer.start()
+
+class Worker:
+    """One server process, sharing the supervisor's listening socket if there is one."""
+
+    def __init__(self, listener):
+        self.ready = False
+        self.retiring = False
+        self.started = time.time()
+
+        env = dict(os.environ, SERVER_PORT=str(SERVER_PORT))
+        pass_fds = ()
+        if listener:
+            ready_read, ready_write = os.pipe()
+            env.update(SPOTIFY_SERVER_FD=str(listener.fileno()), SPOTIFY_READY_FD=str(ready_write))
+            pass_fds = (listener.fileno(), ready_write)
+        with open('server_output.log', 'a') as log_file:
+            log_file.write(f"\n\n--- Server start at {time.strftime('%Y-%m-%d %H:%M:%S')} ---\n\n")
+            self.process = subprocess.Popen(
+                [sys.executable, 'spotify_mcp_server.py'],
+                stdout=log_file,
+                stderr=log_file,
+                env=env,
+                pass_fds=pass_fds
+            )
+        self.pid = self.process.pid
+        if listener:
+            os.close(ready_write)
+            threading.Thread(target=self._watch, args=(ready_read,), daemon=True).start()
+        else:
+            threading.Thread(target=self._poll_health, daemon=True).start()
+        start_timer(READY_TIMEOUT, self._check_ready)
+
+    def _watch(self, ready_read):
+        # The pipe reads "ready" once the server accepts requests, or EOF if it dies first
+        with os.fdopen(ready_read, 'rb') as pipe:
+            if pipe.readline().strip() == b'ready':
+                events.put(('ready', self))
+        events.put(('exit', self, self.process.wait()))
+
+    def _poll_health(self):
+        while self.process.poll() is None:
+            if server_healthy():
+                events.put(('ready', self))
+                break
+            time.sleep(1)
+        events.put(('exit', self, self.process.wait()))
 
-# Keep track of the process
-process = None
+    def _check_ready(self):
+        if not self.ready and self.process.poll() is None:
+            events.put(('ready_timeout', self))
 
-def start_server():
-    global process
-    # Kill any existing process
-    if process:
-        try:
-            process.terminate()
-            process.wait(timeout=5)
-        except:
+    def retire(self):
+        """Stop accepting new connections, then kill after the drain timeout."""
+        self.retiring = True
+        if self.process.poll() is None:
+            self.process.terminate()
+            start_timer(DRAIN_TIMEOUT, self.kill)
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+
+def health_watchdog(supervisor):
+    # Catches a server that is running but hung; exits are reported by Worker._watch
+    failures = 0
+    while True:
+        time.sleep(HEALTH_INTERVAL)
+        worker = supervisor.active
+        if not worker or not worker.ready or supervisor.standby:
+            failures = 0
+            continue
+        failures = 0 if server_healthy() else failures + 1
+        if failures >= HEALTH_FAILURES:
+            failures = 0
+            events.put(('unhealthy', worker))
+
+class Supervisor:
+    def __init__(self):
+        # Owning the socket keeps the port open across restarts, so clients
+        # queue in the backlog instead of being refused
+        self.listener = socket.create_server(('0.0.0.0', SERVER_PORT), backlog=128) if SHARE_SOCKET else None
+        self.active = None
+        self.standby = None
+        self.crashes = 0
+        self.restart_at = None
+
+    def warm_restart(self, reason):
+        """Start a replacement; the current process is stopped once it is ready."""
+        if self.standby:
+            return
+        status("restarting", reason=reason)
+        if not self.listener:
+            # Without a shared socket the port is only free once the old process has exited
+            previous, self.active = self.active, None
+            previous.retiring = True
+            previous.process.terminate()
+            try:
+                previous.process.wait(timeout=DRAIN_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                previous.kill()
+            self.active = Worker(None)
+            return
+        self.standby = Worker(self.listener)
+
+    def handle(self, event, worker=None, returncode=None):
+        if event == 'ready':
+            worker.ready = True
+            if worker is self.standby:
+                previous, self.active, self.standby = self.active, worker, None
+                if previous:
+                    previous.retire()
+            if worker is self.active:
+                status("running", pid=worker.pid)
+        elif event == 'ready_timeout':
+            if worker is self.standby:
+                status("standby_failed", pid=worker.pid, reason="not ready in time")
+                self.standby = None
+                worker.retire()
+            elif worker is self.active:
+                # Usually waiting for the user to authenticate; keep waiting
+                status("failed_to_start", pid=worker.pid)
+        elif event == 'exit':
+            if worker.retiring:
+                return
+            if worker is self.standby:
+                status("standby_failed", pid=worker.pid, exit_code=returncode)
+                self.standby = None
+            elif worker is self.active:
+                self.active = None
+                if self.standby:
+                    # The replacement takes over as soon as it is ready
+                    self.active, self.standby = self.standby, None
+                    status("crashed", pid=worker.pid, exit_code=returncode)
+                    return
+                if time.time() - worker.started >= STABLE_AFTER:
+                    self.crashes = 0
+                delay = backoff_delay(self.crashes)
+                self.crashes += 1
+                self.restart_at = time.time() + delay
+                status("crashed", pid=worker.pid, exit_code=returncode, restart_in=round(delay, 2))
+        elif event == 'unhealthy':
+            if worker is self.active:
+                self.warm_restart("health check failed")
+        elif event == 'reload':
+            if self.active:
+                self.warm_restart("reload requested")
+
+    def run(self):
+        status("starting")
+        self.active = Worker(self.listener)
+        threading.Thread(target=health_watchdog, args=(self,), daemon=True).start()
+        while True:
+            timeout = None if self.restart_at is None else max(0, self.restart_at - time.time())
+            try:
+                event = events.get(timeout=timeout)
+            except queue.Empty:
+                self.restart_at = None
+                self.active = Worker(self.listener)
+                continue
+            if event[0] == 'stop':
+                return
+            self.handle(*event)
+
+    def stop(self):
+        workers = [worker for worker in (self.active, self.standby) if worker]
+        for worker in workers:
+            worker.retiring = True
+            if worker.process.poll() is None:
+                worker.process.terminate()
+        for worker in workers:
             try:
-                process.kill()
-            except:
-                pass
-    
-    # Start a new process
-    with open('server_output.log', 'a') as log_file:
-        log_file.write(f"\n\n--- Server restart at {time.strftime('%Y-%m-%d %H:%M:%S')} ---\n\n")
-        process = subprocess.Popen(
-            [sys.executable, 'spotify_mcp_server.py'],
-            stdout=log_file,
-            stderr=log_file
-        )
-    
-    # Wait for server to start
-    for _ in range(10):
-        if is_server_healthy():
-            return True
-        time.sleep(1)
-    return False
-
-# Handle termination signals
+                worker.process.wait(timeout=DRAIN_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                worker.kill()
+        if self.listener:
+            self.listener.close()
+
+# Handle termination signals; SIGHUP swaps in a fresh process without downtime
 def handle_signal(sig, frame):
-    if process:
-        process.terminate()
-    sys.exit(0)
+    events.put(('stop',))
 
 signal.signal(signal.SIGINT, handle_signal)
 signal.signal(signal.SIGTERM, handle_signal)
+if hasattr(signal, 'SIGHUP'):
+    signal.signal(signal.SIGHUP, lambda sig, frame: events.put(('reload',)))
 
-# Main loop to keep the server running
+supervisor = None
 try:
-    while True:
-        if not process or process.poll() is not None:
-            # Server not running or has crashed, restart it
-            if start_server():
-                print(json.dumps({"status": "running"}))
-            else:
-                print(json.dumps({"status": "failed_to_start"}))
-                time.sleep(30)  # Wait longer before retry if it failed to start
-        elif not is_server_healthy():
-            # Server is running but not responding, restart it
-            print(json.dumps({"status": "restarting"}))
-            start_server()
-        
-        # Sleep for a while before checking again
-        time.sleep(5)
+    supervisor = Supervisor()
+    supervisor.run()
+    supervisor.stop()
+    status("stopped")
 except Exception as e:
     with open('wrapper_error.log', 'a') as error_log:
         error_log.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Error: {str(e)}\n")
-    print(json.dumps({"status": "error", "message": str(e)}))
-    if process:
-        process.terminate()
-    sys.exit(1) 
\ No newline at end of file
+    status("error", message=str(e))
+    if supervisor:
+        supervisor.stop()
+    sys.exit(1)
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking on this platform; locks only exclude threads
+    fcntl = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS cache_expiry ON cache(namespace, expires_at);
+"""
+
+# Expired and surplus entries are pruned once per this many writes
+PRUNE_EVERY = 100
+
+class FileLock:
+    """Exclusive lock held by one thread in one process at a time.
+
+    Uses flock() on `path`, so it coordinates the worker processes of one
+    server as well as the threads within each.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if fcntl:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                except Exception:
+                    os.close(fd)
+                    raise
+            self._fd = fd
+        except Exception:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        fd, self._fd = self._fd, None
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        finally:
+            self._thread_lock.release()
+
+class SQLiteCache:
+    """TTL cache stored in a SQLite file and shared by every process using it.
+
+    Has the same interface as the in-memory TTLCache. Keys and values must
+    be JSON serializable. When a namespace grows past `max_entries` the
+    entries closest to expiry are dropped first. The file is opened on
+    first use.
+    """
+
+    def __init__(self, path, namespace, ttl, max_entries):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connection(self):
+        # Called with self._lock held
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _key(self, key):
+        return json.dumps(key, separators=(',', ':'))
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection().execute('SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?',
+                                     (self.namespace, self._key(key))).fetchone()
+            if row is None or row[1] <= time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if self.max_entries <= 0 or ttl <= 0:
+            return
+        with self._lock, self._connection():
+            self._conn.execute('INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+                               (self.namespace, self._key(key), json.dumps(value), time.time() + ttl))
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._prune()
+
+    def _prune(self):
+        self._conn.execute('DELETE FROM cache WHERE namespace = ? AND expires_at <= ?', (self.namespace, time.time()))
+        surplus = self._conn.execute('SELECT COUNT(*) FROM cache WHERE namespace = ?',
+                                     (self.namespace,)).fetchone()[0] - self.max_entries
+        if surplus > 0:
+            self._conn.execute("""
+                DELETE FROM cache WHERE namespace = ? AND key IN (
+                    SELECT key FROM cache WHERE namespace = ? ORDER BY expires_at LIMIT ?
+                )
+            """, (self.namespace, self.namespace, surplus))
+            self.evictions += surplus
+
+    def delete(self, key):
+        with self._lock, self._connection():
+            self._conn.execute('DELETE FROM cache WHERE namespace = ? AND key = ?', (self.namespace, self._key(key)))
+
+    def clear(self):
+        with self._lock, self._connection():
+            self._conn.execute('DELETE FROM cache WHERE namespace = ?', (self.namespace,))
+
+    def stats(self):
+        with self._lock:
+            entries = self._connection().execute('SELECT COUNT(*) FROM cache WHERE namespace = ? AND expires_at > ?',
+                                         (self.namespace, time.time())).fetchone()[0]
+            return {
+                "backend": "sqlite",
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
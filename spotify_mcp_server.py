@@ -1,37 +1,131 @@
 import os
 import sys
+import re
 import json
 import logging
+import logging.handlers
+import queue
+import uuid
 import time
 from flask import Flask, request, jsonify, Response
 import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+from spotipy.oauth2 import SpotifyOAuth, SpotifyOauthError
+from spotipy.cache_handler import CacheHandler
+from spotipy.exceptions import SpotifyException
 from dotenv import load_dotenv
+from track_index import TrackIndex
+from shared_state import FileLock, SQLiteCache
+import metrics
+import heapq
+import socket
+import signal
+import atexit
+import tempfile
+import asyncio
 import threading
+import contextvars
+import contextlib
+import subprocess
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FuturesTimeoutError, wait as futures_wait
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("spotify_mcp_server.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+# Load environment variables first so they can configure logging. This read of
+# .env is the only I/O done at import: settings below are read from the environment.
+load_dotenv()
+
+# Worker processes serving the app; see run_workers()
+SERVER_WORKERS = max(1, int(os.getenv('SERVER_WORKERS', '1')))
+WORKER_ID = os.getenv('SPOTIFY_WORKER_ID')
+
+# Logging settings
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.getenv('LOG_FILE', 'spotify_mcp_server.log')
+if WORKER_ID:
+    # Several processes rotating one file would lose records, so each worker gets its own
+    LOG_FILE = '{0}.worker{2}{1}'.format(*os.path.splitext(LOG_FILE), WORKER_ID)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_ROTATION = os.getenv('LOG_ROTATION', 'size').lower()
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', 'midnight')
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+
+# ID of the request being handled on this thread, if any
+current_request_id = contextvars.ContextVar('current_request_id', default=None)
+
+class RequestContextFilter(logging.Filter):
+    # Runs on the logging thread's caller, where the request context is visible
+    def filter(self, record):
+        record.request_id = current_request_id.get()
+        if not hasattr(record, 'duration_ms'):
+            record.duration_ms = None
+        return True
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if getattr(record, 'request_id', None):
+            entry["request_id"] = record.request_id
+        if getattr(record, 'duration_ms', None) is not None:
+            entry["duration_ms"] = record.duration_ms
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+def configure_logging():
+    """Send log records through a queue to a background writer thread.
+
+    The calling thread only formats the message and enqueues it; file and
+    console output, including rotation, happen on the listener thread.
+    """
+    if LOG_FORMAT == 'json':
+        formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if LOG_ROTATION == 'time':
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT)
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler)
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+# Set up by start(), so importing this module doesn't open the log file
+log_listener = None
+# Fixed name: also Flask's app.logger, whether run as a script or imported
+logger = logging.getLogger('spotify_mcp_server')
 
 # Disable Flask's built-in logging
 log = logging.getLogger('werkzeug')
 log.setLevel(logging.ERROR)
 
-# Load environment variables
-logger.info("Loading environment variables")
-load_dotenv()
-
 app = Flask(__name__)
 
 # Disable Flask's default output
-app.logger.disabled = True
 cli = sys.modules['flask.cli']
 cli.show_server_banner = lambda *x: None
 
@@ -39,26 +133,1452 @@ cli.show_server_banner = lambda *x: None
 SPOTIFY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
 SPOTIFY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
 REDIRECT_URI = 'http://localhost:8888/callback'
+SERVER_PORT = int(os.getenv('SERVER_PORT', '8888'))
 
-logger.info(f"Client ID available: {bool(SPOTIFY_CLIENT_ID)}")
-logger.info(f"Client Secret available: {bool(SPOTIFY_CLIENT_SECRET)}")
+# Overridable so the server can be pointed at mock_spotify_api.py
+SPOTIFY_API_URL = os.getenv('SPOTIFY_API_URL', 'https://api.spotify.com/v1').rstrip('/')
+SPOTIFY_ACCOUNTS_URL = os.getenv('SPOTIFY_ACCOUNTS_URL', 'https://accounts.spotify.com').rstrip('/')
 
 # Global variable to store the Spotify client
 sp = None
 auth_manager = None
 
+# Prometheus metrics, served by /metrics. A worker labels its series with its ID,
+# since each scrape reaches whichever worker accepts it
+metrics_registry = metrics.Registry({'worker': WORKER_ID} if WORKER_ID else None)
+http_requests_total = metrics_registry.counter(
+    'http_requests_total', 'HTTP requests by route, method and status', ('route', 'method', 'status'))
+http_request_errors_total = metrics_registry.counter(
+    'http_request_errors_total', 'HTTP requests that returned a 5xx status', ('route',))
+http_request_duration_seconds = metrics_registry.histogram(
+    'http_request_duration_seconds', 'Time spent handling HTTP requests', ('route',))
+spotify_call_duration_seconds = metrics_registry.histogram(
+    'spotify_call_duration_seconds', 'Latency of Spotify API calls, excluding scheduler wait', ('operation',))
+spotify_call_errors_total = metrics_registry.counter(
+    'spotify_call_errors_total', 'Failed Spotify API calls', ('operation',))
+spotify_scheduler_wait_seconds = metrics_registry.histogram(
+    'spotify_scheduler_wait_seconds', 'Time Spotify calls waited for rate limit budget', ('priority',))
+
+class RequestTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.upstream_calls = []
+        self.scheduler_wait = 0.0
+
+    def record_call(self, operation, seconds):
+        self.upstream_calls.append((operation, seconds))
+
+# Timing of the request being handled on this thread, if any
+current_request_timing = contextvars.ContextVar('current_request_timing', default=None)
+
+def record_spotify_call(operation, seconds, failed=False):
+    spotify_call_duration_seconds.observe(seconds, operation)
+    if failed:
+        spotify_call_errors_total.inc(operation)
+    timing = current_request_timing.get()
+    if timing is not None:
+        timing.record_call(operation, seconds)
+
+# Upstream connection pool settings
+SPOTIFY_POOL_SIZE = int(os.getenv('SPOTIFY_POOL_SIZE', '20'))
+SPOTIFY_CONNECT_TIMEOUT = float(os.getenv('SPOTIFY_CONNECT_TIMEOUT', '3'))
+SPOTIFY_READ_TIMEOUT = float(os.getenv('SPOTIFY_READ_TIMEOUT', '5'))
+SPOTIFY_KEEPALIVE_IDLE = int(os.getenv('SPOTIFY_KEEPALIVE_IDLE', '30'))
+
+class ConnectionCounters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.retries = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pool_size": SPOTIFY_POOL_SIZE,
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": max(self.requests - self.new_connections, 0),
+                "retries": self.retries
+            }
+
+connection_counters = ConnectionCounters()
+
+class _CountingHTTPConnection(urllib3.connection.HTTPConnection):
+    def connect(self):
+        connection_counters.record_connect()
+        super().connect()
+
+class _CountingHTTPSConnection(urllib3.connection.HTTPSConnection):
+    def connect(self):
+        connection_counters.record_connect()
+        super().connect()
+
+class _CountingHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+class _CountingHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled sockets use TCP keep-alive probes and count
+    how often a request needed a fresh connection."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        socket_options = list(urllib3.connection.HTTPConnection.default_socket_options)
+        socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, SPOTIFY_KEEPALIVE_IDLE))
+        kwargs['socket_options'] = socket_options
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool
+        }
+
+    def send(self, request, **kwargs):
+        connection_counters.record_request()
+        return super().send(request, **kwargs)
+
+class CountingRetry(urllib3.Retry):
+    def increment(self, *args, **kwargs):
+        retry = super().increment(*args, **kwargs)
+        connection_counters.record_retry()
+        return retry
+
+def build_spotify_session():
+    # Same retry policy spotipy uses for the sessions it builds itself, except
+    # that 429s are left to the upstream scheduler so Retry-After is shared.
+    # Once retries run out the last 5xx is returned, so it is reported as
+    # itself rather than as spotipy's generic "Max Retries" 429.
+    retry = CountingRetry(
+        total=3,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        status=3,
+        backoff_factor=0.3,
+        status_forcelist=(500, 502, 503, 504),
+        raise_on_status=False
+    )
+    adapter = KeepAliveAdapter(pool_connections=4, pool_maxsize=SPOTIFY_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# One session for the lifetime of the process: API calls and token
+# refreshes share its warm connections
+spotify_session = build_spotify_session()
+
+def build_spotify_client(manager):
+    client = spotipy.Spotify(
+        auth_manager=manager,
+        requests_session=spotify_session,
+        requests_timeout=(SPOTIFY_CONNECT_TIMEOUT, SPOTIFY_READ_TIMEOUT)
+    )
+    client.prefix = SPOTIFY_API_URL + '/'
+    return client
+
+def bind_spotify_client(manager):
+    """Point the long-lived client at new credentials without rebuilding it."""
+    global sp
+    if sp is None:
+        sp = build_spotify_client(manager)
+    else:
+        sp.auth_manager = manager
+    return sp
+
+# Token settings
+TOKEN_CACHE_PATH = '.spotify_cache'
+TOKEN_REFRESH_LEAD_TIME = float(os.getenv('TOKEN_REFRESH_LEAD_TIME', '300'))
+
+class TokenCacheWriter:
+    """One background thread that writes changed token caches to disk."""
+
+    def __init__(self):
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def schedule(self, cache_handler):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write_loop, daemon=True)
+                self._thread.start()
+        self._pending.put(cache_handler)
+
+    def _write_loop(self):
+        while True:
+            cache_handler = self._pending.get()
+            try:
+                cache_handler.flush()
+            except Exception as e:
+                logger.error(f"Error writing token cache {cache_handler.cache_path}: {str(e)}")
+
+token_cache_writer = TokenCacheWriter()
+
+class WriteBehindCacheHandler(CacheHandler):
+    """Token cache held in memory; changes are written to disk atomically
+    from a background thread so nothing re-reads the file per check."""
+
+    def __init__(self, cache_path, load=True):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._token_info = None
+        self._dirty = threading.Event()
+        self._write_lock = threading.Lock()
+        if load:
+            self.reload()
+
+    def reload(self):
+        """Pick up a token written by another process, keeping whichever
+        of the file and memory copies expires later."""
+        try:
+            with open(self.cache_path) as f:
+                token_info = json.load(f)
+        except (IOError, ValueError):
+            token_info = None
+        with self._lock:
+            current = self._token_info
+            if token_info and (not current or token_info.get('expires_at', 0) >= current.get('expires_at', 0)):
+                self._token_info = token_info
+            return dict(self._token_info) if self._token_info else None
+
+    def get_cached_token(self):
+        with self._lock:
+            return dict(self._token_info) if self._token_info else None
+
+    def save_token_to_cache(self, token_info):
+        with self._lock:
+            self._token_info = dict(token_info)
+        self._dirty.set()
+        token_cache_writer.schedule(self)
+
+    def _write(self):
+        token_info = self.get_cached_token()
+        if token_info is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.spotify_cache.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(token_info, f)
+            os.replace(tmp_path, self.cache_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def flush(self):
+        # Waits for a write already in progress, so the file is current on return
+        with self._write_lock:
+            if self._dirty.is_set():
+                self._dirty.clear()
+                self._write()
+
+class TokenManager:
+    """Hands out access tokens from memory and refreshes them ahead of expiry.
+
+    Used as the client's auth manager. While the token is still valid callers
+    never wait: a token inside the lead window only wakes the refresh thread.
+    Only an already expired token makes a caller refresh inline, and the lock
+    ensures a single refresh runs at a time. With a `file_lock`, that holds
+    across processes too: the cache file is only re-read under the lock,
+    where a token another process just refreshed is picked up instead.
+    """
+
+    def __init__(self, oauth, lead_time, wakeup=None, file_lock=None):
+        self.oauth = oauth
+        self.lead_time = lead_time
+        self._refresh_lock = threading.Lock()
+        self._file_lock = file_lock or contextlib.nullcontext()
+        # Set when a refresh is due; pooled accounts share their refresher's event
+        self._wakeup = wakeup or threading.Event()
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def token_info(self):
+        return self.oauth.cache_handler.get_cached_token()
+
+    def seconds_until_refresh(self):
+        token_info = self.token_info()
+        if not token_info:
+            return None
+        return token_info['expires_at'] - self.lead_time - time.time()
+
+    def refresh(self):
+        with self._refresh_lock, self._file_lock:
+            cache_handler = self.oauth.cache_handler
+            if isinstance(cache_handler, WriteBehindCacheHandler):
+                cache_handler.reload()
+            token_info = self.token_info()
+            if not token_info or 'refresh_token' not in token_info:
+                return None
+            # Another thread or process may have refreshed while we waited for the lock
+            if token_info['expires_at'] - time.time() > self.lead_time:
+                return token_info
+            logger.info("Refreshing access token")
+            started = time.perf_counter()
+            try:
+                token_info = self.oauth.refresh_access_token(token_info['refresh_token'])
+            except Exception:
+                self.refresh_failures += 1
+                record_spotify_call('token_refresh', time.perf_counter() - started, failed=True)
+                raise
+            record_spotify_call('token_refresh', time.perf_counter() - started)
+            self.refreshes += 1
+            if isinstance(cache_handler, WriteBehindCacheHandler):
+                # Other processes read the file as soon as the lock is released
+                cache_handler.flush()
+            logger.info("Token refreshed successfully")
+            return token_info
+
+    def get_access_token(self, as_dict=False):
+        token_info = self.token_info()
+        if not token_info:
+            # Never fall back to spotipy's interactive flow, which reads the server's stdin
+            raise SpotifyOauthError("No cached token; authorize this account first")
+        remaining = token_info['expires_at'] - time.time()
+        if remaining <= 0:
+            token_info = self.refresh() or token_info
+        elif remaining <= self.lead_time:
+            self._wakeup.set()
+        return token_info if as_dict else token_info['access_token']
+
+    def wait_until_due(self, default_wait=60):
+        wait = self.seconds_until_refresh()
+        if wait is None:
+            wait = default_wait
+        if wait > 0:
+            self._wakeup.wait(timeout=wait)
+        self._wakeup.clear()
+
+    def stats(self):
+        token_info = self.token_info()
+        return {
+            "expires_in": int(token_info['expires_at'] - time.time()) if token_info else None,
+            "refresh_lead_time": self.lead_time,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures
+        }
+
+# Read by initialize_spotify() rather than at import
+token_cache = WriteBehindCacheHandler(TOKEN_CACHE_PATH, load=False)
+token_manager = None
+atexit.register(token_cache.flush)
+
+# Readiness checks call Spotify at most once per interval
+READINESS_CHECK_INTERVAL = float(os.getenv('READINESS_CHECK_INTERVAL', '30'))
+
+class UpstreamStatus:
+    """Outcome of the most recent Spotify calls, for cheap health reporting."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.last_success_at = None
+        self.last_error = None
+        self.last_error_at = None
+        self.last_error_operation = None
+
+    def record_success(self):
+        with self._lock:
+            self.last_success_at = time.time()
+
+    def record_error(self, operation, error):
+        with self._lock:
+            self.last_error = str(error)
+            self.last_error_at = time.time()
+            self.last_error_operation = operation
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            return {
+                "last_success_age_seconds": round(now - self.last_success_at, 3) if self.last_success_at else None,
+                "last_error": self.last_error,
+                "last_error_operation": self.last_error_operation,
+                "last_error_age_seconds": round(now - self.last_error_at, 3) if self.last_error_at else None
+            }
+
+upstream_status = UpstreamStatus()
+
+# Upstream rate limit budget, split evenly between worker processes
+SPOTIFY_RATE_LIMIT = float(os.getenv('SPOTIFY_RATE_LIMIT', '10'))
+SPOTIFY_RATE_BURST = float(os.getenv('SPOTIFY_RATE_BURST', '20'))
+SPOTIFY_MAX_QUEUE_WAIT = float(os.getenv('SPOTIFY_MAX_QUEUE_WAIT', '30'))
+SPOTIFY_MAX_RATE_LIMIT_RETRIES = int(os.getenv('SPOTIFY_MAX_RATE_LIMIT_RETRIES', '2'))
+
+# Priority classes, lowest value is served first
+PRIORITY_PLAYBACK = 0
+PRIORITY_READ = 1
+PRIORITY_SEARCH = 2
+PRIORITY_EXPORT = 3
+PRIORITY_NAMES = {PRIORITY_PLAYBACK: "playback", PRIORITY_READ: "read", PRIORITY_SEARCH: "search",
+                  PRIORITY_EXPORT: "export"}
+
+OPERATION_PRIORITIES = {
+    'start_playback': PRIORITY_PLAYBACK,
+    'pause_playback': PRIORITY_PLAYBACK,
+    'next_track': PRIORITY_PLAYBACK,
+    'previous_track': PRIORITY_PLAYBACK,
+    'queue': PRIORITY_PLAYBACK,
+    'current_playback': PRIORITY_READ,
+    'devices': PRIORITY_READ,
+    'tracks': PRIORITY_READ,
+    'albums': PRIORITY_READ,
+    'artists': PRIORITY_READ,
+    'search': PRIORITY_SEARCH,
+    'current_user_playlists': PRIORITY_EXPORT,
+    'playlist_items': PRIORITY_EXPORT,
+    'current_user_saved_tracks': PRIORITY_EXPORT
+}
+
+class SchedulerTimeout(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class UpstreamScheduler:
+    """Token-bucket budget for Spotify calls, granted in priority order.
+
+    Waiting callers are served by priority class and then by arrival, so
+    playback controls overtake queued searches. A 429 response pauses all
+    grants until its Retry-After has passed. Threads wait in acquire();
+    event-loop callers wait in acquire_async() without holding a thread.
+    """
+
+    def __init__(self, rate, burst, max_wait):
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._tokens = burst
+        self._refilled_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiting = []
+        self._sequence = 0
+        # (loop, asyncio.Event) for each waiting acquire_async() caller
+        self._async_waiters = set()
+        self.rate_limited = 0
+        self._wait_stats = {
+            name: {"granted": 0, "timeouts": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _notify(self):
+        self._cond.notify_all()
+        for loop, wakeup in self._async_waiters:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def _enqueue(self, priority):
+        self._sequence += 1
+        entry = (priority, self._sequence)
+        heapq.heappush(self._waiting, entry)
+        return entry
+
+    def _dequeue(self, entry):
+        if entry in self._waiting:
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+            self._notify()
+
+    def _try_grant(self, entry, enqueued_at, deadline, stats):
+        """With the lock held: (seconds waited, None) if `entry` is granted now,
+        else (None, seconds to wait before trying again)."""
+        now = time.monotonic()
+        self._refill(now)
+        if self._waiting[0] == entry:
+            has_budget = self.rate <= 0 or self._tokens >= 1
+            if has_budget and now >= self._blocked_until:
+                heapq.heappop(self._waiting)
+                if self.rate > 0:
+                    self._tokens -= 1
+                self._notify()
+                waited = now - enqueued_at
+                stats["granted"] += 1
+                stats["total_wait_seconds"] += waited
+                stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+                return waited, None
+            timeout = self._blocked_until - now
+            if not has_budget:
+                timeout = max(timeout, (1 - self._tokens) / self.rate)
+        else:
+            timeout = deadline - now
+        if now >= deadline:
+            stats["timeouts"] += 1
+            retry_after = max(1.0, self._blocked_until - now,
+                              (1 - self._tokens) / self.rate if self.rate > 0 else 0.0)
+            raise SchedulerTimeout("Timed out waiting for Spotify rate limit budget", retry_after)
+        return None, min(timeout, deadline - now)
+
+    def acquire(self, priority, max_wait=None):
+        enqueued_at = time.monotonic()
+        deadline = enqueued_at + (self.max_wait if max_wait is None else min(self.max_wait, max_wait))
+        stats = self._wait_stats[PRIORITY_NAMES[priority]]
+        with self._cond:
+            entry = self._enqueue(priority)
+            try:
+                while True:
+                    waited, timeout = self._try_grant(entry, enqueued_at, deadline, stats)
+                    if timeout is None:
+                        return waited
+                    self._cond.wait(timeout)
+            finally:
+                self._dequeue(entry)
+
+    async def acquire_async(self, priority, max_wait=None):
+        """acquire() for coroutines. A caller cancelled while waiting leaves
+        the queue without taking any budget."""
+        enqueued_at = time.monotonic()
+        deadline = enqueued_at + (self.max_wait if max_wait is None else min(self.max_wait, max_wait))
+        stats = self._wait_stats[PRIORITY_NAMES[priority]]
+        loop = asyncio.get_running_loop()
+        waiter = (loop, asyncio.Event())
+        wakeup = waiter[1]
+        with self._cond:
+            entry = self._enqueue(priority)
+            self._async_waiters.add(waiter)
+        try:
+            while True:
+                with self._cond:
+                    wakeup.clear()
+                    waited, timeout = self._try_grant(entry, enqueued_at, deadline, stats)
+                if timeout is None:
+                    return waited
+                # A timer rather than asyncio.wait_for(), which on Python 3.11 drops a
+                # cancellation that arrives just after the wakeup was set
+                timer = loop.call_later(timeout, wakeup.set)
+                try:
+                    await wakeup.wait()
+                finally:
+                    timer.cancel()
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+                self._dequeue(entry)
+
+    def try_acquire(self, priority):
+        """Take budget only if it is available right now, without queueing."""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            if self._waiting or now < self._blocked_until or (self.rate > 0 and self._tokens < 1):
+                return False
+            if self.rate > 0:
+                self._tokens -= 1
+            self._wait_stats[PRIORITY_NAMES[priority]]["granted"] += 1
+            return True
+
+    def backoff(self, seconds):
+        with self._cond:
+            self.rate_limited += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0
+        logger.warning(f"Spotify rate limit hit, pausing upstream calls for {seconds:.1f}s")
+
+    def stats(self):
+        with self._cond:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self._waiting:
+                depth[PRIORITY_NAMES[priority]] += 1
+            return {
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "available_tokens": round(self._tokens, 2),
+                "backoff_remaining_seconds": round(max(self._blocked_until - time.monotonic(), 0), 3),
+                "rate_limited": self.rate_limited,
+                "queue_depth": depth,
+                "wait": {
+                    name: dict(values, total_wait_seconds=round(values["total_wait_seconds"], 3),
+                               max_wait_seconds=round(values["max_wait_seconds"], 3))
+                    for name, values in self._wait_stats.items()
+                }
+            }
+
+scheduler = UpstreamScheduler(SPOTIFY_RATE_LIMIT / SERVER_WORKERS, max(1.0, SPOTIFY_RATE_BURST / SERVER_WORKERS),
+                              SPOTIFY_MAX_QUEUE_WAIT)
+
+# Time budget per Spotify call by priority class, covering the scheduler wait,
+# the request itself and any retries. The caller gets control back at the
+# deadline even if the request is still running.
+SPOTIFY_DEADLINES = {
+    PRIORITY_PLAYBACK: float(os.getenv('SPOTIFY_DEADLINE_PLAYBACK', '5')),
+    PRIORITY_READ: float(os.getenv('SPOTIFY_DEADLINE_READ', '5')),
+    PRIORITY_SEARCH: float(os.getenv('SPOTIFY_DEADLINE_SEARCH', '8')),
+    PRIORITY_EXPORT: float(os.getenv('SPOTIFY_DEADLINE_EXPORT', '30'))
+}
+
+# Consecutive upstream failures that open an operation's breaker, and how
+# long it stays open before a trial call is let through
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))
+
+# Idempotent reads get a second, hedged request if the first is slower than this; 0 disables hedging
+SPOTIFY_HEDGE_AFTER = float(os.getenv('SPOTIFY_HEDGE_AFTER', '0.75'))
+HEDGED_OPERATIONS = ('current_playback', 'search', 'devices')
+# Playback changes are never abandoned at the deadline: a 504 must mean the command
+# wasn't sent, or a retry would apply it twice. Their HTTP timeouts still bound them.
+PLAYBACK_WRITES = ('start_playback', 'pause_playback', 'next_track', 'previous_track')
+
+# Runs the Spotify requests themselves, so callers can stop waiting at their deadline
+upstream_executor = ThreadPoolExecutor(max_workers=SPOTIFY_POOL_SIZE * 2, thread_name_prefix='spotify')
+
+class DeadlineExceeded(Exception):
+    pass
+
+class CircuitOpen(Exception):
+    def __init__(self, operation, retry_after):
+        super().__init__(f"Spotify is failing {operation} calls; try again in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+def is_upstream_failure(error):
+    """Whether `error` says Spotify itself is unhealthy, as opposed to a bad request."""
+    if isinstance(error, SpotifyException):
+        return error.http_status is None or error.http_status >= 500
+    return isinstance(error, (requests.RequestException, DeadlineExceeded))
+
+class CircuitBreaker:
+    """Fails one operation's calls fast while Spotify keeps failing them.
+
+    Opens after BREAKER_FAILURE_THRESHOLD upstream failures in a row. Once
+    BREAKER_RESET_TIMEOUT has passed a single trial call is let through; its
+    success closes the breaker and its failure opens it again.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return
+            elapsed = time.monotonic() - self._opened_at
+            if self.state == 'open' and elapsed >= BREAKER_RESET_TIMEOUT:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return
+            self.rejected += 1
+            raise CircuitOpen(self.operation, max(BREAKER_RESET_TIMEOUT - elapsed, 1.0))
+
+    def record(self, failed):
+        with self._lock:
+            self._trial_running = False
+            if not failed:
+                if self.state != 'closed':
+                    logger.info(f"Circuit breaker for {self.operation} closed")
+                self.state = 'closed'
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= BREAKER_FAILURE_THRESHOLD):
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                self.opened += 1
+                logger.warning(f"Circuit breaker for {self.operation} opened after {self.failures} failures")
+
+    def release(self):
+        # The trial call ended without reaching Spotify, so it proved nothing
+        with self._lock:
+            self._trial_running = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "retry_in_seconds": round(max(BREAKER_RESET_TIMEOUT - (time.monotonic() - self._opened_at), 0), 1)
+                if self.state == 'open' else None
+            }
+
+class CircuitBreakers:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, operation):
+        with self._lock:
+            breaker = self._breakers.get(operation)
+            if breaker is None:
+                breaker = self._breakers[operation] = CircuitBreaker(operation)
+            return breaker
+
+    def open_operations(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return [breaker.operation for breaker in breakers if breaker.state != 'closed']
+
+    def stats(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.operation: breaker.stats() for breaker in breakers}
+
+circuit_breakers = CircuitBreakers()
+
+class HedgeCounters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.won = 0
+        self.skipped = 0
+
+    def record(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self):
+        with self._lock:
+            return {"after_seconds": SPOTIFY_HEDGE_AFTER, "sent": self.sent, "won": self.won,
+                    "skipped_no_budget": self.skipped}
+
+hedge_counters = HedgeCounters()
+
+def request_with_deadline(operation, priority, call, deadline):
+    """Run `call` on the upstream pool and wait for it until `deadline`.
+
+    For hedged operations a second request is sent if the first hasn't
+    answered after SPOTIFY_HEDGE_AFTER, provided the scheduler has budget
+    to spare right away. The first successful answer wins. Playback
+    writes run on the calling thread and are waited for regardless.
+    """
+    if operation in PLAYBACK_WRITES:
+        return call()
+    attempts = [upstream_executor.submit(call)]
+    hedged = operation in HEDGED_OPERATIONS and SPOTIFY_HEDGE_AFTER > 0
+    remaining = deadline - time.monotonic()
+    try:
+        return attempts[0].result(timeout=max(min(SPOTIFY_HEDGE_AFTER, remaining) if hedged else remaining, 0))
+    except FuturesTimeoutError:
+        if attempts[0].done():
+            raise
+    if hedged and time.monotonic() < deadline:
+        if scheduler.try_acquire(priority):
+            hedge_counters.record('sent')
+            attempts.append(upstream_executor.submit(call))
+        else:
+            hedge_counters.record('skipped')
+    error = None
+    pending = attempts
+    while pending:
+        done, pending = futures_wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                                     return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded(f"Spotify {operation} call did not finish within "
+                                   f"{SPOTIFY_DEADLINES[priority]:.1f}s")
+        for future in done:
+            if future.exception() is None:
+                if future is not attempts[0]:
+                    hedge_counters.record('won')
+                return future.result()
+            error = future.exception()
+    raise error
+
+def upstream_error(error):
+    """(payload, status) for a failed operation: 503 while a breaker is open or
+    rate-limit budget ran out, 504 past a deadline."""
+    if isinstance(error, (CircuitOpen, SchedulerTimeout)):
+        return {"error": str(error), "retry_after": round(error.retry_after)}, 503
+    if isinstance(error, DeadlineExceeded):
+        return {"error": str(error)}, 504
+    return {"error": str(error)}, 500
+
+def retry_after_seconds(error):
+    try:
+        return max(float(error.headers.get('Retry-After', 1)), 0.0)
+    except (TypeError, ValueError):
+        return 1.0
+
+def call_spotify(operation, *args, **kwargs):
+    """Call a method on the current account's Spotify client through the
+    scheduler and the operation's circuit breaker, within its deadline,
+    recording the outcome."""
+    priority = OPERATION_PRIORITIES.get(operation, PRIORITY_READ)
+    deadline = time.monotonic() + SPOTIFY_DEADLINES[priority]
+    breaker = circuit_breakers.get(operation)
+    breaker.allow()
+    method = getattr(current_client(), operation)
+    attempt = 0
+    timing = current_request_timing.get()
+    while True:
+        try:
+            waited = scheduler.acquire(priority, max_wait=deadline - time.monotonic())
+        except SchedulerTimeout:
+            breaker.release()
+            raise
+        spotify_scheduler_wait_seconds.observe(waited, PRIORITY_NAMES[priority])
+        if timing is not None:
+            timing.scheduler_wait += waited
+        started = time.perf_counter()
+        try:
+            result = request_with_deadline(operation, priority, lambda: method(*args, **kwargs), deadline)
+        except SpotifyException as e:
+            record_spotify_call(operation, time.perf_counter() - started, failed=True)
+            if e.http_status == 429:
+                retry_after = retry_after_seconds(e)
+                scheduler.backoff(retry_after)
+                if attempt < SPOTIFY_MAX_RATE_LIMIT_RETRIES and time.monotonic() + retry_after < deadline:
+                    attempt += 1
+                    continue
+            upstream_status.record_error(operation, e)
+            breaker.record(is_upstream_failure(e))
+            raise
+        except Exception as e:
+            record_spotify_call(operation, time.perf_counter() - started, failed=True)
+            upstream_status.record_error(operation, e)
+            breaker.record(is_upstream_failure(e))
+            raise
+        record_spotify_call(operation, time.perf_counter() - started)
+        upstream_status.record_success()
+        breaker.record(False)
+        return result
+
+# Search result cache settings
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', '300'))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', '512'))
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a fixed TTL."""
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+# Caches live in SQLite when several workers need to share them
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'sqlite' if SERVER_WORKERS > 1 else 'memory')
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', 'shared_cache.db')
+
+if CACHE_BACKEND == 'sqlite':
+    search_cache = SQLiteCache(SHARED_CACHE_PATH, 'search', SEARCH_CACHE_TTL, SEARCH_CACHE_MAX_ENTRIES)
+else:
+    search_cache = TTLCache(SEARCH_CACHE_TTL, SEARCH_CACHE_MAX_ENTRIES)
+
+# Local track index settings; an empty TRACK_INDEX_PATH disables the index
+TRACK_INDEX_PATH = os.getenv('TRACK_INDEX_PATH', 'track_index.db')
+SEARCH_SOURCE = os.getenv('SEARCH_SOURCE', 'auto')
+LOCAL_SEARCH_MIN_CONFIDENCE = float(os.getenv('LOCAL_SEARCH_MIN_CONFIDENCE', '0.9'))
+# The keys of a track in the local index's answers
+LOCAL_SEARCH_FIELDS = ('name', 'artist', 'uri')
+SEARCH_SOURCES = ('auto', 'local', 'upstream')
+
+# Opened by start()
+track_index = None
+
+def open_track_index():
+    if not TRACK_INDEX_PATH:
+        return None
+    try:
+        return TrackIndex(TRACK_INDEX_PATH)
+    except Exception as e:
+        logger.error(f"Error opening track index: {str(e)}")
+        return None
+
+def index_tracks(tracks):
+    if not track_index:
+        return
+    try:
+        track_index.add_tracks(tracks)
+    except Exception as e:
+        logger.error(f"Error updating track index: {str(e)}")
+
+# Search parameters; Spotify caps page size at 50 and offsets at 1000
+SEARCH_TYPES = ('track', 'album', 'artist', 'playlist')
+SEARCH_DEFAULT_LIMIT = 5
+SEARCH_MAX_LIMIT = 50
+SEARCH_MAX_OFFSET = 1000
+SEARCH_STREAM_MAX_RESULTS = int(os.getenv('SEARCH_STREAM_MAX_RESULTS', '1000'))
+SEARCH_PREFETCH_WORKERS = int(os.getenv('SEARCH_PREFETCH_WORKERS', '4'))
+
+# Fetches the next page of streamed searches while the current one is written
+search_prefetch_executor = ThreadPoolExecutor(max_workers=SEARCH_PREFETCH_WORKERS,
+                                              thread_name_prefix='search-prefetch')
+
+class InvalidSearch(Exception):
+    pass
+
+def parse_search_types(value):
+    if not value:
+        return ['track']
+    if isinstance(value, str):
+        value = value.split(',')
+    types = []
+    for search_type in value:
+        search_type = search_type.strip().lower()
+        if search_type.endswith('s') and search_type[:-1] in SEARCH_TYPES:
+            search_type = search_type[:-1]
+        if search_type not in SEARCH_TYPES:
+            raise InvalidSearch(f"Unknown search type: {search_type}")
+        if search_type not in types:
+            types.append(search_type)
+    return types
+
+def parse_search_fields(value):
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    return [field.strip() for field in value if field.strip()] or None
+
+def parse_search_int(value, default, name, minimum, maximum):
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise InvalidSearch(f"{name} must be an integer")
+    if not minimum <= value <= maximum:
+        raise InvalidSearch(f"{name} must be between {minimum} and {maximum}")
+    return value
+
+def search_cache_key(query, types, limit, offset=0):
+    # Queries differing only in case or whitespace share a cache entry
+    return (' '.join(query.lower().split()), ','.join(types), int(limit), int(offset))
+
+def slim_item(item):
+    # Market lists make up most of a track or album and are never used
+    item = {key: value for key, value in item.items() if key != 'available_markets'}
+    if isinstance(item.get('album'), dict):
+        item['album'] = {key: value for key, value in item['album'].items() if key != 'available_markets'}
+    return item
+
+def slim_search_results(results, types):
+    """Items per type from a Spotify search response, without market lists."""
+    page = {}
+    for search_type in types:
+        items = []
+        for item in (results.get(search_type + 's') or {}).get('items') or []:
+            # Playlist results can contain nulls
+            if item:
+                items.append(slim_item(item))
+        page[search_type + 's'] = items
+    return page
+
+def summarize_search_item(search_type, item):
+    if search_type == 'tracks':
+        return {
+            "name": item['name'],
+            "artist": item['artists'][0]['name'] if item.get('artists') else None,
+            "uri": item['uri']
+        }
+    if search_type == 'albums':
+        return {
+            "name": item['name'],
+            "artist": item['artists'][0]['name'] if item.get('artists') else None,
+            "uri": item['uri'],
+            "release_date": item.get('release_date')
+        }
+    if search_type == 'artists':
+        return {"name": item['name'], "uri": item['uri'], "genres": item.get('genres', [])}
+    return {
+        "name": item['name'],
+        "owner": (item.get('owner') or {}).get('display_name'),
+        "uri": item['uri'],
+        "tracks": (item.get('tracks') or {}).get('total')
+    }
+
+def lookup_path(value, path):
+    # "album.images.0.url"; missing keys give None
+    for part in path.split('.'):
+        if isinstance(value, list):
+            try:
+                value = value[int(part)]
+            except (ValueError, IndexError):
+                return None
+        elif isinstance(value, dict):
+            value = value.get(part)
+        else:
+            return None
+    return value
+
+def shape_search_page(page, fields=None):
+    """Summaries of each item, or just the requested `fields` (dotted paths)."""
+    if fields:
+        return {search_type: [{field: lookup_path(item, field) for field in fields} for item in items]
+                for search_type, items in page.items()}
+    return {search_type: [summarize_search_item(search_type, item) for item in items]
+            for search_type, items in page.items()}
+
+def next_search_offset(page, limit, offset):
+    following = offset + limit
+    if following > SEARCH_MAX_OFFSET or not any(len(items) >= limit for items in page.values()):
+        return None
+    return following
+
+def fetch_search_page(query, types, limit, offset, use_cache=True):
+    cache_key = search_cache_key(query, types, limit, offset)
+    if use_cache:
+        page = search_cache.get(cache_key)
+        if page is not None:
+            return page
+    logger.info(f"Searching for: {query} (types={','.join(types)}, limit={limit}, offset={offset})")
+    results = call_spotify('search', q=query, type=','.join(types), limit=limit, offset=offset)
+    page = slim_search_results(results, types)
+    index_tracks(page.get('tracks', []))
+    search_cache.set(cache_key, page)
+    return page
+
+def cache_bypass_requested(headers, args):
+    cache_control = headers.get('Cache-Control', '').lower()
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return True
+    return args.get('no_cache', '').lower() in ('1', 'true', 'yes')
+
+# Bulk metadata lookups, split into the largest batches Spotify accepts per call
+METADATA_BATCH_SIZES = {'track': 50, 'album': 20, 'artist': 50}
+METADATA_MAX_IDS = int(os.getenv('METADATA_MAX_IDS', '500'))
+METADATA_CACHE_TTL = float(os.getenv('METADATA_CACHE_TTL', '86400'))
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv('METADATA_CACHE_MAX_ENTRIES', '10000'))
+METADATA_FETCH_WORKERS = int(os.getenv('METADATA_FETCH_WORKERS', '4'))
+
+# spotify:track:ID, https://open.spotify.com/track/ID or a bare ID
+SPOTIFY_REF_PATTERN = re.compile(
+    r'^(?:spotify:(track|album|artist):|https?://open\.spotify\.com/(?:intl-[\w-]+/)?(track|album|artist)/)?'
+    r'([A-Za-z0-9]{22})(?:\?.*)?$')
+
+if CACHE_BACKEND == 'sqlite':
+    metadata_cache = SQLiteCache(SHARED_CACHE_PATH, 'metadata', METADATA_CACHE_TTL, METADATA_CACHE_MAX_ENTRIES)
+else:
+    metadata_cache = TTLCache(METADATA_CACHE_TTL, METADATA_CACHE_MAX_ENTRIES)
+
+# Issues the batches of one lookup concurrently
+metadata_executor = ThreadPoolExecutor(max_workers=METADATA_FETCH_WORKERS, thread_name_prefix='metadata')
+
+class InvalidMetadataRequest(Exception):
+    pass
+
+def parse_metadata_refs(values, default_type=None):
+    """(type, id) pairs, in request order, from URIs, links or bare IDs."""
+    if default_type and default_type not in METADATA_BATCH_SIZES:
+        raise InvalidMetadataRequest(f"Unknown type: {default_type}")
+    if isinstance(values, str):
+        values = [value for value in values.split(',') if value.strip()]
+    if not values or not isinstance(values, list):
+        raise InvalidMetadataRequest("No IDs provided")
+    if len(values) > METADATA_MAX_IDS:
+        raise InvalidMetadataRequest(f"At most {METADATA_MAX_IDS} IDs per request")
+    refs = []
+    for value in values:
+        match = SPOTIFY_REF_PATTERN.match(value.strip()) if isinstance(value, str) else None
+        if not match:
+            raise InvalidMetadataRequest(f"Not a Spotify track, album or artist ID: {value}")
+        metadata_type = match.group(1) or match.group(2) or default_type
+        if not metadata_type:
+            raise InvalidMetadataRequest(f"A type is needed for bare ID {match.group(3)}")
+        refs.append((metadata_type, match.group(3)))
+    return refs
+
+def fetch_metadata(missing):
+    """Look up uncached IDs by type, with every batch in flight at once.
+
+    Returns items by (type, id); IDs Spotify doesn't know map to None.
+    """
+    def fetch(metadata_type, ids):
+        results = call_spotify(metadata_type + 's', ids)
+        return results.get(metadata_type + 's') or []
+    # Batches run on other threads, but their calls still count toward this request's timing
+    fetch = with_account(fetch, timing=current_request_timing.get())
+
+    batches = []
+    for metadata_type, ids in missing.items():
+        size = METADATA_BATCH_SIZES[metadata_type]
+        for start in range(0, len(ids), size):
+            chunk = ids[start:start + size]
+            batches.append((metadata_type, chunk, metadata_executor.submit(fetch, metadata_type, chunk)))
+
+    found = {}
+    for metadata_type, ids, future in batches:
+        items = future.result()
+        for index, spotify_id in enumerate(ids):
+            item = items[index] if index < len(items) else None
+            if item:
+                item = slim_item(item)
+                metadata_cache.set((metadata_type, spotify_id), item)
+            found[(metadata_type, spotify_id)] = item
+    return found
+
+# Playback snapshot settings
+PLAYBACK_SNAPSHOT_MAX_AGE = float(os.getenv('PLAYBACK_SNAPSHOT_MAX_AGE', '3'))
+
+class _Flight:
+    def __init__(self, generation):
+        self.generation = generation
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class PlaybackSnapshot:
+    """Shared current_playback() state with single-flight refreshes.
+
+    Callers arriving while a fetch is running wait for it instead of issuing
+    their own request. Between fetches progress_ms is extrapolated locally.
+    """
+
+    def __init__(self, fetch, max_age):
+        self.fetch = fetch
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._state = None
+        self._fetched_at = 0.0
+        self._generation = 0
+        self._flight = None
+        self.upstream_fetches = 0
+        self.coalesced = 0
+        self.served_from_snapshot = 0
+
+    def _extrapolate(self, state, fetched_at):
+        if not state or not state.get('is_playing') or state.get('progress_ms') is None:
+            return state
+        elapsed_ms = int((time.monotonic() - fetched_at) * 1000)
+        progress_ms = state['progress_ms'] + elapsed_ms
+        item = state.get('item')
+        if item and item.get('duration_ms'):
+            progress_ms = min(progress_ms, item['duration_ms'])
+        return dict(state, progress_ms=progress_ms)
+
+    def _is_fresh(self, now):
+        if self._fetched_at == 0.0 or now - self._fetched_at > self.max_age:
+            return False
+        state = self._state
+        if state and state.get('is_playing') and state.get('item'):
+            # Once the track should have ended the snapshot no longer describes reality
+            remaining_ms = (state['item'].get('duration_ms') or 0) - (state.get('progress_ms') or 0)
+            if (now - self._fetched_at) * 1000 >= remaining_ms:
+                return False
+        return True
+
+    def get(self, force=False):
+        with self._lock:
+            if not force and self._is_fresh(time.monotonic()):
+                self.served_from_snapshot += 1
+                return self._extrapolate(self._state, self._fetched_at)
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight(self._generation)
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return self._extrapolate(*flight.result)
+
+        try:
+            state = self.fetch()
+            fetched_at = time.monotonic()
+            flight.result = (state, fetched_at)
+            with self._lock:
+                self.upstream_fetches += 1
+                # Don't keep a result that was requested before an invalidation
+                if flight.generation == self._generation:
+                    self._state = state
+                    self._fetched_at = fetched_at
+            return state
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flight = None
+            flight.done.set()
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._state = None
+            self._fetched_at = 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_age_seconds": self.max_age,
+                "upstream_fetches": self.upstream_fetches,
+                "coalesced": self.coalesced,
+                "served_from_snapshot": self.served_from_snapshot
+            }
+
+class SharedPlaybackSnapshot(PlaybackSnapshot):
+    """PlaybackSnapshot kept in a cache shared by all worker processes.
+
+    Threads within a process still coalesce onto one fetch; across processes
+    a file lock lets one fetch at a time, and processes that waited for it
+    use its result from the shared cache.
+    """
+
+    def __init__(self, fetch, max_age, store, key, lock_path):
+        super().__init__(self._fetch_shared, max_age)
+        self.fetch_upstream = fetch
+        self.store = store
+        self.key = key
+        self.file_lock = FileLock(lock_path)
+        self.shared_fetches = 0
+
+    def _load(self):
+        entry = self.store.get(self.key) or {}
+        with self._lock:
+            if 'fetched_at' in entry:
+                age = max(0.0, time.time() - entry['fetched_at'])
+                self._state, self._fetched_at = entry['state'], time.monotonic() - age
+            else:
+                self._state, self._fetched_at = None, 0.0
+            if self._is_fresh(time.monotonic()):
+                return self._state, self._fetched_at
+        return None
+
+    def _fetch_shared(self):
+        started = time.time()
+        with self.file_lock:
+            snapshot = self._load()
+            if snapshot is not None:
+                with self._lock:
+                    self.shared_fetches += 1
+                return self._extrapolate(*snapshot)
+            state = self.fetch_upstream()
+            entry = self.store.get(self.key) or {}
+            # Skip storing a result that was requested before an invalidation
+            if entry.get('invalidated_at', 0) <= started:
+                self.store.set(self.key, {"state": state, "fetched_at": time.time()})
+            return state
+
+    def get(self, force=False):
+        if not force:
+            snapshot = self._load()
+            if snapshot is not None:
+                with self._lock:
+                    self.served_from_snapshot += 1
+                return self._extrapolate(*snapshot)
+        return super().get(force=True)
+
+    def invalidate(self):
+        super().invalidate()
+        self.store.set(self.key, {"invalidated_at": time.time()})
+
+    def stats(self):
+        stats = super().stats()
+        # Fetches another worker made for us count as snapshot hits, not upstream calls
+        stats["upstream_fetches"] -= self.shared_fetches
+        stats["served_from_other_workers"] = self.shared_fetches
+        return stats
+
+def fetch_playback():
+    current_playback = call_spotify('current_playback')
+    if current_playback and current_playback.get('item'):
+        index_tracks([current_playback['item']])
+    if current_playback and current_playback.get('device'):
+        current_device_registry().note_used(current_playback['device'].get('id'))
+    return current_playback
+
+if CACHE_BACKEND == 'sqlite':
+    playback_store = SQLiteCache(SHARED_CACHE_PATH, 'playback', 3600, 100000)
+
+def make_playback_snapshot(key):
+    if CACHE_BACKEND == 'sqlite':
+        return SharedPlaybackSnapshot(fetch_playback, PLAYBACK_SNAPSHOT_MAX_AGE, playback_store, key,
+                                      os.path.join(SHARED_CACHE_PATH + '.locks', f"{key}.lock"))
+    return PlaybackSnapshot(fetch_playback, PLAYBACK_SNAPSHOT_MAX_AGE)
+
+playback_snapshot = make_playback_snapshot('default')
+
+# Device list cache
+DEVICE_CACHE_TTL = float(os.getenv('DEVICE_CACHE_TTL', '60'))
+# An unknown device name refetches the list at most this often
+DEVICE_REFETCH_INTERVAL = 5
+
+class UnknownDevice(Exception):
+    pass
+
+class DeviceRegistry:
+    """One account's device list, and the device it last played on.
+
+    Once fetched, the list is served from memory; an expired list is still
+    served while a background thread fetches a new one. Spotify is only
+    waited on when the list was never fetched or a device isn't in it.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._devices = None
+        self._fetched_at = 0.0
+        self._refreshing = False
+        self.last_used = None
+        self.fetches = 0
+        self.fallbacks = 0
+
+    def update(self, devices):
+        with self._lock:
+            self._devices = devices
+            self._fetched_at = time.monotonic()
+            self.fetches += 1
+        active = next((device for device in devices if device.get('is_active')), None)
+        if active:
+            self.note_used(active.get('id'))
+
+    def note_used(self, device_id):
+        if device_id:
+            self.last_used = device_id
+
+    def fetch(self):
+        devices = (call_spotify('devices') or {}).get('devices') or []
+        self.update(devices)
+        return devices
+
+    def _refresh_in_background(self):
+        @with_account
+        def refresh():
+            try:
+                self.fetch()
+            except Exception as e:
+                logger.warning(f"Device list refresh failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def devices(self):
+        with self._lock:
+            devices = self._devices
+            refresh = (devices is not None and not self._refreshing
+                       and time.monotonic() - self._fetched_at > self.ttl)
+            if refresh:
+                self._refreshing = True
+        if devices is None:
+            return self.fetch()
+        if refresh:
+            self._refresh_in_background()
+        return devices
+
+    def resolve(self, device):
+        """ID of the device with this ID or (case-insensitive) name."""
+        devices = self.devices()
+        for attempt in range(2):
+            for candidate in devices:
+                if candidate.get('id') == device or (candidate.get('name') or '').lower() == device.lower():
+                    return candidate['id']
+            # A device that just came online isn't in the cached list yet
+            if attempt or time.monotonic() - self._fetched_at < DEVICE_REFETCH_INTERVAL:
+                break
+            devices = self.fetch()
+        raise UnknownDevice(f"Unknown device: {device}")
+
+    def fallback_device(self):
+        """Device to move playback to when none is active: the last one used if it is
+        still listed, else the first available."""
+        available = [device for device in self.devices() if not device.get('is_restricted')]
+        if any(device.get('id') == self.last_used for device in available):
+            return self.last_used
+        return available[0]['id'] if available else None
+
+    def stats(self):
+        with self._lock:
+            devices = self._devices
+            fetched_at = self._fetched_at
+        return {
+            "ttl_seconds": self.ttl,
+            "devices": len(devices) if devices is not None else None,
+            "age_seconds": round(time.monotonic() - fetched_at, 1) if devices is not None else None,
+            "last_used": self.last_used,
+            "fetches": self.fetches,
+            "fallbacks": self.fallbacks
+        }
+
+device_registry = DeviceRegistry(DEVICE_CACHE_TTL)
+
+SPOTIFY_SCOPE = ('user-read-playback-state user-modify-playback-state user-read-currently-playing '
+                 'playlist-read-private playlist-read-collaborative user-library-read')
+
+def build_oauth(cache_handler):
+    oauth = SpotifyOAuth(
+        client_id=SPOTIFY_CLIENT_ID,
+        client_secret=SPOTIFY_CLIENT_SECRET,
+        redirect_uri=REDIRECT_URI,
+        scope=SPOTIFY_SCOPE,
+        open_browser=False,
+        cache_handler=cache_handler,
+        requests_session=spotify_session,
+        requests_timeout=(SPOTIFY_CONNECT_TIMEOUT, SPOTIFY_READ_TIMEOUT)
+    )
+    oauth.OAUTH_TOKEN_URL = f"{SPOTIFY_ACCOUNTS_URL}/api/token"
+    return oauth
+
 def initialize_spotify():
-    global sp, auth_manager
+    global auth_manager, token_manager
     try:
         logger.info("Initializing Spotify client")
-        auth_manager = SpotifyOAuth(
-            client_id=SPOTIFY_CLIENT_ID,
-            client_secret=SPOTIFY_CLIENT_SECRET,
-            redirect_uri=REDIRECT_URI,
-            scope='user-read-playback-state user-modify-playback-state user-read-currently-playing',
-            open_browser=False,
-            cache_path='.spotify_cache'
-        )
+        token_cache.reload()
+        auth_manager = build_oauth(token_cache)
         
         # Check if we have a cached token
         token_info = auth_manager.get_cached_token()
@@ -88,6 +1608,8 @@ def initialize_spotify():
             
             # Wait for authentication to complete
             for _ in range(60):  # Wait up to 5 minutes
+                # authenticate_spotify.py may write the cache file from another process
+                token_cache.reload()
                 token_info = auth_manager.get_cached_token()
                 if token_info and not auth_manager.is_token_expired(token_info):
                     break
@@ -97,190 +1619,1550 @@ def initialize_spotify():
                 logger.error("Authentication timed out")
                 return False
         
-        sp = spotipy.Spotify(auth_manager=auth_manager)
+        token_manager = TokenManager(auth_manager, TOKEN_REFRESH_LEAD_TIME,
+                                     file_lock=FileLock(TOKEN_CACHE_PATH + '.lock'))
+        bind_spotify_client(token_manager)
         logger.info("Spotify client initialized successfully")
         return True
     except Exception as e:
         logger.error(f"Error initializing Spotify client: {str(e)}")
         return False
 
-# Initialize Spotify on startup
-initialize_spotify()
+# Seconds a request waits for the Spotify client to finish initializing
+SPOTIFY_INIT_WAIT = float(os.getenv('SPOTIFY_INIT_WAIT', '10'))
+
+initialize_lock = threading.Lock()
+initializer = None
 
-# Periodically check and refresh the token
+def initialize_in_background():
+    """Run initialize_spotify() on a background thread unless it already is; returns the thread."""
+    global initializer
+    with initialize_lock:
+        if initializer is None or not initializer.is_alive():
+            initializer = threading.Thread(target=initialize_spotify, daemon=True)
+            initializer.start()
+        return initializer
+
+# Refresh the token ahead of expiry instead of polling the cache file
 def token_refresh_thread():
-    global sp, auth_manager
     while True:
         try:
-            if auth_manager:
-                token_info = auth_manager.get_cached_token()
-                if token_info and auth_manager.is_token_expired(token_info):
-                    logger.info("Refreshing expired token")
-                    auth_manager.refresh_access_token(token_info['refresh_token'])
-                    sp = spotipy.Spotify(auth_manager=auth_manager)
-                    logger.info("Token refreshed successfully")
-            time.sleep(60)  # Check every minute
+            if token_manager:
+                token_manager.wait_until_due()
+                token_manager.refresh()
+            else:
+                time.sleep(60)
         except Exception as e:
             logger.error(f"Error in token refresh thread: {str(e)}")
             time.sleep(30)  # Wait a bit before retrying
 
-# Start the token refresh thread
+# Started by start()
 refresh_thread = threading.Thread(target=token_refresh_thread, daemon=True)
-refresh_thread.start()
+
+
+# Account pool settings. Requests naming an account in ACCOUNT_HEADER use that
+# account's client; requests without one use the default .spotify_cache account.
+ACCOUNT_HEADER = 'X-Spotify-Account'
+ACCOUNT_CACHE_DIR = os.getenv('ACCOUNT_CACHE_DIR', '.spotify_accounts')
+ACCOUNT_POOL_MAX = int(os.getenv('ACCOUNT_POOL_MAX', '500'))
+ACCOUNT_IDLE_TIMEOUT = float(os.getenv('ACCOUNT_IDLE_TIMEOUT', '1800'))
+ACCOUNT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+class InvalidAccount(Exception):
+    pass
+
+class SpotifyAccount:
+    """Token cache, client, playback snapshot and devices for one pooled account."""
+
+    def __init__(self, account_id, cache_path, wakeup):
+        self.account_id = account_id
+        self.token_cache = WriteBehindCacheHandler(cache_path)
+        self.oauth = build_oauth(self.token_cache)
+        self.token_manager = TokenManager(self.oauth, TOKEN_REFRESH_LEAD_TIME, wakeup,
+                                          file_lock=FileLock(cache_path + '.lock'))
+        self.client = build_spotify_client(self.token_manager)
+        self.playback_snapshot = make_playback_snapshot(f"account-{account_id}")
+        self.device_registry = DeviceRegistry(DEVICE_CACHE_TTL)
+        self.last_used = time.monotonic()
+
+    def is_authenticated(self):
+        return self.token_manager.token_info() is not None
+
+class AccountPool:
+    """Accounts keyed by ID, loaded on first use and evicted least recently used.
+
+    Clients share the connection pool and rate-limit scheduler. A single
+    background thread refreshes every account's token on its own schedule
+    and evicts accounts idle for longer than `idle_timeout`; evicted
+    accounts are reloaded from their cache file when next used.
+    """
+
+    def __init__(self, cache_dir, max_accounts, idle_timeout):
+        self.cache_dir = cache_dir
+        self.max_accounts = max_accounts
+        self.idle_timeout = idle_timeout
+        self._accounts = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._refresher = None
+        self.loaded = 0
+        self.evicted = 0
+        self.refresh_failures = 0
+
+    def get(self, account_id):
+        if not ACCOUNT_ID_PATTERN.match(account_id or ''):
+            raise InvalidAccount(f"Invalid account ID: {account_id!r}")
+        evicted = []
+        with self._lock:
+            account = self._accounts.get(account_id)
+            if account is None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                account = SpotifyAccount(account_id, os.path.join(self.cache_dir, f"{account_id}.json"),
+                                         self._wakeup)
+                self._accounts[account_id] = account
+                self.loaded += 1
+                while len(self._accounts) > self.max_accounts:
+                    evicted.append(self._accounts.popitem(last=False)[1])
+                if self._refresher is None:
+                    self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+                    self._refresher.start()
+            else:
+                self._accounts.move_to_end(account_id)
+            account.last_used = time.monotonic()
+        self._release(evicted)
+        return account
+
+    def _release(self, accounts):
+        for account in accounts:
+            self.evicted += 1
+            logger.info(f"Evicting idle account {account.account_id}")
+            try:
+                account.token_cache.flush()
+            except Exception as e:
+                logger.error(f"Error saving token for account {account.account_id}: {str(e)}")
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        evicted = []
+        with self._lock:
+            while self._accounts:
+                account = next(iter(self._accounts.values()))
+                if account.last_used > cutoff:
+                    break
+                evicted.append(self._accounts.popitem(last=False)[1])
+        self._release(evicted)
+
+    def _refresh_loop(self, sweep_interval=60):
+        while True:
+            self._wakeup.clear()
+            self.evict_idle()
+            with self._lock:
+                accounts = list(self._accounts.values())
+            wait = sweep_interval
+            for account in accounts:
+                due_in = account.token_manager.seconds_until_refresh()
+                if due_in is None:
+                    continue
+                if due_in > 0:
+                    wait = min(wait, due_in)
+                    continue
+                try:
+                    account.token_manager.refresh()
+                except Exception as e:
+                    self.refresh_failures += 1
+                    logger.error(f"Error refreshing token for account {account.account_id}: {str(e)}")
+            self._wakeup.wait(timeout=wait)
+
+    def flush(self):
+        with self._lock:
+            accounts = list(self._accounts.values())
+        for account in accounts:
+            account.token_cache.flush()
+
+    def stats(self):
+        with self._lock:
+            active = len(self._accounts)
+        return {
+            "active": active,
+            "max_accounts": self.max_accounts,
+            "idle_timeout_seconds": self.idle_timeout,
+            "loaded": self.loaded,
+            "evicted": self.evicted,
+            "refresh_failures": self.refresh_failures
+        }
+
+account_pool = AccountPool(ACCOUNT_CACHE_DIR, ACCOUNT_POOL_MAX, ACCOUNT_IDLE_TIMEOUT)
+atexit.register(account_pool.flush)
+
+# Account selected for the request being handled; None means the default account
+current_account = contextvars.ContextVar('current_account', default=None)
+
+def with_account(function, timing=None):
+    """Wrap `function` to run as the calling account on another thread.
+
+    Pool threads and streamed response bodies don't see the caller's context
+    variables. Upstream calls are charged to `timing` if given, else to nothing.
+    """
+    account = current_account.get()
+
+    def run(*args):
+        current_account.set(account)
+        current_request_timing.set(timing)
+        return function(*args)
+    return run
+
+def current_client():
+    account = current_account.get()
+    return account.client if account else sp
+
+def current_playback_snapshot():
+    account = current_account.get()
+    return account.playback_snapshot if account else playback_snapshot
+
+def current_device_registry():
+    account = current_account.get()
+    return account.device_registry if account else device_registry
+
+def requested_account_id():
+    # Browsers following /auth links can't set headers, so a query argument also works
+    return request.headers.get(ACCOUNT_HEADER) or request.args.get('account')
 
 @app.route('/callback')
 def callback():
+    global token_manager
     code = request.args.get('code')
     if code:
         try:
+            # /auth passes the account ID through the OAuth state parameter
+            account_id = request.args.get('state')
+            if account_id:
+                account_pool.get(account_id).oauth.get_access_token(code)
+                return "Authentication successful! You can close this window."
             auth_manager.get_access_token(code)
-            global sp
-            sp = spotipy.Spotify(auth_manager=auth_manager)
+            if token_manager is None:
+                token_manager = TokenManager(auth_manager, TOKEN_REFRESH_LEAD_TIME,
+                                             file_lock=FileLock(TOKEN_CACHE_PATH + '.lock'))
+            bind_spotify_client(token_manager)
             return "Authentication successful! You can close this window."
         except Exception as e:
             logger.error(f"Error in callback: {str(e)}")
             return f"Authentication failed: {str(e)}"
     return "No code provided"
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    logger.info("Health check endpoint called")
-    if sp:
+def token_is_valid():
+    if not token_manager:
+        return False
+    token_info = token_manager.token_info()
+    return bool(token_info) and token_info['expires_at'] > time.time()
+
+def liveness_report():
+    # Local state only: never calls Spotify
+    token_valid = token_is_valid()
+    open_breakers = circuit_breakers.open_operations()
+    return {
+        "status": "healthy" if sp and token_valid and not open_breakers else "degraded",
+        "worker": {"id": WORKER_ID, "pid": os.getpid(), "workers": SERVER_WORKERS},
+        "spotify_client": "connected" if sp else "disconnected",
+        "token_valid": token_valid,
+        "token": token_manager.stats() if token_manager else None,
+        "upstream": upstream_status.stats(),
+        "scheduler": scheduler.stats(),
+        "circuit_breakers": {"open": open_breakers, "operations": circuit_breakers.stats()},
+        "hedging": hedge_counters.stats(),
+        "search_cache": search_cache.stats(),
+        "playback_commands": command_pipelines.stats(),
+        "idempotency": idempotency_keys.stats(),
+        "metadata_cache": metadata_cache.stats(),
+        "track_index": {"tracks": track_index.count()} if track_index else None,
+        "playback_snapshot": playback_snapshot.stats(),
+        "devices": device_registry.stats(),
+        "connection_pool": connection_counters.stats(),
+        "accounts": account_pool.stats(),
+        "playback_streams": playback_streams.stats()
+    }
+
+class ReadinessCheck:
+    """Verifies Spotify is reachable for an account, hitting the API at most
+    once per interval and account.
+
+    Probes in between get that account's last result. The check never waits
+    for interactive authentication: a missing default client is initialized
+    in the background, and both it and an unauthorized account are reported
+    as not ready without calling Spotify.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def check(self):
+        account = current_account.get()
+        if account is None and not sp:
+            initialize_in_background()
+            return {"ready": False, "reason": "Spotify client not initialized"}
+        if account is not None and not account.is_authenticated():
+            return {"ready": False, "reason": f"Account {account.account_id} is not authorized"}
+        key = account.account_id if account else None
+        # Only one probe per account at a time reaches Spotify; the rest reuse its last result
+        with self._lock:
+            state = self._states.setdefault(
+                key, {"checked_at": 0.0, "running": False, "result": {"ready": False, "reason": "not checked yet"}})
+            if time.monotonic() - state["checked_at"] < self.interval or state["running"]:
+                return dict(state["result"], cached=True)
+            state["running"] = True
+        result = {"ready": False, "reason": "check interrupted"}
         try:
-            # Try a simple API call to verify the connection
-            devices = sp.devices()
-            return jsonify({"status": "healthy", "spotify_client": "connected"})
+            current_device_registry().fetch()
+            result = {"ready": True}
         except Exception as e:
-            logger.error(f"Health check failed: {str(e)}")
-            # Try to reinitialize the client
-            if initialize_spotify():
-                return jsonify({"status": "recovered", "message": "Reinitialized Spotify client"})
-            return jsonify({"status": "unhealthy", "error": str(e)}), 500
-    else:
-        # Try to initialize the client
-        if initialize_spotify():
-            return jsonify({"status": "recovered", "message": "Initialized Spotify client"})
-        return jsonify({"status": "unhealthy", "spotify_client": "disconnected"}), 500
+            logger.error(f"Readiness check failed: {str(e)}")
+            result = {"ready": False, "reason": str(e)}
+        finally:
+            with self._lock:
+                state.update(result=result, checked_at=time.monotonic(), running=False)
+        return dict(result, cached=False)
 
-@app.route('/play', methods=['POST'])
-def play_track():
+readiness_check = ReadinessCheck(READINESS_CHECK_INTERVAL)
+
+# Per-request timing breakdowns are passed to these callables
+request_timing_hooks = []
+REQUEST_TIMING = os.getenv('REQUEST_TIMING', '').lower() in ('1', 'true', 'yes')
+
+def add_request_timing_hook(hook):
+    request_timing_hooks.append(hook)
+
+def log_request_timing(breakdown):
+    logger.info(f"Request timing: {json.dumps(breakdown)}")
+
+if REQUEST_TIMING:
+    add_request_timing_hook(log_request_timing)
+
+@app.before_request
+def start_request_timing():
+    current_request_id.set(request.headers.get('X-Request-ID') or uuid.uuid4().hex)
+    current_request_timing.set(RequestTiming())
+
+@app.before_request
+def select_account():
+    account_id = requested_account_id()
+    if not account_id:
+        current_account.set(None)
+        return None
     try:
-        logger.info("Play track endpoint called")
-        if not sp:
-            if not initialize_spotify():
-                return jsonify({"error": "Spotify client not initialized"}), 500
-        
-        data = request.get_json()
-        track_uri = data.get('track_uri')
-        
-        if not track_uri:
-            logger.warning("No track URI provided")
-            return jsonify({"error": "No track URI provided"}), 400
-            
-        logger.info(f"Playing track: {track_uri}")
-        sp.start_playback(uris=[track_uri])
-        return jsonify({"status": "success", "message": "Track started playing"})
-    except Exception as e:
-        logger.error(f"Error playing track: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        current_account.set(account_pool.get(account_id))
+    except InvalidAccount as e:
+        return jsonify({"error": str(e)}), 400
+    return None
 
-@app.route('/pause', methods=['POST'])
-def pause_track():
+@app.after_request
+def record_request_metrics(response):
+    timing = current_request_timing.get()
+    if timing is None:
+        return response
+    current_request_timing.set(None)
+    elapsed = time.perf_counter() - timing.started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    http_requests_total.inc(route, request.method, str(response.status_code))
+    http_request_duration_seconds.observe(elapsed, route)
+    if response.status_code >= 500:
+        http_request_errors_total.inc(route)
+    duration_ms = round(elapsed * 1000, 3)
+    logger.info(f"{request.method} {request.path} {response.status_code} ({duration_ms} ms)",
+                extra={"duration_ms": duration_ms})
+    response.headers['X-Request-ID'] = current_request_id.get()
+
+    if request_timing_hooks or REQUEST_TIMING:
+        upstream_seconds = sum(seconds for _, seconds in timing.upstream_calls)
+        breakdown = {
+            "route": route,
+            "method": request.method,
+            "status": response.status_code,
+            "total_ms": duration_ms,
+            "scheduler_wait_ms": round(timing.scheduler_wait * 1000, 3),
+            "upstream_ms": round(upstream_seconds * 1000, 3),
+            "server_ms": round((elapsed - upstream_seconds - timing.scheduler_wait) * 1000, 3),
+            "upstream_calls": [{"operation": operation, "ms": round(seconds * 1000, 3)}
+                               for operation, seconds in timing.upstream_calls]
+        }
+        for hook in request_timing_hooks:
+            try:
+                hook(breakdown)
+            except Exception as e:
+                logger.error(f"Error in request timing hook: {str(e)}")
+        if REQUEST_TIMING:
+            response.headers['Server-Timing'] = (
+                f"total;dur={breakdown['total_ms']}, upstream;dur={breakdown['upstream_ms']}, "
+                f"queue;dur={breakdown['scheduler_wait_ms']}"
+            )
+    current_request_id.set(None)
+    current_account.set(None)
+    return response
+
+metrics_registry.gauge(
+    'spotify_scheduler_queue_depth', 'Spotify calls waiting for rate limit budget', ('priority',),
+    lambda: {(name,): depth for name, depth in scheduler.stats()['queue_depth'].items()})
+metrics_registry.callback_counter(
+    'search_cache_events_total', 'Search cache hits, misses and evictions', ('event',),
+    lambda: {(event,): search_cache.stats()[event] for event in ('hits', 'misses', 'evictions')})
+metrics_registry.gauge(
+    'spotify_accounts', 'Pooled accounts in memory', (),
+    lambda: {(): account_pool.stats()['active']})
+metrics_registry.callback_counter(
+    'spotify_accounts_loaded_total', 'Accounts loaded into the pool', (),
+    lambda: {(): account_pool.stats()['loaded']})
+metrics_registry.callback_counter(
+    'spotify_accounts_evicted_total', 'Accounts evicted from the pool', (),
+    lambda: {(): account_pool.stats()['evicted']})
+metrics_registry.gauge(
+    'playback_stream_subscribers', 'Clients subscribed to /stream', (),
+    lambda: {(): playback_streams.stats()['subscribers']})
+metrics_registry.callback_counter(
+    'spotify_connections_total', 'Upstream requests and whether they opened a new connection', ('kind',),
+    lambda: {(kind,): connection_counters.stats()[kind] for kind in ('requests', 'new_connections', 'reused_connections')})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics_registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    logger.info("Health check endpoint called")
+    return jsonify(liveness_report())
+
+@app.route('/ready', methods=['GET'])
+def readiness():
+    logger.info("Readiness endpoint called")
+    result = readiness_check.check()
+    return jsonify(result), 200 if result['ready'] else 503
+
+# Playback stream settings
+STREAM_POLL_INTERVAL = float(os.getenv('STREAM_POLL_INTERVAL', '5'))
+STREAM_PAUSED_POLL_INTERVAL = float(os.getenv('STREAM_PAUSED_POLL_INTERVAL', '15'))
+STREAM_MIN_POLL_INTERVAL = float(os.getenv('STREAM_MIN_POLL_INTERVAL', '1'))
+STREAM_SEEK_TOLERANCE_MS = int(os.getenv('STREAM_SEEK_TOLERANCE_MS', '3000'))
+STREAM_KEEPALIVE_INTERVAL = float(os.getenv('STREAM_KEEPALIVE_INTERVAL', '15'))
+STREAM_SUBSCRIBER_BUFFER = int(os.getenv('STREAM_SUBSCRIBER_BUFFER', '100'))
+# Delay before polling after a local playback command, so Spotify has applied it
+STREAM_COMMAND_SETTLE = 0.5
+
+class Subscription:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=STREAM_SUBSCRIBER_BUFFER)
+        self.closed = False
+
+def playback_event(kind, state):
+    item = state.get('item') if state else None
+    data = {
+        "event": kind,
+        "is_playing": bool(state and state.get('is_playing')),
+        "progress_ms": state.get('progress_ms') if state else None,
+        "track": {
+            "name": item['name'],
+            "artist": item['artists'][0]['name'] if item.get('artists') else None,
+            "uri": item['uri'],
+            "duration_ms": item.get('duration_ms')
+        } if item else None
+    }
+    return f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+
+class PlaybackPoller:
+    """Polls one account's playback and publishes what changed to subscribers.
+
+    Polls every STREAM_POLL_INTERVAL seconds while playing, just after the
+    current track should end if that is sooner, and every
+    STREAM_PAUSED_POLL_INTERVAL seconds while paused. Runs only while
+    someone is subscribed. Events are `snapshot` (sent on subscribe),
+    `track`, `pause`, `resume` and `seek`.
+    """
+
+    def __init__(self, account, snapshot):
+        self.account = account
+        self.snapshot = snapshot
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._subscribers = set()
+        self._thread = None
+        self._next_poll = 0.0
+        self._polled = False
+        self._state = None
+        self._seen_at = 0.0
+        self.polls = 0
+        self.events = 0
+        self.errors = 0
+
+    def subscribe(self):
+        subscription = Subscription()
+        with self._lock:
+            self._subscribers.add(subscription)
+            if self._polled:
+                subscription.queue.put_nowait(playback_event('snapshot', self.snapshot._extrapolate(
+                    self._state, self._seen_at)))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+        self._wakeup.set()
+
+    def poll_soon(self):
+        with self._lock:
+            self._next_poll = min(self._next_poll, time.monotonic() + STREAM_COMMAND_SETTLE)
+        self._wakeup.set()
+
+    def close(self):
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, set()
+        for subscription in subscribers:
+            subscription.closed = True
+            try:
+                subscription.queue.put_nowait(None)
+            except queue.Full:
+                pass
+        self._wakeup.set()
+
+    def _run(self):
+        current_account.set(self.account)
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    self._polled = False
+                    return
+            try:
+                state = self.snapshot.get(force=True)
+                self.polls += 1
+                self._publish(self._diff(state))
+                delay = self._next_delay(state)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error polling playback for stream: {str(e)}")
+                delay = STREAM_PAUSED_POLL_INTERVAL
+            self._sleep(delay)
+
+    def _sleep(self, delay):
+        with self._lock:
+            self._next_poll = time.monotonic() + delay
+        while True:
+            with self._lock:
+                remaining = self._next_poll - time.monotonic()
+                if remaining <= 0 or not self._subscribers:
+                    return
+            self._wakeup.wait(remaining)
+            self._wakeup.clear()
+
+    def _next_delay(self, state):
+        if not state or not state.get('is_playing') or not state.get('item'):
+            return STREAM_PAUSED_POLL_INTERVAL
+        remaining = ((state['item'].get('duration_ms') or 0) - (state.get('progress_ms') or 0)) / 1000.0
+        return max(STREAM_MIN_POLL_INTERVAL, min(STREAM_POLL_INTERVAL, remaining + STREAM_COMMAND_SETTLE))
+
+    def _diff(self, state):
+        now = time.monotonic()
+        with self._lock:
+            previous, previous_at, first = self._state, self._seen_at, not self._polled
+            self._state, self._seen_at, self._polled = state, now, True
+        if first:
+            return [playback_event('snapshot', state)]
+        previous_uri = previous['item']['uri'] if previous and previous.get('item') else None
+        uri = state['item']['uri'] if state and state.get('item') else None
+        if uri != previous_uri:
+            return [playback_event('track', state)]
+        if not state or not previous:
+            return []
+        events = []
+        if bool(state.get('is_playing')) != bool(previous.get('is_playing')):
+            events.append(playback_event('resume' if state.get('is_playing') else 'pause', state))
+        expected_ms = previous.get('progress_ms') or 0
+        if previous.get('is_playing'):
+            expected_ms += (now - previous_at) * 1000
+        if abs((state.get('progress_ms') or 0) - expected_ms) > STREAM_SEEK_TOLERANCE_MS:
+            events.append(playback_event('seek', state))
+        return events
+
+    def _publish(self, events):
+        if not events:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            for event in events:
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    # A subscriber this far behind is dropped rather than slowing the others
+                    subscription.closed = True
+                    self.unsubscribe(subscription)
+                    break
+        self.events += len(events)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "running": self._thread is not None,
+                    "polls": self.polls, "events": self.events, "errors": self.errors}
+
+class PlaybackStreams:
+    """One PlaybackPoller per account, created on first subscription."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pollers = {}
+
+    def poller(self, account):
+        key = account.account_id if account else None
+        with self._lock:
+            poller = self._pollers.get(key)
+            # An evicted and reloaded account is a new object with its own snapshot
+            if poller is None or poller.account is not account:
+                snapshot = account.playback_snapshot if account else playback_snapshot
+                poller = self._pollers[key] = PlaybackPoller(account, snapshot)
+            return poller
+
+    def poll_soon(self, account):
+        with self._lock:
+            poller = self._pollers.get(account.account_id if account else None)
+        if poller:
+            poller.poll_soon()
+
+    def close_all(self):
+        with self._lock:
+            pollers = list(self._pollers.values())
+        for poller in pollers:
+            poller.close()
+
+    def stats(self):
+        with self._lock:
+            pollers = [poller.stats() for poller in self._pollers.values()]
+        return {
+            "pollers_running": sum(1 for stats in pollers if stats['running']),
+            "subscribers": sum(stats['subscribers'] for stats in pollers),
+            "polls": sum(stats['polls'] for stats in pollers),
+            "events": sum(stats['events'] for stats in pollers)
+        }
+
+playback_streams = PlaybackStreams()
+
+def playback_changed():
+    """Drop the cached playback state after a command and let streams catch up."""
+    current_playback_snapshot().invalidate()
+    playback_streams.poll_soon(current_account.get())
+
+# Playback operations shared by the HTTP routes and the MCP stdio transport.
+# Each returns a (payload, status_code) pair.
+def ensure_spotify():
+    account = current_account.get()
+    if account:
+        return account.is_authenticated()
+    if not sp:
+        initialize_in_background().join(SPOTIFY_INIT_WAIT)
+    return sp is not None
+
+# Playback command pipeline settings
+COMMAND_COALESCE_WINDOW = float(os.getenv('COMMAND_COALESCE_WINDOW', '0.05'))
+COMMAND_QUEUE_JUMP_MIN = int(os.getenv('COMMAND_QUEUE_JUMP_MIN', '3'))
+COMMAND_TIMEOUT = float(os.getenv('COMMAND_TIMEOUT', '30'))
+
+COMMAND_MESSAGES = {
+    'play': "Track started playing",
+    'resume': "Playback resumed",
+    'pause': "Playback paused",
+    'next': "Skipped to next track",
+    'previous': "Skipped to previous track"
+}
+
+class PlaybackCommand:
+    def __init__(self, name, track_uri=None, device_id=None):
+        self.name = name
+        self.track_uri = track_uri
+        self.device_id = device_id
+        self.done = threading.Event()
+        self.error = None
+        self.coalesced = False
+
+class CommandStep:
+    """One Spotify action in a merged plan, and the commands it answers."""
+
+    def __init__(self, command, commands=()):
+        self.name = command.name
+        self.track_uri = command.track_uri
+        self.device_id = command.device_id
+        self.count = 1
+        self.commands = list(commands) + [command]
+
+def plan_commands(commands):
+    """Merge a burst of commands into the fewest steps with the same end result.
+
+    Playing a track supersedes everything before it and absorbs a resume
+    after it. A run of next (or previous) becomes one skip by N. A run of
+    pause and resume becomes its last command; at run time it is dropped
+    if playback is already in that state. Commands for different devices
+    are only merged by a later play.
+    """
+    plan = []
+    for command in commands:
+        last = plan[-1] if plan and plan[-1].device_id == command.device_id else None
+        if command.name == 'play':
+            plan = [CommandStep(command, [queued for step in plan for queued in step.commands])]
+        elif last and command.name in ('next', 'previous') and last.name == command.name:
+            last.count += 1
+            last.commands.append(command)
+        elif last and command.name in ('pause', 'resume') and last.name in ('pause', 'resume'):
+            last.name = command.name
+            last.commands.append(command)
+        elif last and command.name == 'resume' and last.name == 'play':
+            last.commands.append(command)
+        else:
+            plan.append(CommandStep(command))
+    return plan
+
+def playback_is_playing():
+    state = current_playback_snapshot().get()
+    return bool(state and state.get('is_playing'))
+
+def is_no_active_device(error):
+    return (isinstance(error, SpotifyException) and error.http_status == 404
+            and (error.reason == 'NO_ACTIVE_DEVICE' or 'no active device' in str(error.msg).lower()))
+
+def start_playback(device_id=None, **kwargs):
+    """start_playback that moves playback to the last used device when none is active."""
     try:
-        logger.info("Pause track endpoint called")
-        if not sp:
-            if not initialize_spotify():
-                return jsonify({"error": "Spotify client not initialized"}), 500
-        
-        sp.pause_playback()
-        return jsonify({"status": "success", "message": "Playback paused"})
-    except Exception as e:
-        logger.error(f"Error pausing track: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        call_spotify('start_playback', device_id=device_id, **kwargs)
+        return
+    except SpotifyException as e:
+        registry = current_device_registry()
+        fallback = registry.fallback_device() if not device_id and is_no_active_device(e) else None
+        if not fallback:
+            raise
+    logger.info(f"No active device, starting playback on device {fallback}")
+    call_spotify('start_playback', device_id=fallback, **kwargs)
+    registry.fallbacks += 1
+    registry.note_used(fallback)
 
-@app.route('/next', methods=['POST'])
-def next_track():
+def jump_ahead(count, device_id=None):
+    """Skip `count` tracks with one start_playback at the target's position in
+    the current album or playlist. Returns False if that isn't possible."""
+    context = (current_playback_snapshot().get() or {}).get('context') or {}
+    if context.get('type') not in ('album', 'playlist'):
+        return False
+    upcoming = (call_spotify('queue') or {}).get('queue') or []
+    if len(upcoming) < count or not upcoming[count - 1]:
+        return False
+    call_spotify('start_playback', device_id=device_id, context_uri=context['uri'],
+                 offset={"uri": upcoming[count - 1]['uri']})
+    return True
+
+def repeat_call(operation, count, device_id=None):
+    # One at a time: concurrent skips can be applied to the same current track and land fewer than `count`
+    for _ in range(count):
+        call_spotify(operation, device_id=device_id)
+
+def run_step(step):
+    """Send one planned step to Spotify; returns False if nothing had to be sent."""
+    if step.name == 'play':
+        start_playback(step.device_id, uris=[step.track_uri])
+    elif step.name == 'resume':
+        if len(step.commands) > 1 and playback_is_playing():
+            return False
+        start_playback(step.device_id)
+    elif step.name == 'pause':
+        if len(step.commands) > 1 and not playback_is_playing():
+            return False
+        call_spotify('pause_playback', device_id=step.device_id)
+    elif step.name == 'next':
+        jumped = False
+        if step.count >= COMMAND_QUEUE_JUMP_MIN:
+            try:
+                jumped = jump_ahead(step.count, step.device_id)
+            except SpotifyException as e:
+                logger.warning(f"Could not jump ahead {step.count} tracks, skipping one at a time: {str(e)}")
+        if not jumped:
+            repeat_call('next_track', step.count, step.device_id)
+    else:
+        repeat_call('previous_track', step.count, step.device_id)
+    if step.device_id:
+        current_device_registry().note_used(step.device_id)
+    return True
+
+class CommandPipeline:
+    """Runs one account's playback commands in arrival order, merging bursts.
+
+    The first command of a burst waits COMMAND_COALESCE_WINDOW for others
+    to join it; commands arriving while a batch is being sent form the next
+    batch. The worker thread runs only while commands are pending.
+    """
+
+    def __init__(self, account):
+        self.account = account
+        self._lock = threading.Lock()
+        self._pending = []
+        self._thread = None
+        self.received = 0
+        self.batches = 0
+        self.steps = 0
+        self.skipped_steps = 0
+        self.errors = 0
+
+    def submit(self, command):
+        """Queue `command` and wait for its outcome; False if it timed out unsent."""
+        with self._lock:
+            self._pending.append(command)
+            self.received += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        if command.done.wait(COMMAND_TIMEOUT):
+            return True
+        with self._lock:
+            if command in self._pending:
+                self._pending.remove(command)
+                return False
+        # Already being sent; its Spotify calls are bounded by their own timeouts
+        command.done.wait()
+        return True
+
+    def _run(self):
+        current_account.set(self.account)
+        if COMMAND_COALESCE_WINDOW > 0:
+            time.sleep(COMMAND_COALESCE_WINDOW)
+        while True:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                if not batch:
+                    self._thread = None
+                    return
+            self._execute(batch)
+
+    def _execute(self, batch):
+        plan = plan_commands(batch)
+        self.batches += 1
+        if len(plan) < len(batch):
+            logger.info(f"Merged {len(batch)} playback commands into {len(plan)}: "
+                        f"{', '.join(step.name + (f' x{step.count}' if step.count > 1 else '') for step in plan)}")
+        for step in plan:
+            error = None
+            try:
+                if run_step(step):
+                    self.steps += 1
+                    playback_changed()
+                else:
+                    self.skipped_steps += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error sending {step.name} command: {str(e)}")
+                error = e
+            for command in step.commands:
+                command.error = error
+                command.coalesced = len(step.commands) > 1
+                command.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": self._thread is not None,
+                "pending": len(self._pending),
+                "received": self.received,
+                "batches": self.batches,
+                "steps": self.steps,
+                "skipped_steps": self.skipped_steps,
+                "errors": self.errors
+            }
+
+class CommandPipelines:
+    """One CommandPipeline per account, created on first command."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pipelines = {}
+
+    def pipeline(self, account):
+        key = account.account_id if account else None
+        with self._lock:
+            pipeline = self._pipelines.get(key)
+            if pipeline is None or pipeline.account is not account:
+                pipeline = self._pipelines[key] = CommandPipeline(account)
+            return pipeline
+
+    def stats(self):
+        with self._lock:
+            pipelines = [pipeline.stats() for pipeline in self._pipelines.values()]
+        totals = {name: sum(stats[name] for stats in pipelines)
+                  for name in ("pending", "received", "batches", "steps", "skipped_steps", "errors")}
+        return dict(totals, pipelines=len(pipelines))
+
+command_pipelines = CommandPipelines()
+
+def playback_command_operation(name, track_uri=None, device=None):
     try:
-        logger.info("Next track endpoint called")
-        if not sp:
-            if not initialize_spotify():
-                return jsonify({"error": "Spotify client not initialized"}), 500
-        
-        sp.next_track()
-        return jsonify({"status": "success", "message": "Skipped to next track"})
+        if not ensure_spotify():
+            return {"error": "Spotify client not initialized"}, 500
+
+        if device is not None and not isinstance(device, str):
+            return {"error": "device_id and device must be strings"}, 400
+        try:
+            device_id = current_device_registry().resolve(device) if device else None
+        except UnknownDevice as e:
+            return {"error": str(e)}, 404
+        command = PlaybackCommand(name, track_uri, device_id)
+        if not command_pipelines.pipeline(current_account.get()).submit(command):
+            return {"error": "Timed out waiting for earlier playback commands"}, 504
+        if command.error:
+            return upstream_error(command.error)
+        payload = {"status": "success", "message": COMMAND_MESSAGES[name]}
+        if command.coalesced:
+            payload["coalesced"] = True
+        return payload, 200
     except Exception as e:
-        logger.error(f"Error skipping to next track: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        logger.error(f"Error running {name} command: {str(e)}")
+        return upstream_error(e)
 
-@app.route('/previous', methods=['POST'])
-def previous_track():
+def play_operation(track_uri=None, device=None):
+    if not track_uri:
+        logger.info("Resuming playback")
+        return playback_command_operation('resume', device=device)
+    logger.info(f"Playing track: {track_uri}")
+    return playback_command_operation('play', track_uri, device)
+
+def pause_operation(device=None):
+    return playback_command_operation('pause', device=device)
+
+def next_operation(device=None):
+    return playback_command_operation('next', device=device)
+
+def previous_operation(device=None):
+    return playback_command_operation('previous', device=device)
+
+def devices_operation(refresh=False):
     try:
-        logger.info("Previous track endpoint called")
-        if not sp:
-            if not initialize_spotify():
-                return jsonify({"error": "Spotify client not initialized"}), 500
-        
-        sp.previous_track()
-        return jsonify({"status": "success", "message": "Skipped to previous track"})
+        if not ensure_spotify():
+            return {"error": "Spotify client not initialized"}, 500
+
+        registry = current_device_registry()
+        devices = registry.fetch() if refresh else registry.devices()
+        return {"devices": devices, "last_used": registry.last_used}, 200
     except Exception as e:
-        logger.error(f"Error skipping to previous track: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        logger.error(f"Error getting devices: {str(e)}")
+        return upstream_error(e)
 
-@app.route('/current_track', methods=['GET'])
-def get_current_track():
+def current_track_operation():
     try:
-        logger.info("Current track endpoint called")
-        if not sp:
-            if not initialize_spotify():
-                return jsonify({"error": "Spotify client not initialized"}), 500
+        if not ensure_spotify():
+            return {"error": "Spotify client not initialized"}, 500
         
-        current_playback = sp.current_playback()
+        current_playback = current_playback_snapshot().get()
         if current_playback and current_playback['item']:
             track = current_playback['item']
-            return jsonify({
+            return {
                 "name": track['name'],
                 "artist": track['artists'][0]['name'],
                 "uri": track['uri'],
                 "progress_ms": current_playback['progress_ms'],
                 "duration_ms": track['duration_ms']
-            })
+            }, 200
         logger.warning("No track currently playing")
-        return jsonify({"error": "No track currently playing"}), 404
+        return {"error": "No track currently playing"}, 404
     except Exception as e:
         logger.error(f"Error getting current track: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        return upstream_error(e)
 
-@app.route('/search', methods=['GET'])
-def search_tracks():
+def search_operation(query=None, bypass_cache=False, source=None, limit=None, offset=None, types=None, fields=None):
     try:
-        logger.info("Search tracks endpoint called")
-        if not sp:
-            if not initialize_spotify():
-                return jsonify({"error": "Spotify client not initialized"}), 500
-        
-        query = request.args.get('q')
         if not query:
             logger.warning("No search query provided")
-            return jsonify({"error": "No search query provided"}), 400
+            return {"error": "No search query provided"}, 400
+        
+        source = source or SEARCH_SOURCE
+        if source not in SEARCH_SOURCES:
+            return {"error": f"Unknown search source: {source}"}, 400
+        try:
+            types = parse_search_types(types)
+            limit = parse_search_int(limit, SEARCH_DEFAULT_LIMIT, 'limit', 1, SEARCH_MAX_LIMIT)
+            offset = parse_search_int(offset, 0, 'offset', 0, SEARCH_MAX_OFFSET)
+            fields = parse_search_fields(fields)
+        except InvalidSearch as e:
+            return {"error": str(e)}, 400
             
-        logger.info(f"Searching for: {query}")
-        results = sp.search(q=query, type='track', limit=5)
-        tracks = []
-        for track in results['tracks']['items']:
-            tracks.append({
-                "name": track['name'],
-                "artist": track['artists'][0]['name'],
-                "uri": track['uri']
-            })
-        return jsonify({"tracks": tracks})
+        page = None
+        if not bypass_cache:
+            page = search_cache.get(search_cache_key(query, types, limit, offset))
+            if page is not None:
+                logger.info(f"Search cache hit for: {query}")
+        
+        # The local index only knows track summaries, so it can only answer first-page track searches
+        local_fields = all(field in LOCAL_SEARCH_FIELDS for field in fields or ())
+        local_search = types == ['track'] and offset == 0 and local_fields
+        if page is None and source != 'upstream' and track_index and local_search:
+            matches = track_index.search(query, limit=limit)
+            confident = [track for track, confidence in matches if confidence >= LOCAL_SEARCH_MIN_CONFIDENCE]
+            # In auto mode only a full page is answered locally; Spotify would have more results otherwise
+            if len(confident) >= limit or source == 'local':
+                logger.info(f"Answered search from local index: {query}")
+                tracks = [{field: lookup_path(track, field) for field in fields} for track in confident] \
+                    if fields else confident
+                return {"tracks": tracks, "source": "local",
+                        "next_offset": next_search_offset({"tracks": confident}, limit, offset)}, 200
+        elif page is None and source == 'local':
+            if not track_index:
+                return {"error": "Local track index is disabled"}, 400
+            if not local_fields:
+                return {"error": f"Local search can only return the fields {', '.join(LOCAL_SEARCH_FIELDS)}"}, 400
+            return {"error": "Local search only supports the first page of track results"}, 400
+        
+        if page is None:
+            if not ensure_spotify():
+                return {"error": "Spotify client not initialized"}, 500
+            page = fetch_search_page(query, types, limit, offset, use_cache=False)
+        payload = shape_search_page(page, fields)
+        payload["next_offset"] = next_search_offset(page, limit, offset)
+        return payload, 200
     except Exception as e:
         logger.error(f"Error searching tracks: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        return upstream_error(e)
+
+def wants_ndjson(headers, args):
+    return args.get('format', '').lower() == 'ndjson' or 'application/x-ndjson' in headers.get('Accept', '')
+
+def stream_search(query, args, bypass_cache):
+    """NDJSON response with one result per line, across as many pages as needed.
+
+    Each following page is fetched in the background while the current one
+    is written out. Returns a (payload, status) pair if the search can't
+    start.
+    """
+    if not query:
+        return {"error": "No search query provided"}, 400
+    try:
+        types = parse_search_types(args.get('type'))
+        limit = parse_search_int(args.get('limit'), SEARCH_MAX_LIMIT, 'limit', 1, SEARCH_MAX_LIMIT)
+        offset = parse_search_int(args.get('offset'), 0, 'offset', 0, SEARCH_MAX_OFFSET)
+        max_results = parse_search_int(args.get('max_results'), SEARCH_STREAM_MAX_RESULTS, 'max_results',
+                                       1, SEARCH_STREAM_MAX_RESULTS)
+        fields = parse_search_fields(args.get('fields'))
+    except InvalidSearch as e:
+        return {"error": str(e)}, 400
+    if not ensure_spotify():
+        return {"error": "Spotify client not initialized"}, 500
+    try:
+        first_page = fetch_search_page(query, types, limit, offset, use_cache=not bypass_cache)
+    except Exception as e:
+        logger.error(f"Error searching tracks: {str(e)}")
+        return upstream_error(e)
+
+    # The body is generated after the request context (and its account) is gone
+    @with_account
+    def fetch(page_offset):
+        return fetch_search_page(query, types, limit, page_offset, use_cache=not bypass_cache)
+
+    def lines():
+        page, page_offset, sent, prefetch = first_page, offset, 0, None
+        try:
+            while True:
+                following = next_search_offset(page, limit, page_offset)
+                if following is not None and sent + sum(len(items) for items in page.values()) < max_results:
+                    prefetch = search_prefetch_executor.submit(fetch, following)
+                else:
+                    prefetch = None
+                for search_type, items in shape_search_page(page, fields).items():
+                    for item in items:
+                        if sent >= max_results:
+                            return
+                        sent += 1
+                        yield json.dumps(dict(item, type=search_type[:-1])) + '\n'
+                if prefetch is None:
+                    return
+                try:
+                    page, page_offset = prefetch.result(), following
+                except Exception as e:
+                    logger.error(f"Error fetching search page: {str(e)}")
+                    yield json.dumps({"error": str(e)}) + '\n'
+                    return
+        finally:
+            if prefetch is not None:
+                prefetch.cancel()
+
+    return Response(lines(), mimetype='application/x-ndjson'), 200
+
+def metadata_operation(ids=None, metadata_type=None, fields=None, bypass_cache=False):
+    try:
+        try:
+            refs = parse_metadata_refs(ids, metadata_type)
+        except InvalidMetadataRequest as e:
+            return {"error": str(e)}, 400
+        fields = parse_search_fields(fields)
+
+        found = {}
+        missing = {}
+        for ref in dict.fromkeys(refs):
+            item = None if bypass_cache else metadata_cache.get(ref)
+            if item is not None:
+                found[ref] = item
+            else:
+                missing.setdefault(ref[0], []).append(ref[1])
+        if missing:
+            if not ensure_spotify():
+                return {"error": "Spotify client not initialized"}, 500
+            logger.info(f"Looking up metadata for {sum(len(ids) for ids in missing.values())} of {len(refs)} IDs")
+            found.update(fetch_metadata(missing))
+
+        items = []
+        for ref in refs:
+            item = found[ref]
+            if item is not None and fields:
+                item = {field: lookup_path(item, field) for field in fields}
+            items.append(item)
+        return {
+            "items": items,
+            "not_found": [f"spotify:{ref[0]}:{ref[1]}" for ref in dict.fromkeys(refs) if found[ref] is None]
+        }, 200
+    except Exception as e:
+        logger.error(f"Error looking up metadata: {str(e)}")
+        return upstream_error(e)
+
+# Library export settings; Spotify caps these listings at 50 per page, playlist items at 100
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', '4'))
+EXPORT_PAGE_SIZE = 50
+EXPORT_PLAYLIST_PAGE_SIZE = 100
+
+# Fetches export pages; shared by all exports so their combined concurrency stays bounded
+export_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix='export')
+
+def ordered_map(function, tasks):
+    """Yield (task, function(task)) for each task, in order, computed on the export pool.
+
+    Tasks are consumed lazily and at most twice EXPORT_WORKERS results are
+    pending at once, so a slow client holds back fetching instead of
+    buffering the whole export.
+    """
+    pending = deque()
+    try:
+        for task in tasks:
+            pending.append((task, export_executor.submit(function, task)))
+            if len(pending) >= EXPORT_WORKERS * 2:
+                task, future = pending.popleft()
+                yield task, future.result()
+        while pending:
+            task, future = pending.popleft()
+            yield task, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+def page_offsets(total, page_size, start=0):
+    return range(start, total, page_size)
+
+def export_line(kind, **fields):
+    return json.dumps(dict(fields, type=kind)) + '\n'
+
+def export_saved_tracks():
+    """NDJSON stream of the user's saved tracks, newest first.
+
+    The first page gives the total; the remaining pages are fetched
+    concurrently. Returns a (payload, status) pair if the export can't start.
+    """
+    if not ensure_spotify():
+        return {"error": "Spotify client not initialized"}, 500
+    def fetch_page(offset):
+        return call_spotify('current_user_saved_tracks', limit=EXPORT_PAGE_SIZE, offset=offset)
+
+    try:
+        first_page = fetch_page(0)
+    except Exception as e:
+        logger.error(f"Error exporting saved tracks: {str(e)}")
+        return upstream_error(e)
+    total = first_page.get('total') or 0
+    logger.info(f"Exporting {total} saved tracks")
+
+    def pages():
+        yield 0, first_page
+        yield from ordered_map(with_account(fetch_page), page_offsets(total, EXPORT_PAGE_SIZE, EXPORT_PAGE_SIZE))
+
+    def lines():
+        sent = 0
+        try:
+            for offset, page in pages():
+                entries = page.get('items') or []
+                index_tracks([entry['track'] for entry in entries if entry.get('track')])
+                for position, entry in enumerate(entries, offset):
+                    if entry.get('track'):
+                        sent += 1
+                        yield export_line('saved_track', position=position, added_at=entry.get('added_at'),
+                                          track=slim_item(entry['track']))
+        except Exception as e:
+            logger.error(f"Error exporting saved tracks: {str(e)}")
+            yield json.dumps({"error": str(e)}) + '\n'
+            return
+        yield export_line('done', saved_tracks=sent)
+
+    return Response(lines(), mimetype='application/x-ndjson'), 200
+
+def export_playlists(known_snapshots=None):
+    """NDJSON stream of the user's playlists, each followed by its items.
+
+    Playlists whose snapshot_id is in `known_snapshots` are unchanged since
+    the caller's last export; only their header line is sent. Item pages of
+    all changed playlists go through one concurrent, ordered pipeline.
+    Returns a (payload, status) pair if the export can't start.
+    """
+    if known_snapshots is not None and not isinstance(known_snapshots, dict):
+        return {"error": "snapshots must map playlist IDs to snapshot IDs"}, 400
+    known_snapshots = known_snapshots or {}
+    if not ensure_spotify():
+        return {"error": "Spotify client not initialized"}, 500
+    def fetch_listing(offset):
+        return call_spotify('current_user_playlists', limit=EXPORT_PAGE_SIZE, offset=offset)
+
+    try:
+        first_page = fetch_listing(0)
+    except Exception as e:
+        logger.error(f"Error exporting playlists: {str(e)}")
+        return upstream_error(e)
+    total = first_page.get('total') or 0
+    logger.info(f"Exporting {total} playlists ({len(known_snapshots)} snapshots known)")
+
+    def playlists():
+        yield from first_page.get('items') or []
+        for _, page in ordered_map(with_account(fetch_listing), page_offsets(total, EXPORT_PAGE_SIZE, EXPORT_PAGE_SIZE)):
+            yield from page.get('items') or []
+
+    def tasks():
+        # One (playlist, offset) per item page, planned from the listing's track count.
+        # A playlist edited mid-export reports a new snapshot_id next time and is exported again.
+        for playlist in playlists():
+            if not playlist:
+                continue
+            unchanged = known_snapshots.get(playlist['id']) == playlist.get('snapshot_id')
+            item_total = (playlist.get('tracks') or {}).get('total') or 0
+            if unchanged or not item_total:
+                yield playlist, unchanged, None
+            for offset in ([] if unchanged else page_offsets(item_total, EXPORT_PLAYLIST_PAGE_SIZE)):
+                yield playlist, False, offset
+
+    def fetch_items(task):
+        playlist, _, offset = task
+        if offset is None:
+            return None
+        return call_spotify('playlist_items', playlist['id'], limit=EXPORT_PLAYLIST_PAGE_SIZE, offset=offset,
+                            additional_types=('track',))
+
+    def lines():
+        counts = {"playlists": 0, "unchanged": 0, "items": 0}
+        try:
+            for (playlist, unchanged, offset), page in ordered_map(with_account(fetch_items), tasks()):
+                if offset in (None, 0):
+                    counts["playlists"] += 1
+                    counts["unchanged"] += unchanged
+                    yield export_line('playlist', id=playlist['id'], name=playlist.get('name'),
+                                      owner=(playlist.get('owner') or {}).get('id'),
+                                      snapshot_id=playlist.get('snapshot_id'),
+                                      tracks=(playlist.get('tracks') or {}).get('total'), unchanged=unchanged)
+                if page is None:
+                    continue
+                entries = page.get('items') or []
+                index_tracks([entry['track'] for entry in entries
+                              if (entry.get('track') or {}).get('type') == 'track'])
+                for position, entry in enumerate(entries, offset):
+                    if entry.get('track'):
+                        counts["items"] += 1
+                        yield export_line('playlist_item', playlist_id=playlist['id'], position=position,
+                                          added_at=entry.get('added_at'), track=slim_item(entry['track']))
+        except Exception as e:
+            logger.error(f"Error exporting playlists: {str(e)}")
+            yield json.dumps({"error": str(e)}) + '\n'
+            return
+        yield export_line('done', **counts)
+
+    return Response(lines(), mimetype='application/x-ndjson'), 200
+
+# Operations by name, for callers that dispatch on a name plus an argument dict
+OPERATIONS = {
+    "play": lambda args: play_operation(args.get('track_uri'), args.get('device_id') or args.get('device')),
+    "pause": lambda args: pause_operation(args.get('device_id') or args.get('device')),
+    "next": lambda args: next_operation(args.get('device_id') or args.get('device')),
+    "previous": lambda args: previous_operation(args.get('device_id') or args.get('device')),
+    "devices": lambda args: devices_operation(refresh=bool(args.get('no_cache'))),
+    "current_track": lambda args: current_track_operation(),
+    "search": lambda args: search_operation(args.get('query'), bypass_cache=bool(args.get('no_cache')),
+                                            source=args.get('source'), limit=args.get('limit'),
+                                            offset=args.get('offset'), types=args.get('types'),
+                                            fields=args.get('fields')),
+    "metadata": lambda args: metadata_operation(args.get('ids'), metadata_type=args.get('type'),
+                                                fields=args.get('fields'), bypass_cache=bool(args.get('no_cache')))
+}
+
+BATCH_MAX_OPERATIONS = int(os.getenv('BATCH_MAX_OPERATIONS', '20'))
+
+class UnresolvedReference(Exception):
+    pass
+
+def resolve_reference(value, results):
+    # "$0.tracks.0.uri" reads tracks[0].uri from the result of step 0
+    if isinstance(value, list):
+        return [resolve_reference(item, results) for item in value]
+    if not isinstance(value, str) or not value.startswith('$'):
+        return value
+    parts = value[1:].split('.')
+    try:
+        current = results[int(parts[0])]
+        for part in parts[1:]:
+            current = current[int(part)] if isinstance(current, list) else current[part]
+    except (ValueError, IndexError, KeyError, TypeError):
+        raise UnresolvedReference(f"Could not resolve reference {value}")
+    return current
+
+def run_batch(operations, stop_on_error=True):
+    results = []
+    steps = []
+    failed = False
+    for index, operation in enumerate(operations):
+        name = operation.get('op') if isinstance(operation, dict) else None
+        if failed and stop_on_error:
+            steps.append({"op": name, "status": None, "skipped": True})
+            results.append(None)
+            continue
+        handler = OPERATIONS.get(name)
+        args = operation.get('args') if isinstance(operation, dict) else None
+        if not isinstance(operation, dict):
+            payload, status = {"error": "Each operation must be a JSON object"}, 400
+        elif handler is None:
+            payload, status = {"error": f"Unknown operation: {name}"}, 400
+        elif args is not None and not isinstance(args, dict):
+            payload, status = {"error": "Operation args must be a JSON object"}, 400
+        else:
+            try:
+                args = {key: resolve_reference(value, results)
+                        for key, value in (args or {}).items()}
+                payload, status = handler(args)
+            except UnresolvedReference as e:
+                payload, status = {"error": str(e)}, 400
+        steps.append({"op": name, "status": status, "result": payload})
+        results.append(payload)
+        failed = failed or status >= 400
+    return steps
+
+# Responses remembered for client retries that send the same Idempotency-Key
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', '600'))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '10000'))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+class IdempotencyKeys:
+    """Runs each client-keyed request once and replays its response to retries.
+
+    A retry arriving while the first attempt is still running waits for it.
+    5xx responses are not remembered, so a failed command can be retried.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.replayed = 0
+        self.conflicts = 0
+
+    def run(self, key, fingerprint, handler):
+        """Returns (payload, status, replayed)."""
+        while True:
+            with self._lock:
+                entry = self.store.get(key)
+                if entry is None and key not in self._in_flight:
+                    self._in_flight[key] = threading.Event()
+                    break
+                done = self._in_flight.get(key)
+            if entry is not None:
+                if entry['fingerprint'] != fingerprint:
+                    self.conflicts += 1
+                    return {"error": f"{IDEMPOTENCY_HEADER} was already used for a different request"}, 422, False
+                self.replayed += 1
+                return entry['payload'], entry['status'], True
+            done.wait(COMMAND_TIMEOUT)
+        try:
+            payload, status = handler()
+            if status < 500:
+                self.store.set(key, {"fingerprint": fingerprint, "payload": payload, "status": status})
+            return payload, status, False
+        finally:
+            with self._lock:
+                self._in_flight.pop(key).set()
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return dict(self.store.stats(), in_flight=in_flight, replayed=self.replayed, conflicts=self.conflicts)
+
+if CACHE_BACKEND == 'sqlite':
+    idempotency_keys = IdempotencyKeys(SQLiteCache(SHARED_CACHE_PATH, 'idempotency', IDEMPOTENCY_TTL,
+                                                   IDEMPOTENCY_MAX_ENTRIES))
+else:
+    idempotency_keys = IdempotencyKeys(TTLCache(IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_ENTRIES))
+
+def idempotent_response(handler):
+    """Run `handler` for the current request, honoring its Idempotency-Key."""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        payload, status = handler()
+        return jsonify(payload), status
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return jsonify({"error": f"{IDEMPOTENCY_HEADER} is longer than {IDEMPOTENCY_KEY_MAX_LENGTH} characters"}), 400
+    account = current_account.get()
+    # Keys are per account; the same key on another route or with another body is a client error
+    scoped_key = f"{account.account_id if account else ''}:{key}"
+    fingerprint = f"{request.method} {request.path} {json.dumps(request.get_json(silent=True), sort_keys=True)}"
+    payload, status, replayed = idempotency_keys.run(scoped_key, fingerprint, handler)
+    response = jsonify(payload)
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response, status
+
+class InvalidBody(Exception):
+    pass
+
+def request_body():
+    """The request's JSON object, or {} without a body; other JSON values raise InvalidBody."""
+    data = request.get_json(silent=True)
+    if data is None:
+        return {}
+    if not isinstance(data, dict):
+        raise InvalidBody("Request body must be a JSON object")
+    return data
+
+@app.errorhandler(InvalidBody)
+def invalid_body(error):
+    return jsonify({"error": str(error)}), 400
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    logger.info("Batch endpoint called")
+    data = request_body()
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "No operations provided"}), 400
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return jsonify({"error": f"At most {BATCH_MAX_OPERATIONS} operations per batch"}), 400
+    stop_on_error = data.get('stop_on_error', True)
+    if not isinstance(stop_on_error, bool):
+        return jsonify({"error": "stop_on_error must be true or false"}), 400
+    return idempotent_response(lambda: ({"results": run_batch(operations, stop_on_error=stop_on_error)}, 200))
+
+def requested_device():
+    data = request_body()
+    device = data.get('device_id') or data.get('device')
+    if device is not None and not isinstance(device, str):
+        raise InvalidBody("device_id and device must be strings")
+    return device
+
+@app.route('/play', methods=['POST'])
+def play_track():
+    logger.info("Play track endpoint called")
+    track_uri, device = request_body().get('track_uri'), requested_device()
+    return idempotent_response(lambda: play_operation(track_uri, device))
+
+@app.route('/pause', methods=['POST'])
+def pause_track():
+    logger.info("Pause track endpoint called")
+    device = requested_device()
+    return idempotent_response(lambda: pause_operation(device))
+
+@app.route('/next', methods=['POST'])
+def next_track():
+    logger.info("Next track endpoint called")
+    device = requested_device()
+    return idempotent_response(lambda: next_operation(device))
+
+@app.route('/previous', methods=['POST'])
+def previous_track():
+    logger.info("Previous track endpoint called")
+    device = requested_device()
+    return idempotent_response(lambda: previous_operation(device))
+
+@app.route('/devices', methods=['GET'])
+def get_devices():
+    logger.info("Devices endpoint called")
+    payload, status = devices_operation(refresh=cache_bypass_requested(request.headers, request.args))
+    return jsonify(payload), status
+
+@app.route('/current_track', methods=['GET'])
+def get_current_track():
+    logger.info("Current track endpoint called")
+    payload, status = current_track_operation()
+    return jsonify(payload), status
+
+@app.route('/search', methods=['GET'])
+def search_tracks():
+    logger.info("Search tracks endpoint called")
+    bypass_cache = cache_bypass_requested(request.headers, request.args)
+    if wants_ndjson(request.headers, request.args):
+        response, status = stream_search(request.args.get('q'), request.args, bypass_cache)
+        return (jsonify(response), status) if isinstance(response, dict) else response
+    payload, status = search_operation(request.args.get('q'), bypass_cache=bypass_cache,
+                                       source=request.args.get('source'), limit=request.args.get('limit'),
+                                       offset=request.args.get('offset'), types=request.args.get('type'),
+                                       fields=request.args.get('fields'))
+    return jsonify(payload), status
+
+@app.route('/metadata', methods=['GET', 'POST'])
+def get_metadata():
+    logger.info("Metadata endpoint called")
+    if request.method == 'POST':
+        data = request_body()
+        ids, metadata_type, fields = data.get('ids'), data.get('type'), data.get('fields')
+    else:
+        ids, metadata_type, fields = request.args.get('ids'), request.args.get('type'), request.args.get('fields')
+    payload, status = metadata_operation(ids, metadata_type=metadata_type, fields=fields,
+                                         bypass_cache=cache_bypass_requested(request.headers, request.args))
+    return jsonify(payload), status
+
+@app.route('/export/playlists', methods=['GET', 'POST'])
+def export_playlists_endpoint():
+    logger.info("Export playlists endpoint called")
+    data = request_body()
+    response, status = export_playlists(data.get('snapshots'))
+    return (jsonify(response), status) if isinstance(response, dict) else response
+
+@app.route('/export/saved_tracks', methods=['GET'])
+def export_saved_tracks_endpoint():
+    logger.info("Export saved tracks endpoint called")
+    response, status = export_saved_tracks()
+    return (jsonify(response), status) if isinstance(response, dict) else response
+
+@app.route('/stream', methods=['GET'])
+def stream_playback():
+    logger.info("Stream endpoint called")
+    if not ensure_spotify():
+        return jsonify({"error": "Spotify client not initialized"}), 500
+    poller = playback_streams.poller(current_account.get())
+    subscription = poller.subscribe()
+
+    def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = subscription.queue.get(timeout=STREAM_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    if subscription.closed:
+                        return
+                    # Comment line; also how a disconnected client is noticed
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            poller.unsubscribe(subscription)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/auth', methods=['GET'])
 def auth_page():
     try:
-        auth_url = auth_manager.get_authorize_url()
+        account = current_account.get()
+        if account:
+            auth_url = account.oauth.get_authorize_url(state=account.account_id)
+        else:
+            auth_url = (auth_manager or build_oauth(token_cache)).get_authorize_url()
         return f"""
         <!DOCTYPE html>
         <html>
@@ -298,6 +3180,142 @@ def auth_page():
         logger.error(f"Error generating auth page: {str(e)}")
         return f"Error: {str(e)}"
 
+startup_lock = threading.Lock()
+started = False
+
+def start():
+    """Set up logging, local stores and background threads; later calls do nothing.
+
+    Returns straight away: the Spotify client is initialized on a background
+    thread, so a missing or expired token never delays serving.
+    """
+    global log_listener, track_index, started
+    with startup_lock:
+        if started:
+            return
+        started = True
+        log_listener = configure_logging()
+        logger.info(f"Client ID available: {bool(SPOTIFY_CLIENT_ID)}")
+        logger.info(f"Client Secret available: {bool(SPOTIFY_CLIENT_SECRET)}")
+        if CACHE_BACKEND == 'sqlite':
+            os.makedirs(SHARED_CACHE_PATH + '.locks', exist_ok=True)
+        track_index = open_track_index()
+        initialize_in_background()
+        refresh_thread.start()
+
+def create_app():
+    """The Flask app, ready to serve. Importing this module only reads .env; this does the rest of the I/O."""
+    start()
+    return app
+
+# Set once the process has been asked to stop, so keep-alive clients reconnect elsewhere
+draining = False
+
+@app.after_request
+def close_connection_when_draining(response):
+    if draining:
+        response.headers['Connection'] = 'close'
+    return response
+
+def serve_inherited_socket(fd, ready_fd=None):
+    """Serve on a listening socket inherited from run_spotify_server.py.
+
+    Several processes can accept on the same socket, which lets the
+    supervisor start a replacement before stopping this one. SIGTERM stops
+    accepting new connections; `ready_fd` is written to once serving.
+    """
+    from werkzeug.serving import make_server
+    server = make_server('0.0.0.0', SERVER_PORT, app, threaded=True, fd=fd)
+    # Let in-flight requests finish when shutting down
+    server.daemon_threads = False
+
+    def stop(signum, frame):
+        global draining
+        draining = True
+        playback_streams.close_all()
+        logger.info("Received SIGTERM, no longer accepting connections")
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    if ready_fd is not None:
+        try:
+            os.write(ready_fd, b'ready\n')
+        except OSError:
+            pass  # Nobody is waiting for the notification
+        os.close(ready_fd)
+    logger.info(f"Serving on inherited socket (fd {fd}, pid {os.getpid()})")
+    server.serve_forever()
+    server.server_close()
+
+def run_workers(count, fd=None, ready_fd=None):
+    """Serve from `count` worker processes accepting on one listening socket.
+
+    The socket is bound (or inherited from run_spotify_server.py) before any
+    worker starts. Workers are started as fresh interpreters that each run
+    start() themselves; this process never serves, so it only logs.
+    Crashed workers are replaced; SIGTERM stops all of them.
+    """
+    listener = None
+    if fd is None:
+        listener = socket.create_server(('0.0.0.0', SERVER_PORT), backlog=128)
+        fd = listener.fileno()
+    stopping = threading.Event()
+    workers = {}
+
+    def start_worker(worker_id):
+        ready_read, ready_write = os.pipe()
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            env=dict(os.environ, SPOTIFY_SERVER_FD=str(fd), SPOTIFY_READY_FD=str(ready_write),
+                     SPOTIFY_WORKER_ID=str(worker_id)),
+            pass_fds=(fd, ready_write)
+        )
+        os.close(ready_write)
+        workers[worker_id] = process
+        logger.info(f"Started worker {worker_id} (pid {process.pid})")
+        return ready_read
+
+    def stop(signum, frame):
+        stopping.set()
+        for process in workers.values():
+            if process.poll() is None:
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    pipes = [start_worker(worker_id) for worker_id in range(1, count + 1)]
+    for pipe in pipes:
+        with os.fdopen(pipe, 'rb') as f:
+            f.readline()
+    logger.info(f"{count} workers serving on port {SERVER_PORT}")
+    if ready_fd is not None:
+        os.write(ready_fd, b'ready\n')
+        os.close(ready_fd)
+
+    while not stopping.is_set():
+        for worker_id, process in list(workers.items()):
+            if process.poll() is not None and not stopping.is_set():
+                logger.error(f"Worker {worker_id} exited with code {process.returncode}, restarting")
+                os.close(start_worker(worker_id))
+        stopping.wait(1)
+    for process in workers.values():
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    if listener:
+        listener.close()
+
 if __name__ == '__main__':
-    logger.info("Starting Spotify MCP Server on port 8888")
-    app.run(host='0.0.0.0', port=8888, debug=False, threaded=True) 
\ No newline at end of file
+    server_fd = int(os.environ['SPOTIFY_SERVER_FD']) if os.getenv('SPOTIFY_SERVER_FD') else None
+    ready_fd = int(os.environ['SPOTIFY_READY_FD']) if os.getenv('SPOTIFY_READY_FD') else None
+    if SERVER_WORKERS > 1 and not WORKER_ID:
+        log_listener = configure_logging()
+        run_workers(SERVER_WORKERS, server_fd, ready_fd)
+    elif server_fd is not None:
+        create_app()
+        serve_inherited_socket(server_fd, ready_fd)
+    else:
+        create_app()
+        logger.info(f"Starting Spotify MCP Server on port {SERVER_PORT}")
+        app.run(host='0.0.0.0', port=SERVER_PORT, debug=False, threaded=True) 
\ No newline at end of file
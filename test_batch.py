@@ -0,0 +1,58 @@
+"""Offline tests for /batch: reference resolution and step handling."""
+import unittest
+from unittest import mock
+
+import spotify_mcp_server as server
+
+class ResolveReferenceTest(unittest.TestCase):
+    results = [{"tracks": [{"uri": "spotify:track:a"}, {"uri": "spotify:track:b"}]}]
+
+    def test_reads_nested_fields_from_earlier_results(self):
+        self.assertEqual(server.resolve_reference("$0.tracks.1.uri", self.results), "spotify:track:b")
+        self.assertEqual(server.resolve_reference(["$0.tracks.0.uri", "x"], self.results), ["spotify:track:a", "x"])
+
+    def test_leaves_other_values_alone(self):
+        self.assertEqual(server.resolve_reference("queen", self.results), "queen")
+        self.assertEqual(server.resolve_reference(5, self.results), 5)
+
+    def test_missing_paths_raise(self):
+        for reference in ("$1.tracks", "$0.tracks.5.uri", "$0.albums", "$x"):
+            with self.assertRaises(server.UnresolvedReference):
+                server.resolve_reference(reference, self.results)
+
+class RunBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+        def echo(args):
+            self.calls.append(args)
+            return {"tracks": [{"uri": f"spotify:track:{args.get('query')}"}]}, 200
+        patcher = mock.patch.dict(server.OPERATIONS, {"search": echo, "play": lambda args: ({"played": args}, 200),
+                                                      "pause": lambda args: ({"error": "No device"}, 404)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_later_steps_read_earlier_results(self):
+        steps = server.run_batch([{"op": "search", "args": {"query": "a"}},
+                                  {"op": "play", "args": {"track_uri": "$0.tracks.0.uri"}}])
+        self.assertEqual([step["status"] for step in steps], [200, 200])
+        self.assertEqual(steps[1]["result"], {"played": {"track_uri": "spotify:track:a"}})
+
+    def test_malformed_operations_fail_their_step(self):
+        steps = server.run_batch(["search", {"op": "rewind"}, {"op": "search", "args": ["a"]},
+                                  {"op": "play", "args": {"track_uri": "$5.uri"}}], stop_on_error=False)
+        self.assertEqual([step["status"] for step in steps], [400, 400, 400, 400])
+        self.assertEqual(steps[1]["result"], {"error": "Unknown operation: rewind"})
+        self.assertEqual(self.calls, [])
+
+    def test_steps_after_a_failure_are_skipped(self):
+        steps = server.run_batch([{"op": "pause"}, {"op": "search", "args": {"query": "a"}}])
+        self.assertEqual(steps[1], {"op": "search", "status": None, "skipped": True})
+        self.assertEqual(self.calls, [])
+
+    def test_stop_on_error_false_runs_every_step(self):
+        steps = server.run_batch([{"op": "pause"}, {"op": "search", "args": {"query": "a"}}], stop_on_error=False)
+        self.assertEqual([step["status"] for step in steps], [404, 200])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""Offline tests for the upstream circuit breaker, deadlines and hedged reads."""
+import time
+import threading
+import unittest
+from unittest import mock
+
+import spotify_mcp_server as server
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.multiple(server, BREAKER_FAILURE_THRESHOLD=2, BREAKER_RESET_TIMEOUT=60)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = server.CircuitBreaker('search')
+
+    def open_breaker(self):
+        for _ in range(server.BREAKER_FAILURE_THRESHOLD):
+            self.breaker.allow()
+            self.breaker.record(True)
+
+    def reset_timeout_passes(self):
+        self.breaker._opened_at -= server.BREAKER_RESET_TIMEOUT
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record(True)
+        self.breaker.record(False)
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, 'open')
+        with self.assertRaises(server.CircuitOpen) as raised:
+            self.breaker.allow()
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        self.assertEqual(self.breaker.rejected, 1)
+
+    def test_lets_one_trial_through_after_the_reset_timeout(self):
+        self.open_breaker()
+        self.reset_timeout_passes()
+        self.breaker.allow()
+        self.assertEqual(self.breaker.state, 'half_open')
+        with self.assertRaises(server.CircuitOpen):
+            self.breaker.allow()
+
+    def test_trial_success_closes(self):
+        self.open_breaker()
+        self.reset_timeout_passes()
+        self.breaker.allow()
+        self.breaker.record(False)
+        self.assertEqual((self.breaker.state, self.breaker.failures), ('closed', 0))
+        self.breaker.allow()
+
+    def test_trial_failure_reopens(self):
+        self.open_breaker()
+        self.reset_timeout_passes()
+        self.breaker.allow()
+        self.breaker.record(True)
+        self.assertEqual((self.breaker.state, self.breaker.opened), ('open', 2))
+
+    def test_released_trial_frees_the_slot(self):
+        self.open_breaker()
+        self.reset_timeout_passes()
+        self.breaker.allow()
+        self.breaker.release()
+        self.breaker.allow()
+        self.assertEqual(self.breaker.state, 'half_open')
+
+class RequestWithDeadlineTest(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.counters = server.HedgeCounters()
+        patcher = mock.patch.multiple(server, SPOTIFY_HEDGE_AFTER=0.02, hedge_counters=self.counters,
+                                      scheduler=server.UpstreamScheduler(0, 1, 5))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def first_call_hangs(self):
+        with self.lock:
+            self.calls += 1
+            attempt = self.calls
+        if attempt == 1:
+            self.release.wait(5)
+            return 'slow'
+        return 'hedge'
+
+    def deadline(self, seconds=5):
+        return time.monotonic() + seconds
+
+    def test_slow_reads_are_hedged_and_the_first_answer_wins(self):
+        result = server.request_with_deadline('search', server.PRIORITY_SEARCH, self.first_call_hangs, self.deadline())
+        self.assertEqual((result, self.counters.sent, self.counters.won), ('hedge', 1, 1))
+
+    def test_no_hedge_without_spare_budget(self):
+        server.scheduler = server.UpstreamScheduler(1, 1, 5)
+        server.scheduler.acquire(server.PRIORITY_READ)
+        with self.assertRaises(server.DeadlineExceeded):
+            server.request_with_deadline('search', server.PRIORITY_SEARCH, self.first_call_hangs, self.deadline(0.1))
+        self.assertEqual((self.calls, self.counters.skipped), (1, 1))
+
+    def test_other_reads_wait_until_the_deadline(self):
+        with self.assertRaises(server.DeadlineExceeded):
+            server.request_with_deadline('artists', server.PRIORITY_READ, self.first_call_hangs, self.deadline(0.1))
+        self.assertEqual((self.calls, self.counters.sent), (1, 0))
+
+    def test_playback_writes_run_inline_past_the_deadline(self):
+        def pause():
+            time.sleep(0.05)
+            return threading.current_thread()
+        thread = server.request_with_deadline('pause_playback', server.PRIORITY_PLAYBACK, pause, self.deadline(0))
+        self.assertIs(thread, threading.current_thread())
+
+    def test_errors_are_raised_to_the_caller(self):
+        def fail():
+            raise ValueError("bad request")
+        with self.assertRaises(ValueError):
+            server.request_with_deadline('search', server.PRIORITY_SEARCH, fail, self.deadline())
+
+    def test_only_server_side_failures_count_toward_the_breaker(self):
+        self.assertTrue(server.is_upstream_failure(server.SpotifyException(502, -1, "Bad gateway")))
+        self.assertTrue(server.is_upstream_failure(server.DeadlineExceeded("slow")))
+        self.assertFalse(server.is_upstream_failure(server.SpotifyException(404, -1, "Not found")))
+        self.assertFalse(server.is_upstream_failure(ValueError("bad")))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+"""Offline tests for merged playback commands and idempotency keys."""
+import threading
+import unittest
+from unittest import mock
+
+import spotify_mcp_server as server
+
+def commands(*specs):
+    """PlaybackCommands from names, or (name, device_id) pairs."""
+    built = []
+    for spec in specs:
+        name, device_id = spec if isinstance(spec, tuple) else (spec, None)
+        built.append(server.PlaybackCommand(name, track_uri='spotify:track:x' if name == 'play' else None,
+                                            device_id=device_id))
+    return built
+
+class PlanCommandsTest(unittest.TestCase):
+    def test_skips_in_one_direction_merge(self):
+        burst = commands('next', 'next', 'next')
+        plan = server.plan_commands(burst)
+        self.assertEqual([(step.name, step.count) for step in plan], [('next', 3)])
+        self.assertEqual(plan[0].commands, burst)
+
+    def test_skips_in_opposite_directions_stay_apart(self):
+        plan = server.plan_commands(commands('next', 'previous', 'next'))
+        self.assertEqual([(step.name, step.count) for step in plan], [('next', 1), ('previous', 1), ('next', 1)])
+
+    def test_pause_and_resume_collapse_to_the_last(self):
+        plan = server.plan_commands(commands('pause', 'resume', 'pause'))
+        self.assertEqual([step.name for step in plan], ['pause'])
+        self.assertEqual(len(plan[0].commands), 3)
+
+    def test_play_supersedes_earlier_commands_and_absorbs_resume(self):
+        burst = commands('next', 'pause', 'play', 'resume')
+        plan = server.plan_commands(burst)
+        self.assertEqual([step.name for step in plan], ['play'])
+        self.assertEqual(plan[0].track_uri, 'spotify:track:x')
+        self.assertCountEqual(plan[0].commands, burst)
+
+    def test_commands_for_different_devices_stay_apart(self):
+        plan = server.plan_commands(commands(('next', 'a'), ('next', 'b'), ('next', 'b')))
+        self.assertEqual([(step.device_id, step.count) for step in plan], [('a', 1), ('b', 2)])
+
+class CommandPipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.fail = None
+        patcher = mock.patch.multiple(server, run_step=self.run_step, playback_changed=lambda: None,
+                                      COMMAND_COALESCE_WINDOW=0.05)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pipeline = server.CommandPipeline(None)
+
+    def run_step(self, step):
+        self.sent.append((step.name, step.count))
+        if self.fail:
+            raise self.fail
+        return True
+
+    def submit_all(self, names):
+        burst = commands(*names)
+        threads = [threading.Thread(target=self.pipeline.submit, args=(command,)) for command in burst]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return burst
+
+    def test_a_burst_is_sent_as_one_merged_step(self):
+        burst = self.submit_all(['next', 'next', 'next'])
+        self.assertEqual(self.sent, [('next', 3)])
+        self.assertTrue(all(command.done.is_set() and command.coalesced for command in burst))
+        self.assertEqual({key: self.pipeline.stats()[key] for key in ('running', 'received', 'batches', 'steps')},
+                         {"running": False, "received": 3, "batches": 1, "steps": 1})
+
+    def test_a_failed_step_reports_to_each_of_its_commands(self):
+        self.fail = RuntimeError("No active device")
+        burst = self.submit_all(['pause', 'resume'])
+        self.assertEqual([command.error for command in burst], [self.fail, self.fail])
+        self.assertEqual(self.pipeline.stats()["errors"], 1)
+
+class IdempotencyKeysTest(unittest.TestCase):
+    def setUp(self):
+        self.keys = server.IdempotencyKeys(server.TTLCache(60, 100))
+        self.calls = 0
+
+    def handler(self, status=200):
+        def run():
+            self.calls += 1
+            return {"call": self.calls}, status
+        return run
+
+    def test_retry_replays_the_first_response(self):
+        self.assertEqual(self.keys.run('k', 'POST /next', self.handler()), ({"call": 1}, 200, False))
+        self.assertEqual(self.keys.run('k', 'POST /next', self.handler()), ({"call": 1}, 200, True))
+        self.assertEqual(self.calls, 1)
+
+    def test_reused_key_with_another_request_is_rejected(self):
+        self.keys.run('k', 'POST /next', self.handler())
+        payload, status, replayed = self.keys.run('k', 'POST /previous', self.handler())
+        self.assertEqual(status, 422)
+        self.assertFalse(replayed)
+        self.assertIn('error', payload)
+        self.assertEqual((self.calls, self.keys.conflicts), (1, 1))
+
+    def test_server_errors_are_not_remembered(self):
+        self.keys.run('k', 'POST /next', self.handler(503))
+        self.assertEqual(self.keys.run('k', 'POST /next', self.handler()), ({"call": 2}, 200, False))
+
+    def test_retry_during_the_first_attempt_waits_for_it(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return self.handler()()
+        first = threading.Thread(target=self.keys.run, args=('k', 'POST /next', slow))
+        first.start()
+        started.wait(5)
+        retried = []
+        retry = threading.Thread(target=lambda: retried.append(self.keys.run('k', 'POST /next', self.handler())))
+        retry.start()
+        self.assertEqual(self.keys.stats()["in_flight"], 1)
+        release.set()
+        first.join(5)
+        retry.join(5)
+        self.assertEqual((retried, self.calls), ([({"call": 1}, 200, True)], 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Offline tests for the MCP stdio transport's JSON-RPC handling."""
+import io
+import json
+import unittest
+from unittest import mock
+
+import mcp_stdio_server as stdio
+
+class StdioServerTest(unittest.TestCase):
+    def setUp(self):
+        self.stdout = io.StringIO()
+        self.server = stdio.StdioServer(io.StringIO(), self.stdout, workers=1)
+        self.addCleanup(self.server.executor.shutdown)
+
+    def responses(self):
+        return [json.loads(line) for line in self.stdout.getvalue().splitlines()]
+
+    def with_tool(self, name, handler):
+        patcher = mock.patch.dict(stdio.TOOLS, {name: dict(stdio.TOOLS[name], handler=handler)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_initialize_echoes_the_protocol_version(self):
+        self.server.dispatch({"jsonrpc": "2.0", "id": 1, "method": "initialize",
+                              "params": {"protocolVersion": "2025-01-01"}})
+        result = self.responses()[0]["result"]
+        self.assertEqual(result["protocolVersion"], "2025-01-01")
+        self.assertEqual(result["serverInfo"], stdio.SERVER_INFO)
+
+    def test_tools_list_hides_handlers(self):
+        self.server.dispatch({"jsonrpc": "2.0", "id": 1, "method": "tools/list"})
+        tools = self.responses()[0]["result"]["tools"]
+        self.assertEqual([tool["name"] for tool in tools], list(stdio.TOOLS))
+        self.assertEqual(set(tools[0]), {"name", "description", "inputSchema"})
+
+    def test_tools_call_passes_arguments_and_reports_errors(self):
+        calls = []
+        self.with_tool("play", lambda args: (calls.append(args), ({"error": "No device"}, 404))[1])
+        self.server.dispatch({"jsonrpc": "2.0", "id": 7, "method": "tools/call",
+                              "params": {"name": "play", "arguments": {"track_uri": "spotify:track:x"}}})
+        response = self.responses()[0]
+        self.assertEqual(calls, [{"track_uri": "spotify:track:x"}])
+        self.assertEqual(response["id"], 7)
+        self.assertTrue(response["result"]["isError"])
+        self.assertEqual(json.loads(response["result"]["content"][0]["text"]), {"error": "No device"})
+
+    def test_unknown_tool_is_invalid_params(self):
+        self.server.dispatch({"jsonrpc": "2.0", "id": 2, "method": "tools/call", "params": {"name": "rewind"}})
+        self.assertEqual(self.responses()[0]["error"]["code"], stdio.INVALID_PARAMS)
+
+    def test_unknown_method_is_method_not_found(self):
+        self.server.dispatch({"jsonrpc": "2.0", "id": 3, "method": "resources/list"})
+        self.assertEqual(self.responses()[0]["error"]["code"], stdio.METHOD_NOT_FOUND)
+
+    def test_handler_failure_is_internal_error(self):
+        def fail(args):
+            raise RuntimeError("boom")
+        self.with_tool("pause", fail)
+        self.server.dispatch({"jsonrpc": "2.0", "id": 4, "method": "tools/call", "params": {"name": "pause"}})
+        self.assertEqual(self.responses()[0]["error"], {"code": stdio.INTERNAL_ERROR, "message": "boom"})
+
+    def test_notifications_never_get_a_response(self):
+        self.server.dispatch({"jsonrpc": "2.0", "method": "notifications/initialized"})
+        self.server.dispatch({"jsonrpc": "2.0", "method": "tools/call", "params": {"name": "rewind"}})
+        self.assertEqual(self.stdout.getvalue(), "")
+
+    def test_serve_forever_rejects_bad_lines(self):
+        server = stdio.StdioServer(io.StringIO('not json\n[1, 2]\n\n{"jsonrpc": "2.0", "id": 1, "method": "ping"}\n'),
+                                   self.stdout, workers=1)
+        server.serve_forever()
+        self.assertEqual([response.get("error", {}).get("code") for response in self.responses()],
+                         [stdio.PARSE_ERROR, stdio.INVALID_REQUEST, None])
+        self.assertEqual(self.responses()[2]["result"], {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""Offline tests for batched metadata lookups: ID parsing and batching."""
+import threading
+import unittest
+from unittest import mock
+
+import spotify_mcp_server as server
+
+class ParseMetadataRefsTest(unittest.TestCase):
+    track_id = "4uLU6hMCjMI75M1A2tKUQC"
+
+    def test_accepts_uris_links_and_typed_bare_ids(self):
+        refs = server.parse_metadata_refs([
+            f"spotify:track:{self.track_id}",
+            f"https://open.spotify.com/intl-de/album/{self.track_id}?si=abc",
+            self.track_id
+        ], default_type='artist')
+        self.assertEqual(refs, [('track', self.track_id), ('album', self.track_id), ('artist', self.track_id)])
+
+    def test_splits_comma_separated_strings(self):
+        refs = server.parse_metadata_refs(f"spotify:track:{self.track_id}, spotify:artist:{self.track_id}")
+        self.assertEqual(refs, [('track', self.track_id), ('artist', self.track_id)])
+
+    def test_rejects_bad_input(self):
+        for values, default_type in ([self.track_id], None), (["spotify:playlist:x"], None), ([], None), \
+                                    ([self.track_id], 'playlist'):
+            with self.assertRaises(server.InvalidMetadataRequest):
+                server.parse_metadata_refs(values, default_type)
+
+class FetchMetadataTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.lock = threading.Lock()
+        self.cache = server.TTLCache(60, 100)
+        patcher = mock.patch.multiple(server, call_spotify=self.call_spotify, metadata_cache=self.cache,
+                                      METADATA_BATCH_SIZES={'track': 2, 'album': 20, 'artist': 50})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def call_spotify(self, operation, ids):
+        with self.lock:
+            self.calls.append((operation, ids))
+        # Spotify answers null for IDs it doesn't know
+        return {operation: [None if spotify_id == 'unknown' else
+                            {"id": spotify_id, "available_markets": ["DE"]} for spotify_id in ids]}
+
+    def test_ids_are_split_into_batches_per_type(self):
+        found = server.fetch_metadata({'track': ['a', 'b', 'c'], 'album': ['d']})
+        self.assertCountEqual(self.calls, [('tracks', ['a', 'b']), ('tracks', ['c']), ('albums', ['d'])])
+        self.assertEqual(found[('track', 'c')], {"id": "c"})
+        self.assertEqual(len(found), 4)
+
+    def test_found_items_are_cached_and_unknown_ids_are_not(self):
+        found = server.fetch_metadata({'artist': ['a', 'unknown']})
+        self.assertIsNone(found[('artist', 'unknown')])
+        self.assertEqual(self.cache.get(('artist', 'a')), {"id": "a"})
+        self.assertIsNone(self.cache.get(('artist', 'unknown')))
+
+if __name__ == '__main__':
+    unittest.main()
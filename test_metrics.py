@@ -0,0 +1,63 @@
+"""Offline tests for the Prometheus text rendering in metrics.py."""
+import unittest
+
+import metrics
+
+class MetricsRenderTest(unittest.TestCase):
+    def test_counter_sums_increments_per_label_set(self):
+        counter = metrics.Counter('requests_total', 'Requests.', ['route', 'status'])
+        counter.inc('/search', '200')
+        counter.inc('/search', '200', amount=2)
+        counter.inc('/play', '404')
+        self.assertEqual(counter.render(), [
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{route="/play",status="404"} 1',
+            'requests_total{route="/search",status="200"} 3'
+        ])
+
+    def test_callback_metrics_read_values_at_render_time(self):
+        values = {('search',): 2, ('export',): None}
+        gauge = metrics.Gauge('queue_depth', 'Queued callers.', ['class'], lambda: values)
+        total = metrics.CallbackCounter('granted_total', 'Grants.', [], lambda: {(): 7})
+        self.assertEqual(gauge.render()[1:], ['# TYPE queue_depth gauge', 'queue_depth{class="search"} 2'])
+        values[('search',)] = 0
+        self.assertEqual(gauge.render()[-1], 'queue_depth{class="search"} 0')
+        self.assertEqual(total.render()[1:], ['# TYPE granted_total counter', 'granted_total 7'])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('latency_seconds', 'Latency.', ['route'], buckets=(0.5, 0.1))
+        for value in (0.05, 0.2, 3):
+            histogram.observe(value, '/search')
+        self.assertEqual(histogram.render()[2:], [
+            'latency_seconds_bucket{route="/search",le="0.1"} 1',
+            'latency_seconds_bucket{route="/search",le="0.5"} 2',
+            'latency_seconds_bucket{route="/search",le="+Inf"} 3',
+            'latency_seconds_sum{route="/search"} 3.25',
+            'latency_seconds_count{route="/search"} 3'
+        ])
+
+    def test_label_values_are_escaped(self):
+        counter = metrics.Counter('errors_total', 'Errors.', ['message'])
+        counter.inc('say "hi"\\\nbye')
+        self.assertEqual(counter.render()[-1], 'errors_total{message="say \\"hi\\"\\\\\\nbye"} 1')
+
+    def test_registry_adds_const_labels_to_every_series(self):
+        registry = metrics.Registry({'worker': '2'})
+        registry.counter('plain_total', 'No labels.').inc()
+        registry.histogram('upstream_seconds', 'Upstream.', ['call'], buckets=(1,)).observe(0.5, 'search')
+        registry.gauge('up', 'Up.', [], lambda: {(): 1})
+        body = registry.render()
+        self.assertTrue(body.endswith('\n'))
+        samples = [line for line in body.splitlines() if not line.startswith('#')]
+        self.assertEqual(samples, [
+            'plain_total{worker="2"} 1',
+            'upstream_seconds_bucket{worker="2",call="search",le="1"} 1',
+            'upstream_seconds_bucket{worker="2",call="search",le="+Inf"} 1',
+            'upstream_seconds_sum{worker="2",call="search"} 0.5',
+            'upstream_seconds_count{worker="2",call="search"} 1',
+            'up{worker="2"} 1'
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
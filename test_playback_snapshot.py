@@ -0,0 +1,122 @@
+"""Offline tests for the shared single-flight playback snapshot."""
+import time
+import threading
+import unittest
+
+import spotify_mcp_server as server
+
+def playing(progress_ms=1000, duration_ms=200000, is_playing=True):
+    return {"is_playing": is_playing, "progress_ms": progress_ms,
+            "item": {"name": "Track", "duration_ms": duration_ms}}
+
+class BlockingFetch:
+    """fetch() that holds every call until release() and counts them."""
+
+    def __init__(self, states):
+        self.states = list(states)
+        self.calls = 0
+        self.release_event = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        state = self.states[min(self.calls, len(self.states)) - 1]
+        self.release_event.wait(5)
+        if isinstance(state, Exception):
+            raise state
+        return state
+
+    def release(self):
+        self.release_event.set()
+
+class PlaybackSnapshotTest(unittest.TestCase):
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.005)
+
+    def run_callers(self, snapshot, count):
+        results, errors = [], []
+
+        def caller():
+            try:
+                results.append(snapshot.get())
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=caller) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results, errors
+
+    def test_concurrent_callers_share_one_fetch(self):
+        fetch = BlockingFetch([playing(is_playing=False)])
+        snapshot = server.PlaybackSnapshot(fetch, 60)
+        threads, results, errors = self.run_callers(snapshot, 5)
+        self.wait_for(lambda: snapshot.coalesced == 4)
+        fetch.release()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual((fetch.calls, len(results), errors), (1, 5, []))
+        self.assertTrue(all(result == playing(is_playing=False) for result in results))
+
+    def test_fresh_snapshot_is_served_without_fetching(self):
+        fetch = BlockingFetch([playing(is_playing=False), playing(progress_ms=5000, is_playing=False)])
+        fetch.release()
+        snapshot = server.PlaybackSnapshot(fetch, 60)
+        snapshot.get()
+        self.assertEqual(snapshot.get()["progress_ms"], 1000)
+        self.assertEqual((fetch.calls, snapshot.served_from_snapshot), (1, 1))
+        self.assertEqual(snapshot.get(force=True)["progress_ms"], 5000)
+        self.assertEqual(fetch.calls, 2)
+
+    def test_progress_is_extrapolated_and_capped_at_the_track_end(self):
+        fetch = BlockingFetch([playing(progress_ms=1000)])
+        fetch.release()
+        snapshot = server.PlaybackSnapshot(fetch, 60)
+        snapshot.get()
+        snapshot._fetched_at -= 0.5
+        self.assertGreaterEqual(snapshot._extrapolate(snapshot._state, snapshot._fetched_at)["progress_ms"], 1500)
+        self.assertEqual(snapshot._extrapolate(playing(progress_ms=199900), time.monotonic() - 1)["progress_ms"],
+                         200000)
+
+    def test_snapshot_goes_stale_when_the_track_should_have_ended(self):
+        fetch = BlockingFetch([playing(progress_ms=199950)])
+        fetch.release()
+        snapshot = server.PlaybackSnapshot(fetch, 60)
+        snapshot.get()
+        self.assertTrue(snapshot._is_fresh(snapshot._fetched_at))
+        self.assertFalse(snapshot._is_fresh(snapshot._fetched_at + 0.1))
+
+    def test_null_progress_and_duration_count_as_zero(self):
+        fetch = BlockingFetch([{"is_playing": True, "progress_ms": None, "item": {"duration_ms": None}}])
+        fetch.release()
+        snapshot = server.PlaybackSnapshot(fetch, 60)
+        snapshot.get()
+        self.assertFalse(snapshot._is_fresh(snapshot._fetched_at + 0.1))
+        self.assertIsNone(snapshot.get()["progress_ms"])
+
+    def test_result_requested_before_an_invalidation_is_not_kept(self):
+        fetch = BlockingFetch([playing(is_playing=False), playing(progress_ms=9000, is_playing=False)])
+        snapshot = server.PlaybackSnapshot(fetch, 60)
+        threads, results, _ = self.run_callers(snapshot, 1)
+        self.wait_for(lambda: fetch.calls == 1)
+        snapshot.invalidate()
+        fetch.release()
+        threads[0].join(5)
+        self.assertEqual(results[0]["progress_ms"], 1000)
+        self.assertEqual(snapshot.get()["progress_ms"], 9000)
+        self.assertEqual(fetch.calls, 2)
+
+    def test_errors_reach_every_waiter_and_are_not_cached(self):
+        fetch = BlockingFetch([RuntimeError("Spotify is down"), playing(is_playing=False)])
+        snapshot = server.PlaybackSnapshot(fetch, 60)
+        threads, results, errors = self.run_callers(snapshot, 3)
+        self.wait_for(lambda: snapshot.coalesced == 2)
+        fetch.release()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual((len(results), len(errors)), (0, 3))
+        self.assertEqual(snapshot.get(), playing(is_playing=False))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""Offline tests for the priority scheduler that spends the Spotify rate-limit budget."""
+import time
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+import spotify_mcp_server as server
+
+class UpstreamSchedulerTest(unittest.TestCase):
+    def wait_for_queue(self, scheduler, name, depth):
+        deadline = time.monotonic() + 5
+        while scheduler.stats()["queue_depth"][name] < depth:
+            self.assertLess(time.monotonic(), deadline, f"{name} caller never queued")
+            time.sleep(0.005)
+
+    def test_grants_by_priority_then_arrival(self):
+        # Tokens come 50ms apart, so the grant order is the order callers record
+        scheduler = server.UpstreamScheduler(20, 1, 5)
+        with mock.patch.object(server.logger, 'warning'):
+            scheduler.backoff(0.2)
+        granted = []
+
+        def caller(label, priority):
+            scheduler.acquire(priority)
+            granted.append(label)
+
+        threads = []
+        for label, priority in [('export', server.PRIORITY_EXPORT), ('search 1', server.PRIORITY_SEARCH),
+                                ('search 2', server.PRIORITY_SEARCH), ('playback', server.PRIORITY_PLAYBACK)]:
+            thread = threading.Thread(target=caller, args=(label, priority))
+            thread.start()
+            threads.append(thread)
+            self.wait_for_queue(scheduler, server.PRIORITY_NAMES[priority], 2 if label == 'search 2' else 1)
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(granted, ['playback', 'search 1', 'search 2', 'export'])
+
+    def test_gives_up_at_max_wait(self):
+        scheduler = server.UpstreamScheduler(1, 1, 5)
+        scheduler.acquire(server.PRIORITY_READ)
+        with self.assertRaises(server.SchedulerTimeout) as raised:
+            scheduler.acquire(server.PRIORITY_READ, max_wait=0.05)
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        self.assertEqual(scheduler.stats()["wait"]["read"]["timeouts"], 1)
+
+    def test_try_acquire_never_queues(self):
+        scheduler = server.UpstreamScheduler(1, 1, 5)
+        self.assertTrue(scheduler.try_acquire(server.PRIORITY_SEARCH))
+        self.assertFalse(scheduler.try_acquire(server.PRIORITY_SEARCH))
+
+    def test_backoff_pauses_grants(self):
+        scheduler = server.UpstreamScheduler(0, 1, 5)
+        with mock.patch.object(server.logger, 'warning'):
+            scheduler.backoff(0.1)
+        self.assertGreaterEqual(scheduler.acquire(server.PRIORITY_PLAYBACK), 0.09)
+        self.assertEqual(scheduler.stats()["rate_limited"], 1)
+
+class AsyncAcquireTest(unittest.TestCase):
+    def test_coroutines_wait_without_threads_and_keep_priority(self):
+        async def scenario():
+            scheduler = server.UpstreamScheduler(20, 1, 5)
+            scheduler.acquire(server.PRIORITY_READ)
+            granted = []
+
+            async def caller(label, priority):
+                await scheduler.acquire_async(priority)
+                granted.append(label)
+            threads_before = threading.active_count()
+            tasks = [asyncio.create_task(caller(f"search {index}", server.PRIORITY_SEARCH)) for index in range(20)]
+            await asyncio.sleep(0.01)
+            self.assertEqual(threading.active_count(), threads_before)
+            # A thread at a higher priority still goes first
+            thread = threading.Thread(target=lambda: (scheduler.acquire(server.PRIORITY_PLAYBACK),
+                                                      granted.append('playback')))
+            thread.start()
+            await asyncio.gather(*tasks[:2])
+            thread.join(5)
+            for task in tasks[2:]:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            return scheduler, granted
+
+        scheduler, granted = asyncio.run(scenario())
+        self.assertEqual(granted, ['playback', 'search 0', 'search 1'])
+        self.assertEqual(sum(scheduler.stats()["queue_depth"].values()), 0)
+
+    def test_cancelled_waiter_takes_no_budget(self):
+        async def scenario():
+            scheduler = server.UpstreamScheduler(10, 1, 5)
+            scheduler.acquire(server.PRIORITY_READ)
+            waiter = asyncio.create_task(scheduler.acquire_async(server.PRIORITY_SEARCH))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            await asyncio.sleep(0.1)
+            return scheduler
+
+        scheduler = asyncio.run(scenario())
+        self.assertEqual(scheduler.stats()["wait"]["search"]["granted"], 0)
+        self.assertTrue(scheduler.try_acquire(server.PRIORITY_READ))
+
+    def test_async_waiter_gives_up_at_max_wait(self):
+        scheduler = server.UpstreamScheduler(1, 1, 5)
+        scheduler.acquire(server.PRIORITY_READ)
+        with self.assertRaises(server.SchedulerTimeout):
+            asyncio.run(scheduler.acquire_async(server.PRIORITY_READ, max_wait=0.05))
+        self.assertEqual(sum(scheduler.stats()["queue_depth"].values()), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Offline tests for the search result cache (TTLCache)."""
+import time
+import unittest
+
+import spotify_mcp_server as server
+
+class TTLCacheTest(unittest.TestCase):
+    def test_hits_and_misses_are_counted(self):
+        cache = server.TTLCache(60, 10)
+        self.assertIsNone(cache.get('queen'))
+        cache.set('queen', ['track'])
+        self.assertEqual(cache.get('queen'), ['track'])
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    def test_evicts_least_recently_used(self):
+        cache = server.TTLCache(60, 2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_setting_again_refreshes_recency(self):
+        cache = server.TTLCache(60, 2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('a', 10)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 10)
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = server.TTLCache(0.05, 10)
+        cache.set('a', 1)
+        time.sleep(0.06)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_zero_ttl_or_size_disables_caching(self):
+        for ttl, max_entries in ((0, 10), (60, 0)):
+            cache = server.TTLCache(ttl, max_entries)
+            cache.set('a', 1)
+            self.assertIsNone(cache.get('a'))
+
+    def test_cache_key_ignores_case_and_spacing(self):
+        self.assertEqual(server.search_cache_key('  Bohemian   RHAPSODY ', ['track'], 5),
+                         server.search_cache_key('bohemian rhapsody', ['track'], 5, 0))
+        self.assertNotEqual(server.search_cache_key('queen', ['track'], 5),
+                            server.search_cache_key('queen', ['track'], 10))
+
+if __name__ == '__main__':
+    unittest.main()
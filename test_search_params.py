@@ -0,0 +1,65 @@
+"""Offline tests for search parameter parsing, paging and field projection."""
+import unittest
+
+import spotify_mcp_server as server
+
+TRACK = {
+    "name": "Heroes", "uri": "spotify:track:heroes", "available_markets": ["DE"],
+    "artists": [{"name": "David Bowie"}],
+    "album": {"name": "Heroes", "images": [{"url": "https://i.scdn.co/large"}], "available_markets": ["DE"]}
+}
+
+class ParseSearchParamsTest(unittest.TestCase):
+    def test_types_accept_plurals_and_drop_repeats(self):
+        self.assertEqual(server.parse_search_types(None), ['track'])
+        self.assertEqual(server.parse_search_types(' Tracks, album,track '), ['track', 'album'])
+        self.assertEqual(server.parse_search_types(['artists', 'playlist']), ['artist', 'playlist'])
+        with self.assertRaises(server.InvalidSearch):
+            server.parse_search_types('tracks,shows')
+
+    def test_fields_from_strings_or_lists(self):
+        self.assertEqual(server.parse_search_fields('name, album.name,,'), ['name', 'album.name'])
+        self.assertEqual(server.parse_search_fields(['uri']), ['uri'])
+        for value in (None, '', ' , '):
+            self.assertIsNone(server.parse_search_fields(value))
+
+    def test_ints_default_and_are_range_checked(self):
+        self.assertEqual(server.parse_search_int(None, 5, 'limit', 1, 50), 5)
+        self.assertEqual(server.parse_search_int('', 5, 'limit', 1, 50), 5)
+        self.assertEqual(server.parse_search_int('20', 5, 'limit', 1, 50), 20)
+        for value in ('ten', 0, 51, [1]):
+            with self.assertRaises(server.InvalidSearch):
+                server.parse_search_int(value, 5, 'limit', 1, 50)
+
+class SearchPagingTest(unittest.TestCase):
+    def test_next_offset_only_after_a_full_page(self):
+        self.assertEqual(server.next_search_offset({"tracks": [1, 2], "albums": [1]}, 2, 10), 12)
+        self.assertIsNone(server.next_search_offset({"tracks": [1]}, 2, 10))
+        self.assertIsNone(server.next_search_offset({"tracks": []}, 2, 0))
+
+    def test_next_offset_stops_at_spotifys_maximum(self):
+        self.assertEqual(server.next_search_offset({"tracks": [1] * 50}, 50, 950), 1000)
+        self.assertIsNone(server.next_search_offset({"tracks": [1] * 50}, 50, 1000))
+
+class ShapeSearchPageTest(unittest.TestCase):
+    def test_lookup_path_follows_keys_and_indexes(self):
+        self.assertEqual(server.lookup_path(TRACK, 'album.images.0.url'), 'https://i.scdn.co/large')
+        for path in ('album.images.3.url', 'album.images.first', 'name.first', 'popularity'):
+            self.assertIsNone(server.lookup_path(TRACK, path))
+
+    def test_items_are_summarized_by_default(self):
+        page = server.slim_search_results({"tracks": {"items": [TRACK]}, "playlists": {"items": [None]}},
+                                          ['track', 'playlist'])
+        self.assertNotIn('available_markets', page["tracks"][0]["album"])
+        self.assertEqual(server.shape_search_page(page), {
+            "tracks": [{"name": "Heroes", "artist": "David Bowie", "uri": "spotify:track:heroes"}],
+            "playlists": []
+        })
+
+    def test_fields_project_each_item(self):
+        shaped = server.shape_search_page({"tracks": [TRACK]}, ['uri', 'album.images.0.url', 'popularity'])
+        self.assertEqual(shaped, {"tracks": [{"uri": "spotify:track:heroes",
+                                              "album.images.0.url": "https://i.scdn.co/large", "popularity": None}]})
+
+if __name__ == '__main__':
+    unittest.main()
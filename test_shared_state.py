@@ -0,0 +1,98 @@
+"""Offline tests for the cross-process cache and lock in shared_state.py."""
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+import subprocess
+from unittest import mock
+
+import shared_state
+
+class SQLiteCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'shared.db')
+
+    def cache(self, namespace='search', ttl=60, max_entries=10):
+        cache = shared_state.SQLiteCache(self.path, namespace, ttl, max_entries)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_entries_are_shared_through_the_file(self):
+        writer, reader = self.cache(), self.cache()
+        writer.set(['queen', 5], {"tracks": [1, 2]})
+        self.assertEqual(reader.get(['queen', 5]), {"tracks": [1, 2]})
+        self.assertIsNone(reader.get(['queen', 10]))
+        self.assertEqual({key: reader.stats()[key] for key in ('entries', 'hits', 'misses')},
+                         {"entries": 1, "hits": 1, "misses": 1})
+
+    def test_namespaces_are_separate(self):
+        search, metadata = self.cache('search'), self.cache('metadata')
+        search.set('k', 1)
+        metadata.set('k', 2)
+        search.clear()
+        self.assertEqual((search.get('k'), metadata.get('k')), (None, 2))
+
+    def test_entries_expire_and_can_be_deleted(self):
+        cache = self.cache(ttl=0.05)
+        cache.set('short', 1)
+        cache.set('long', 2, ttl=60)
+        cache.set('gone', 3, ttl=60)
+        cache.delete('gone')
+        time.sleep(0.06)
+        self.assertEqual([cache.get(key) for key in ('short', 'long', 'gone')], [None, 2, None])
+        self.assertEqual(cache.stats()["entries"], 1)
+
+    def test_pruning_drops_the_entries_closest_to_expiry(self):
+        cache = self.cache(max_entries=2)
+        with mock.patch.object(shared_state, 'PRUNE_EVERY', 1):
+            for key, ttl in (('a', 30), ('b', 10), ('c', 20)):
+                cache.set(key, key, ttl=ttl)
+        self.assertEqual([cache.get(key) for key in 'abc'], ['a', None, 'c'])
+        self.assertEqual(cache.evictions, 1)
+
+    def test_zero_ttl_or_size_disables_caching(self):
+        for ttl, max_entries in ((0, 10), (60, 0)):
+            cache = self.cache(ttl=ttl, max_entries=max_entries)
+            cache.set('k', 1)
+            self.assertIsNone(cache.get('k'))
+
+class FileLockTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'shared.lock')
+
+    def test_threads_take_turns(self):
+        lock = shared_state.FileLock(self.path)
+        inside = []
+        overlaps = []
+
+        def worker():
+            for _ in range(20):
+                with lock:
+                    inside.append(1)
+                    overlaps.append(len(inside) > 1)
+                    inside.pop()
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual((len(overlaps), any(overlaps)), (80, False))
+
+    @unittest.skipIf(shared_state.fcntl is None, "flock() is not available on this platform")
+    def test_other_processes_are_excluded(self):
+        try_lock = ("import fcntl, os, sys; fd = os.open(sys.argv[1], os.O_RDWR)\n"
+                    "try:\n    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)\n"
+                    "except BlockingIOError:\n    sys.exit(1)")
+        lock = shared_state.FileLock(self.path)
+        with lock:
+            self.assertEqual(subprocess.run([sys.executable, '-c', try_lock, self.path]).returncode, 1)
+        self.assertEqual(subprocess.run([sys.executable, '-c', try_lock, self.path]).returncode, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -98,6 +98,22 @@ def test_previous():
         print(f"Error: {str(e)}")
         return False
 
+def test_batch(query):
+    print(f"\nTesting batch search -> play -> current track for '{query}'...")
+    try:
+        response = requests.post(f"{BASE_URL}/batch", json={"operations": [
+            {"op": "search", "args": {"query": query}},
+            {"op": "play", "args": {"track_uri": "$0.tracks.0.uri"}},
+            {"op": "current_track"}
+        ]})
+        print(f"Status code: {response.status_code}")
+        for step in response.json().get("results", []):
+            print(f"{step['op']}: {step['status']}")
+        return response.status_code == 200
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return False
+
 def main():
     print("Spotify MCP Server Test")
     print("======================")
@@ -147,6 +163,9 @@ def main():
     # Test previous
     test_previous()
     
+    # Test batch
+    test_batch(search_query)
+    
     print("\nAll tests completed!")
 
 if __name__ == "__main__":
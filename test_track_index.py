@@ -0,0 +1,53 @@
+"""Offline tests for the local SQLite/FTS5 track index."""
+import unittest
+
+import track_index
+
+def track(uri, name, *artists, popularity=None):
+    return {"uri": f"spotify:track:{uri}", "name": name, "artists": [{"name": artist} for artist in artists],
+            "popularity": popularity}
+
+class TrackIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = track_index.TrackIndex(':memory:')
+        self.addCleanup(self.index.close)
+        self.index.add_tracks([
+            track('bohemian', 'Bohemian Rhapsody', 'Queen', popularity=90),
+            track('bicycle', 'Bicycle Race', 'Queen', popularity=60),
+            track('heroes', 'Heroes', 'David Bowie'),
+            track('beyonce', 'Halo', 'Beyoncé')
+        ])
+
+    def uris(self, query, limit=5):
+        return [found["uri"].split(':')[-1] for found, _ in self.index.search(query, limit)]
+
+    def test_incomplete_tracks_are_skipped_and_repeats_update(self):
+        added = self.index.add_tracks([None, {"uri": "spotify:track:x"}, track('heroes', 'Heroes', 'Bowie')])
+        self.assertEqual((added, self.index.count()), (1, 4))
+        self.assertEqual(self.index.search('heroes')[0][0]["artist"], 'Bowie')
+
+    def test_prefixes_of_every_word_match(self):
+        self.assertEqual(self.uris('bohem rhap'), ['bohemian'])
+        self.assertEqual(self.uris('queen bicycle'), ['bicycle'])
+
+    def test_punctuation_case_and_accents_are_ignored(self):
+        self.assertEqual(self.uris('BOHEMIAN-rhapsody!'), ['bohemian'])
+        self.assertEqual(self.uris('halo beyonce'), ['beyonce'])
+
+    def test_misspelt_words_fall_back_to_fuzzy_matching(self):
+        self.assertEqual(self.uris('bohemain rapsody', limit=1), ['bohemian'])
+
+    def test_results_are_ordered_by_confidence(self):
+        results = self.index.search('queen bohemian rhapsody')
+        self.assertEqual(results[0][0], {"name": 'Bohemian Rhapsody', "artist": 'Queen',
+                                         "uri": 'spotify:track:bohemian'})
+        confidences = [confidence for _, confidence in self.index.search('queen')]
+        self.assertEqual(confidences, sorted(confidences, reverse=True))
+        self.assertTrue(all(0 <= confidence <= 1 for confidence in confidences))
+
+    def test_empty_or_unmatched_queries_find_nothing(self):
+        for query in ('', '  !! ', 'zz', 'zzzz'):
+            self.assertEqual(self.index.search(query), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import re
+import time
+import sqlite3
+import logging
+import threading
+from difflib import SequenceMatcher
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    uri TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    artists TEXT NOT NULL,
+    duration_ms INTEGER,
+    popularity INTEGER,
+    seen_count INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+    name, artists, content='tracks', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS tracks_ai AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_fts(rowid, name, artists) VALUES (new.rowid, new.name, new.artists);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_ad AFTER DELETE ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, name, artists) VALUES ('delete', old.rowid, old.name, old.artists);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_au AFTER UPDATE OF name, artists ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, name, artists) VALUES ('delete', old.rowid, old.name, old.artists);
+    INSERT INTO tracks_fts(rowid, name, artists) VALUES (new.rowid, new.name, new.artists);
+END;
+"""
+
+# Candidates pulled from the full-text index before fuzzy scoring
+CANDIDATE_LIMIT = 50
+
+def normalize(text):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+
+class TrackIndex:
+    """Persistent SQLite/FTS5 index of every track the server has seen.
+
+    Lookups first try a prefix match on all query words; if that finds
+    nothing, any word sharing a three-letter prefix becomes a candidate so
+    misspelled queries still match. Candidates are scored 0-1 against the
+    query by sequence similarity.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(SCHEMA)
+        logger.info(f"Track index opened at {path} with {self.count()} tracks")
+
+    def add_tracks(self, tracks):
+        rows = []
+        now = time.time()
+        for track in tracks:
+            if not track or not track.get('uri') or not track.get('name'):
+                continue
+            names = [artist['name'] for artist in track.get('artists', []) if artist.get('name')]
+            rows.append((track['uri'], track['name'], names[0] if names else '', ', '.join(names),
+                         track.get('duration_ms'), track.get('popularity'), now))
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany("""
+                INSERT INTO tracks (uri, name, artist, artists, duration_ms, popularity, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(uri) DO UPDATE SET
+                    name = excluded.name,
+                    artist = excluded.artist,
+                    artists = excluded.artists,
+                    duration_ms = COALESCE(excluded.duration_ms, tracks.duration_ms),
+                    popularity = COALESCE(excluded.popularity, tracks.popularity),
+                    seen_count = tracks.seen_count + 1,
+                    updated_at = excluded.updated_at
+            """, rows)
+        return len(rows)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM tracks').fetchone()[0]
+
+    def _candidates(self, match):
+        with self._lock:
+            return self._conn.execute("""
+                SELECT tracks.* FROM tracks_fts
+                JOIN tracks ON tracks.rowid = tracks_fts.rowid
+                WHERE tracks_fts MATCH ?
+                ORDER BY bm25(tracks_fts), tracks.popularity DESC
+                LIMIT ?
+            """, (match, CANDIDATE_LIMIT)).fetchall()
+
+    def score(self, query, row):
+        name = normalize(row['name'])
+        artists = normalize(row['artists'])
+        return max(
+            SequenceMatcher(None, query, name).ratio(),
+            SequenceMatcher(None, query, f"{name} {artists}").ratio(),
+            SequenceMatcher(None, query, f"{artists} {name}").ratio()
+        )
+
+    def search(self, query, limit=5):
+        """Return up to `limit` (track, confidence) pairs, best first."""
+        query = normalize(query)
+        words = query.split()
+        if not words:
+            return []
+        rows = self._candidates(' AND '.join(f'"{word}"*' for word in words))
+        if not rows:
+            prefixes = {word[:3] for word in words if len(word) >= 3}
+            if not prefixes:
+                return []
+            rows = self._candidates(' OR '.join(f'"{prefix}"*' for prefix in prefixes))
+        scored = sorted(((self.score(query, row), row) for row in rows),
+                        key=lambda pair: (pair[0], pair[1]['popularity'] or 0), reverse=True)
+        return [({
+            "name": row['name'],
+            "artist": row['artist'],
+            "uri": row['uri']
+        }, round(confidence, 3)) for confidence, row in scored[:limit]]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()